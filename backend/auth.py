@@ -1,12 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
 from typing import Optional, Dict
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 import os
 import json
+import time
+import asyncio
+import threading
+
+from backend.metrics import span
 
 # ---- JWT CONFIG ----
 SECRET_KEY = os.getenv("AUTH_SECRET_KEY", "super-secret-dev-key")  # change for prod
@@ -15,6 +23,18 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 day
 
 USERS_PATH = "data/users.json"
 
+# users.json is re-read only when its mtime changes, checked at most this often
+USERS_RELOAD_INTERVAL = float(os.getenv("USERS_RELOAD_INTERVAL", "2.0"))
+
+# Already-verified tokens skip JWT decoding and the user lookup
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = 10000
+
+# pbkdf2 is deliberately slow: bound how many hashes run at once so a burst
+# of logins cannot take every threadpool slot /ask needs
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwd-hash")
+
 pwd_context = CryptContext(
     schemes=["pbkdf2_sha256"],
     deprecated="auto"
@@ -66,8 +86,113 @@ def load_users() -> Dict[str, dict]:
 
 def save_users(users: Dict[str, dict]):
     os.makedirs(os.path.dirname(USERS_PATH), exist_ok=True)
-    with open(USERS_PATH, "w", encoding="utf-8") as f:
+    with open(USERS_PATH + ".tmp", "w", encoding="utf-8") as f:
         json.dump(users, f, indent=2, ensure_ascii=False)
+    os.replace(USERS_PATH + ".tmp", USERS_PATH)
+
+
+def _users_mtime():
+    try:
+        return os.stat(USERS_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class UserStore:
+    """
+    In-memory copy of users.json. The file is reloaded only when its mtime
+    changes (e.g. edited by hand or by another worker), and the mtime is
+    looked at no more than once every USERS_RELOAD_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._mtime = "unloaded"
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def due(self) -> bool:
+        """True when the next lookup will look at users.json again."""
+        return time.monotonic() - self._checked >= USERS_RELOAD_INTERVAL
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < USERS_RELOAD_INTERVAL:
+            return
+        self._checked = now
+
+        mtime = _users_mtime()
+        if mtime != self._mtime:
+            self._users = load_users()
+            self._mtime = mtime
+            # Deleted users or changed roles must not survive in the token cache
+            token_cache.clear()
+
+    def get(self, email: str) -> Optional[dict]:
+        self._refresh()
+        return self._users.get(email)
+
+    def refresh(self):
+        """Reload users.json if it changed (dropping the token cache then)."""
+        self._refresh()
+
+    def add(self, email: str, record_fn) -> dict:
+        """
+        Insert the user built by record_fn(is_first_user) and persist.
+        Raises KeyError if the user already exists.
+        """
+        with self._lock:
+            self._refresh(force=True)
+            if email in self._users:
+                raise KeyError(email)
+
+            users = dict(self._users)
+            users[email] = record_fn(len(users) == 0)
+            save_users(users)
+
+            self._users = users
+            self._mtime = _users_mtime()
+            return users[email]
+
+
+class TokenCache:
+    """token -> UserOut, until min(TTL, token expiry)."""
+
+    def __init__(self, ttl=TOKEN_CACHE_TTL, max_size=TOKEN_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user, expires = entry
+            if time.time() >= expires:
+                del self._entries[token]
+                return None
+            return user
+
+    def put(self, token: str, user, token_exp: Optional[float]):
+        expires = time.time() + self.ttl
+        if token_exp is not None:
+            expires = min(expires, token_exp)
+
+        with self._lock:
+            self._entries[token] = (user, expires)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+user_store = UserStore()
 
 
 def hash_password(password: str) -> str:
@@ -86,12 +211,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def get_user(email: str) -> Optional[dict]:
-    users = load_users()
-    return users.get(email)
+    return user_store.get(email)
+
+
+async def get_user_async(email: str) -> Optional[dict]:
+    """get_user() for async code: the users.json stat / reload runs off the event loop."""
+    return await run_in_threadpool(get_user, email)
+
+
+async def run_hashing(fn, *args):
+    """Run a pbkdf2 hash/verify on the bounded hashing executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, fn, *args)
 
 
 # ---------- DEPENDENCY ----------
-def get_current_user(token: str = Depends(oauth2_scheme)) -> UserOut:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserOut:
+    with span("auth"):
+        return await _current_user(token)
+
+
+async def _current_user(token: str) -> UserOut:
+    # Cache hits never reach user_store.get(): check users.json for deleted
+    # users here, off the loop, at most once per USERS_RELOAD_INTERVAL
+    if user_store.due():
+        await run_in_threadpool(user_store.refresh)
+
+    # Hot path: no disk I/O, no threadpool hop (misses look the user up off the loop)
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -106,39 +256,44 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> UserOut:
     except JWTError:
         raise credentials_exception
 
-    user = get_user(email)
+    user = await get_user_async(email)
     if user is None:
         raise credentials_exception
 
-    return UserOut(email=user["email"], name=user["name"], role=role)
+    current_user = UserOut(email=user["email"], name=user["name"], role=role)
+    token_cache.put(token, current_user, payload.get("exp"))
+    return current_user
 
 
 # ---------- ENDPOINTS ----------
 @router.post("/register", response_model=UserOut)
-def register(user: UserCreate):
-    users = load_users()
-
-    if user.email in users:
+async def register(user: UserCreate):
+    if await get_user_async(user.email) is not None:
         raise HTTPException(status_code=400, detail="User already exists")
 
+    password_hash = await run_hashing(hash_password, user.password)
+
     # First user becomes admin, others are user
-    role = "admin" if len(users) == 0 else "user"
+    def make_record(is_first_user: bool) -> dict:
+        return {
+            "email": user.email,
+            "name": user.name or user.email.split("@")[0],
+            "password_hash": password_hash,
+            "role": "admin" if is_first_user else "user",
+        }
 
-    users[user.email] = {
-        "email": user.email,
-        "name": user.name or user.email.split("@")[0],
-        "password_hash": hash_password(user.password),
-        "role": role,
-    }
-    save_users(users)
+    try:
+        record = await run_in_threadpool(user_store.add, user.email, make_record)
+    except KeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
 
-    return UserOut(email=user.email, name=users[user.email]["name"], role=role)
+    return UserOut(email=user.email, name=record["name"], role=record["role"])
 
 
 @router.post("/login", response_model=Token)
-def login(credentials: UserLogin):
-    user = get_user(credentials.email)
-    if not user or not verify_password(credentials.password, user["password_hash"]):
+async def login(credentials: UserLogin):
+    user = await get_user_async(credentials.email)
+    if not user or not await run_hashing(verify_password, credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     token = create_access_token(
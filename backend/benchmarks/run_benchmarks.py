@@ -0,0 +1,459 @@
+"""
+Reproducible benchmark suite: synthetic corpora of several sizes, then
+for each size and index type
+
+    build       train / add / chunk store / BM25 / publish times
+    memory      index, chunk store and BM25 sizes, RSS of a loaded Retriever
+    index       FAISS search alone: single-query and batched latency, QPS
+    retriever   Retriever.search / search_batch (embedding included), per mode
+    load_test   concurrent POST /ask through the FastAPI app, fake LLM
+
+    python -m backend.benchmarks.run_benchmarks --sizes 10000 100000
+    python -m backend.benchmarks.run_benchmarks --compare old.json new.json
+
+Everything runs in a temporary directory (data/ is never touched) and the
+results go to one JSON file per run, to compare commits.
+"""
+
+import os
+import json
+import time
+import sys
+import shutil
+import asyncio
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULTS_DIR = os.path.join(PROJECT_DIR, "data", "benchmarks")
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_INDEX_TYPES = ("flat", "ivf_flat")
+DEFAULT_MODES = ("vector", "hybrid")
+TOP_K = 3
+N_QUERIES = 200
+BATCH_SIZE = 32
+LOAD_CONCURRENCY = (1, 8, 32)
+LOAD_REQUESTS = 100
+FAKE_LLM_MS = 200
+
+GEN_BATCH = 50_000  # synthetic chunks generated / written per step
+SEED = 0
+
+
+# ---------- SYNTHETIC CORPUS ----------
+SYLLABLES = [c + v for c in "bcdfglmnprstv" for v in "aeiou"][:40]
+
+
+def make_word(i: int) -> str:
+    return SYLLABLES[i % 40] + SYLLABLES[(i // 40) % 40] + SYLLABLES[(i // 1600) % 40]
+
+
+class SyntheticCorpus:
+    """
+    Deterministic chunks: Zipf-distributed pseudo-words (realistic BM25
+    postings) and unit vectors drawn around random cluster centers
+    (realistic IVF lists). Generated batch by batch, never all in memory.
+    """
+
+    def __init__(self, size: int, dim: int, seed: int = SEED, vocab_size: int = 20_000,
+                 n_clusters: int = 256, words_per_chunk: int = 60, chunks_per_source: int = 100):
+        self.size = size
+        self.dim = dim
+        self.seed = seed
+        self.words_per_chunk = words_per_chunk
+        self.chunks_per_source = chunks_per_source
+
+        self.vocab = [make_word(i) for i in range(vocab_size)]
+        weights = 1.0 / np.arange(1, vocab_size + 1) ** 1.1
+        self.word_probs = weights / weights.sum()
+
+        rng = np.random.default_rng(seed)
+        self.centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+
+    def _vectors(self, rng, n: int) -> np.ndarray:
+        clusters = rng.integers(len(self.centers), size=n)
+        vectors = self.centers[clusters] + 0.6 * rng.standard_normal((n, self.dim)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype("float32")
+
+    def batches(self, limit: int = None):
+        """Yield (ids, texts, sources, pages, vectors) of GEN_BATCH chunks."""
+        total = self.size if limit is None else min(limit, self.size)
+        for start in range(0, total, GEN_BATCH):
+            n = min(GEN_BATCH, total - start)
+            rng = np.random.default_rng((self.seed, start))
+
+            words = rng.choice(len(self.vocab), size=(n, self.words_per_chunk), p=self.word_probs)
+            texts = [" ".join(self.vocab[w] for w in row) for row in words]
+            positions = np.arange(start, start + n)
+            sources = [f"doc{p // self.chunks_per_source}.pdf" for p in positions]
+            pages = ((positions % self.chunks_per_source) // 5 + 1).tolist()
+
+            yield positions + 1, texts, sources, pages, self._vectors(rng, n)
+
+    def query_vectors(self, n: int) -> np.ndarray:
+        return self._vectors(np.random.default_rng((self.seed, 7)), n)
+
+    def query_texts(self, n: int, seed: int = 1):
+        """Unique questions of mid-frequency words (no query-cache hits)."""
+        rng = np.random.default_rng((self.seed, seed))
+        return [
+            " ".join(self.vocab[w] for w in rng.integers(50, 5000, size=rng.integers(3, 7))) + f" q{i}"
+            for i in range(n)
+        ]
+
+
+# ---------- MEASUREMENT HELPERS ----------
+def rss_bytes():
+    """Resident memory of this process (Linux), None elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def dir_bytes(directory: str, prefix: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory) if name.startswith(prefix)
+    )
+
+
+def retriever_rss_bytes():
+    """RSS a fresh process adds by loading the Retriever (index in RAM, store mmap'ed)."""
+    code = (
+        "from backend.benchmarks.run_benchmarks import rss_bytes\n"
+        "from backend.vectordb.retriever import Retriever\n"
+        "before = rss_bytes()\n"
+        "retriever = Retriever()\n"
+        "print(rss_bytes() - before if before is not None else '')\n"
+    )
+    env = {**os.environ, "PYTHONPATH": PROJECT_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    last = out.stdout.strip().splitlines()[-1:] if out.returncode == 0 else []
+    return int(last[0]) if last and last[0].lstrip("-").isdigit() else None
+
+
+def latency_stats(latencies_ms, elapsed_s: float, n_queries: int) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "qps": round(n_queries / elapsed_s, 1),
+    }
+
+
+def timed_loop(fn, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return latencies, time.perf_counter() - start
+
+
+# ---------- BUILD ----------
+def build_index(corpus: SyntheticCorpus, index_type: str, with_bm25: bool) -> dict:
+    """Same building blocks as build_faiss, fed with synthetic chunks and vectors."""
+    from backend.vectordb.build_faiss import FAISS_DIR, FAISS_PATH, index_lock, publish_index
+    from backend.vectordb.chunk_store import ChunkStoreWriter
+    from backend.vectordb.bm25 import BM25Writer
+    from backend.vectordb.index_factory import resolve_config, make_index, train_index, apply_search_params
+
+    shutil.rmtree(FAISS_DIR, ignore_errors=True)
+    timings = {"train_s": 0.0, "add_s": 0.0, "chunk_store_s": 0.0, "bm25_s": 0.0}
+
+    config = resolve_config({"type": index_type}, corpus.size, corpus.dim)
+    index = make_index(corpus.dim, config)
+
+    if not index.is_trained:
+        sample = np.concatenate([batch[-1] for batch in corpus.batches(config["train_sample"])])
+        start = time.perf_counter()
+        train_index(index, sample, config)
+        timings["train_s"] = time.perf_counter() - start
+        del sample
+
+    with index_lock():
+        store_writer = ChunkStoreWriter(FAISS_DIR)
+        bm25_writer = BM25Writer(FAISS_DIR) if with_bm25 else None
+
+        for ids, texts, sources, pages, vectors in corpus.batches():
+            start = time.perf_counter()
+            index.add_with_ids(vectors, ids)
+            timings["add_s"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            for cid, text, source, page in zip(ids.tolist(), texts, sources, pages):
+                store_writer.add(cid, source, page, text)
+            timings["chunk_store_s"] += time.perf_counter() - start
+
+            if bm25_writer is not None:
+                start = time.perf_counter()
+                for cid, text in zip(ids.tolist(), texts):
+                    bm25_writer.add(cid, text)
+                timings["bm25_s"] += time.perf_counter() - start
+
+            print(f"📐 {index.ntotal}/{corpus.size} chunks built")
+
+        apply_search_params(index, config)
+        start = time.perf_counter()
+        publish_index(index, store_writer, config=config, bm25_writer=bm25_writer)
+        timings["publish_s"] = time.perf_counter() - start
+
+    timings = {key: round(value, 3) for key, value in timings.items()}
+    timings["total_s"] = round(sum(timings.values()), 3)
+
+    memory = {
+        "index_file_bytes": os.path.getsize(FAISS_PATH),
+        "chunk_store_bytes": dir_bytes(FAISS_DIR, "chunks_"),
+        "bm25_bytes": dir_bytes(FAISS_DIR, "bm25_") if with_bm25 else 0,
+    }
+    return {"config": config, "build": timings, "memory": memory, "index": index}
+
+
+# ---------- SEARCH ----------
+def bench_index_search(index, query_vecs: np.ndarray, k: int = TOP_K) -> dict:
+    """FAISS alone: one query at a time, then the whole set as one matrix."""
+    index.search(query_vecs[:1], k)
+    single, elapsed = timed_loop(lambda q: index.search(q.reshape(1, -1), k), query_vecs)
+
+    start = time.perf_counter()
+    index.search(query_vecs, k)
+    batch_s = time.perf_counter() - start
+
+    return {
+        "single": latency_stats(single, elapsed, len(query_vecs)),
+        "batch": {"n_queries": len(query_vecs), "total_ms": round(batch_s * 1000, 3),
+                  "qps": round(len(query_vecs) / batch_s, 1)},
+    }
+
+
+def bench_retriever(retriever, queries, mode: str, k: int = TOP_K) -> dict:
+    """Retriever.search one by one, then search_batch BATCH_SIZE queries at a time."""
+    retriever.search(queries[0], top_k=k, mode=mode)
+    single, elapsed = timed_loop(lambda q: retriever.search(q, top_k=k, mode=mode), queries)
+
+    batches = [queries[i:i + BATCH_SIZE] for i in range(0, len(queries), BATCH_SIZE)]
+    batch, batch_elapsed = timed_loop(lambda b: retriever.search_batch(b, top_k=k, mode=mode), batches)
+
+    return {
+        "single": latency_stats(single, elapsed, len(queries)),
+        "batch": {**latency_stats(batch, batch_elapsed, len(queries)), "batch_size": BATCH_SIZE},
+    }
+
+
+# ---------- LOAD TEST ----------
+async def load_test(questions, concurrency_levels, n_requests: int) -> dict:
+    """Concurrent POST /ask through the ASGI app (in process, fake LLM)."""
+    import httpx
+    from backend.main import app
+    from backend.vectordb.retriever import get_shared_retriever
+
+    get_shared_retriever().reload_if_changed(force=True)
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        account = {"email": "bench@bench.dev", "password": "bench"}
+        await client.post("/auth/register", json=account)
+        token = (await client.post("/auth/login", json=account)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        offset = 0
+        for concurrency in concurrency_levels:
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+            errors = 0
+
+            async def ask(question):
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/ask", json={"question": question}, headers=headers)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        errors += 1
+
+            batch = questions[offset:offset + n_requests]
+            offset += n_requests
+            start = time.perf_counter()
+            await asyncio.gather(*[ask(q) for q in batch])
+            elapsed = time.perf_counter() - start
+
+            results[str(concurrency)] = {**latency_stats(latencies, elapsed, len(batch)), "errors": errors}
+            print(f"🔥 /ask x{concurrency}: {results[str(concurrency)]}")
+
+    return results
+
+
+# ---------- RUN ----------
+def run_metadata() -> dict:
+    import faiss
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes, index_types, modes, with_bm25=True, with_load_test=True,
+                   n_queries=N_QUERIES, concurrency_levels=LOAD_CONCURRENCY, load_requests=LOAD_REQUESTS) -> dict:
+    from backend.vectordb.embedder import embed_text, get_model
+    from backend.vectordb.retriever import Retriever
+
+    start = time.perf_counter()
+    get_model()
+    model_load_s = time.perf_counter() - start
+    dim = int(np.asarray(embed_text(["probe"])).shape[1])
+
+    results = {
+        "meta": run_metadata(),
+        "params": {
+            "sizes": list(sizes), "index_types": list(index_types), "modes": list(modes),
+            "top_k": TOP_K, "n_queries": n_queries, "batch_size": BATCH_SIZE, "dim": dim,
+            "bm25": with_bm25, "load_concurrency": list(concurrency_levels),
+            "load_requests": load_requests, "fake_llm_ms": float(os.environ["FAKE_LLM_FIRST_TOKEN_MS"]),
+        },
+        "model_load_s": round(model_load_s, 3),
+        "runs": [],
+    }
+
+    for size in sizes:
+        corpus = SyntheticCorpus(size, dim)
+        queries = corpus.query_texts(n_queries)
+        query_vecs = corpus.query_vectors(n_queries)
+
+        for i, index_type in enumerate(index_types):
+            print(f"\n===== {size} chunks, {index_type} =====")
+            built = build_index(corpus, index_type, with_bm25)
+            run = {"size": size, "index_type": built["config"]["type"],
+                   "build": built["build"], "memory": built["memory"]}
+
+            run["index_search"] = bench_index_search(built.pop("index"), query_vecs)
+
+            run["memory"]["retriever_rss_bytes"] = retriever_rss_bytes()
+            retriever = Retriever()
+
+            run["retriever"] = {
+                mode: bench_retriever(retriever, queries, mode)
+                for mode in modes if mode == "vector" or with_bm25
+            }
+            del retriever
+
+            # The load test measures the API, not the index type: once per size
+            if with_load_test and i == 0:
+                questions = corpus.query_texts(load_requests * len(concurrency_levels), seed=2)
+                run["load_test"] = asyncio.run(load_test(questions, concurrency_levels, load_requests))
+
+            print(json.dumps({k: v for k, v in run.items() if k != "load_test"}, indent=2))
+            results["runs"].append(run)
+
+    return results
+
+
+def configure_environment(workdir: str, fake_llm_ms: float):
+    """
+    Must run before any backend import: module constants read these.
+    Relative data/ paths (chat history, users, caches) land in `workdir`.
+    """
+    os.chdir(workdir)
+    os.environ["FAISS_DIR"] = os.path.join(workdir, "data", "faiss")
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_FIRST_TOKEN_MS"] = str(fake_llm_ms)
+    os.environ["FAKE_LLM_TOKEN_MS"] = "0"
+    # Every query pays its embedding and every question its (fake) LLM call
+    os.environ["EMBED_QUERY_CACHE_SIZE"] = "0"
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    # Rebuilds are followed by an explicit reload: no version polling per query
+    os.environ["INDEX_RELOAD_INTERVAL"] = "3600"
+
+
+# ---------- COMPARE ----------
+def flatten(results: dict) -> dict:
+    flat = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, sub in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, sub)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix] = value
+
+    for run in results["runs"]:
+        walk(f"{run['size']}.{run['index_type']}", {k: v for k, v in run.items() if k not in ("size", "index_type")})
+    return flat
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = flatten(json.load(f))
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = flatten(json.load(f))
+
+    print(f"{'metric':<60}{'old':>14}{'new':>14}{'change':>10}")
+    for key in sorted(old.keys() & new.keys()):
+        change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+        print(f"{key:<60}{old[key]:>14}{new[key]:>14}{change:>10}")
+
+
+# ==================================================
+# MAIN
+# ==================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark index build, retrieval and /ask on synthetic corpora")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--index-types", nargs="+", default=list(DEFAULT_INDEX_TYPES))
+    parser.add_argument("--modes", nargs="+", default=list(DEFAULT_MODES))
+    parser.add_argument("--queries", type=int, default=N_QUERIES)
+    parser.add_argument("--no-bm25", action="store_true", help="skip the BM25 index (and hybrid mode)")
+    parser.add_argument("--no-load-test", action="store_true")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=list(LOAD_CONCURRENCY))
+    parser.add_argument("--load-requests", type=int, default=LOAD_REQUESTS, help="requests per concurrency level")
+    parser.add_argument("--llm-ms", type=float, default=FAKE_LLM_MS, help="simulated LLM latency")
+    parser.add_argument("--output", help="result JSON (default: data/benchmarks/bench-<time>-<commit>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        raise SystemExit(0)
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    configure_environment(workdir, args.llm_ms)
+
+    try:
+        results = run_benchmarks(
+            args.sizes, args.index_types, args.modes,
+            with_bm25=not args.no_bm25, with_load_test=not args.no_load_test,
+            n_queries=args.queries, concurrency_levels=args.concurrency, load_requests=args.load_requests,
+        )
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results["meta"]["timestamp"].replace(":", "")
+        output = os.path.join(RESULTS_DIR, f"bench-{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📊 Results → {output}")
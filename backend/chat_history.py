@@ -1,33 +1,129 @@
 import os
 import json
+import sqlite3
+import threading
 from datetime import datetime
-from typing import Dict, List
+from typing import Optional
 
+CHAT_DB_PATH = "data/chats.db"
+# Legacy store: imported once into CHAT_DB_PATH, then renamed
 CHAT_PATH = "data/chats.json"
 
-def load_chats() -> Dict[str, List[dict]]:
+_local = threading.local()
+
+
+def _init_db(conn: sqlite3.Connection):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " user_email TEXT NOT NULL,"
+        " role TEXT NOT NULL,"
+        " content TEXT NOT NULL,"
+        " timestamp TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_email, id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+    conn.commit()
+
+
+def migrate_from_json(conn: sqlite3.Connection) -> int:
+    """
+    One-shot import of data/chats.json (kept as chats.json.migrated).
+    The import is recorded in meta in the same transaction, so a second
+    worker, or a restart after a crash before the rename, never imports twice.
+    """
     if not os.path.exists(CHAT_PATH):
-        return {}
-    with open(CHAT_PATH, "r", encoding="utf-8") as f:
+        return 0
+
+    # IMMEDIATE: a single worker migrates, the others wait then see the flag
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT value FROM meta WHERE name = 'json_migrated'").fetchone()
+        rows = []
+        if done is None and os.path.exists(CHAT_PATH):
+            with open(CHAT_PATH, "r", encoding="utf-8") as f:
+                try:
+                    chats = json.load(f)
+                except json.JSONDecodeError:
+                    chats = {}
+
+            rows = [
+                (email, m["role"], m["content"], m.get("timestamp") or datetime.utcnow().isoformat())
+                for email, messages in chats.items()
+                for m in messages
+            ]
+            conn.executemany(
+                "INSERT INTO messages (user_email, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute(
+                "INSERT INTO meta VALUES ('json_migrated', ?)", (datetime.utcnow().isoformat(),)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Already imported: only the rename is left (another worker may have done it)
+    if os.path.exists(CHAT_PATH):
         try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return {}
+            os.replace(CHAT_PATH, CHAT_PATH + ".migrated")
+        except FileNotFoundError:
+            pass
+
+    if rows:
+        print(f"📦 Migrated {len(rows)} chat messages to {CHAT_DB_PATH}")
+    return len(rows)
+
+
+def get_connection() -> sqlite3.Connection:
+    """One connection per thread; WAL lets readers and the writer overlap."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CHAT_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(CHAT_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _init_db(conn)
+        migrate_from_json(conn)
+        _local.conn = conn
+    return conn
 
-def save_chats(chats: Dict[str, List[dict]]):
-    os.makedirs(os.path.dirname(CHAT_PATH), exist_ok=True)
-    with open(CHAT_PATH, "w", encoding="utf-8") as f:
-        json.dump(chats, f, indent=2, ensure_ascii=False)
 
 def add_message(user_email: str, role: str, content: str):
-    chats = load_chats()
-    chats.setdefault(user_email, []).append({
-        "role": role,
-        "content": content,
-        "timestamp": datetime.utcnow().isoformat()
-    })
-    save_chats(chats)
-
-def get_history(user_email: str) -> List[dict]:
-    chats = load_chats()
-    return chats.get(user_email, [])
+    conn = get_connection()
+    conn.execute(
+        "INSERT INTO messages (user_email, role, content, timestamp) VALUES (?, ?, ?, ?)",
+        (user_email, role, content, datetime.utcnow().isoformat()),
+    )
+    conn.commit()
+
+
+def get_history(user_email: str, cursor: Optional[int] = None, limit: int = 50) -> dict:
+    """
+    Newest messages first, page by page: pass the returned `next_cursor`
+    to get older ones. Messages inside a page are in chronological order.
+    """
+    conn = get_connection()
+
+    if cursor is None:
+        rows = conn.execute(
+            "SELECT id, role, content, timestamp FROM messages"
+            " WHERE user_email = ? ORDER BY id DESC LIMIT ?",
+            (user_email, limit + 1),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT id, role, content, timestamp FROM messages"
+            " WHERE user_email = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (user_email, cursor, limit + 1),
+        ).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "messages": [dict(row) for row in reversed(rows)],
+        "next_cursor": rows[-1]["id"] if has_more else None,
+    }
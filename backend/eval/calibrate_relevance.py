@@ -0,0 +1,120 @@
+# ================= STANDARD LIBS =================
+import os
+import json
+import argparse
+
+# ================= SCIENTIFIC LIBS =================
+import numpy as np
+
+# ================= PROJECT IMPORTS =================
+from backend.vectordb.retriever import Retriever
+
+
+# ==================================================
+# PATH CONFIGURATION
+# ==================================================
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+
+EVAL_FILE = os.path.join(BASE_DIR, "backend", "eval", "rag_eval.json")
+REPORT_PATH = os.path.join(BASE_DIR, "data", "eval", "relevance_calibration.json")
+
+# Share of the answerable (eval set) questions the threshold must let through
+MIN_RECALL = 0.95
+
+# Questions the corpus cannot answer (extend with --negatives)
+OFF_TOPIC_QUESTIONS = [
+    "What is the capital of Australia?",
+    "How do I bake sourdough bread at home?",
+    "Who won the 2018 FIFA World Cup?",
+    "How many moons does Jupiter have?",
+    "Recommend a good science fiction novel.",
+    "What are the symptoms of the common cold?",
+    "Explain the castling rule in chess.",
+    "Translate 'good morning' into Japanese.",
+    "Quelle est la recette de la ratatouille ?",
+    "Comment changer un pneu de voiture ?",
+    "Quel temps fera-t-il demain à Paris ?",
+    "Qui a peint la Joconde ?",
+]
+
+
+# ==================================================
+# CALIBRATION
+# ==================================================
+def best_scores(retriever, questions):
+    """Cosine similarity of the best dense hit of each question (-1: no hit)."""
+    results = retriever.search_batch(questions, top_k=1, mode="vector")
+    return np.array([hits[0]["score"] if hits else -1.0 for hits in results])
+
+
+def pick_threshold(positive, negative, min_recall: float = MIN_RECALL) -> float:
+    """
+    Highest threshold still letting `min_recall` of the answerable questions
+    through, placed halfway to the next lower score as a margin.
+    """
+    ranked = np.sort(positive)[::-1]
+    keep = max(1, int(np.ceil(min_recall * len(ranked))))
+    cut = float(ranked[keep - 1])
+
+    below = np.concatenate([positive, negative])
+    below = below[below < cut]
+    return round((cut + float(below.max())) / 2, 4) if len(below) else round(cut, 4)
+
+
+def calibrate(negatives, min_recall: float = MIN_RECALL):
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    retriever = Retriever()
+    # The eval set is answerable from the corpus by construction
+    positive = best_scores(retriever, [item["question"] for item in data])
+    negative = best_scores(retriever, negatives)
+
+    threshold = pick_threshold(positive, negative, min_recall)
+    return {
+        "threshold": threshold,
+        "min_recall": min_recall,
+        "recall": round(float((positive >= threshold).mean()), 4),
+        "off_topic_blocked": round(float((negative < threshold).mean()), 4),
+        "answerable": {item["question"]: round(float(s), 4) for item, s in zip(data, positive)},
+        "off_topic": {q: round(float(s), 4) for q, s in zip(negatives, negative)},
+    }
+
+
+# ==================================================
+# MAIN
+# ==================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick RELEVANCE_THRESHOLD from the eval set")
+    parser.add_argument("--min-recall", type=float, default=MIN_RECALL,
+                        help="share of answerable questions that must pass")
+    parser.add_argument("--negatives", help="JSON list of extra off-topic questions")
+    args = parser.parse_args()
+
+    negatives = list(OFF_TOPIC_QUESTIONS)
+    if args.negatives:
+        with open(args.negatives, "r", encoding="utf-8") as f:
+            negatives += json.load(f)
+
+    report = calibrate(negatives, args.min_recall)
+
+    print("\n===== BEST HIT SCORES =====")
+    for label, scores in (("answerable", report["answerable"]), ("off-topic", report["off_topic"])):
+        values = np.array(list(scores.values()))
+        print(f"{label:<12} min {values.min():.3f}  median {np.median(values):.3f}  max {values.max():.3f}")
+
+    print("\n===== THRESHOLD =====")
+    print(f"Answerable questions kept: {report['recall']:.0%}")
+    print(f"Off-topic questions blocked: {report['off_topic_blocked']:.0%}")
+    if report["off_topic_blocked"] < 0.5:
+        print("⚠️ Scores barely separate the two sets: check the eval set / corpus before using it")
+
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📊 Report → {REPORT_PATH}")
+    print(f"✅ RELEVANCE_THRESHOLD={report['threshold']}")
@@ -1,18 +1,23 @@
 # ================= STANDARD LIBS =================
 import os
+import csv
 import json
 import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # ================= SCIENTIFIC LIBS =================
 import numpy as np
-import matplotlib.pyplot as plt
-
-# ================= NLP / RAG =================
-from sentence_transformers import SentenceTransformer, util
 
 # ================= PROJECT IMPORTS =================
+# Nothing heavy happens at import: the retriever and the embedding model
+# are loaded by run_evaluation(), and the model is the project's own one.
 from backend.vectordb.retriever import Retriever
+from backend.vectordb.embedder import embed_text
 from backend.llm.llm import generate_answer
+from backend.llm.providers import build_prompt, get_provider
+from backend.llm.context_builder import build_context, load_tokenizer
 
 
 # ==================================================
@@ -25,131 +30,302 @@ BASE_DIR = os.path.dirname(
 )
 
 EVAL_FILE = os.path.join(BASE_DIR, "backend", "eval", "rag_eval.json")
+REPORT_DIR = os.path.join(BASE_DIR, "data", "eval")
+# LLM outputs of previous runs: same prompt, same model -> same answer
+ANSWER_CACHE_PATH = os.path.join(BASE_DIR, "data", "cache", "eval_answers.json")
 
 TOP_K = 3
+LLM_CONCURRENCY = int(os.getenv("EVAL_LLM_CONCURRENCY", "8"))
 
 
 # ==================================================
-# INITIALIZATION
+# HELPER FUNCTIONS
 # ==================================================
-print("🔹 Initializing retriever...")
-retriever = Retriever()
+def is_grounded(answer: str, context: str) -> bool:
+    """Simple groundedness check (string inclusion)."""
+    return answer.strip().lower() in context.lower()
 
-print("🔹 Loading embedding model...")
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
 
+def semantic_similarities(answers, references) -> np.ndarray:
+    """Cosine similarity of each answer with its reference, one encode call."""
+    vectors = np.asarray(embed_text(list(answers) + list(references)), dtype="float32")
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    a, b = vectors[:len(answers)], vectors[len(answers):]
+    return (a * b).sum(axis=1)
 
-# ==================================================
-# HELPER FUNCTIONS
-# ==================================================
-def semantic_similarity(a: str, b: str) -> float:
-    """Compute cosine similarity between two texts."""
-    emb_a = embedder.encode(a, convert_to_tensor=True)
-    emb_b = embedder.encode(b, convert_to_tensor=True)
-    return float(util.cos_sim(emb_a, emb_b))
 
+def percentiles(values_ms) -> dict:
+    return {
+        f"p{p}_ms": round(float(np.percentile(values_ms, p)), 2)
+        for p in (50, 95, 99)
+    }
 
-def is_grounded(answer: str, context: str) -> bool:
-    """Simple groundedness check (string inclusion)."""
-    return answer.strip().lower() in context.lower()
+
+class AnswerCache:
+    """On-disk LLM outputs, keyed by provider + model + full prompt (path=None: memory only)."""
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(question: str, context: str) -> str:
+        provider = get_provider()
+        prompt = build_prompt(question, context)
+        return hashlib.sha256(f"{provider.name}\x00{provider.model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
 
 
 # ==================================================
 # EVALUATION PIPELINE
 # ==================================================
-def run_evaluation():
+def generate_all(questions, contexts, cache: AnswerCache, concurrency: int = LLM_CONCURRENCY):
+    """
+    (answer, ms, cached, error) per question, with at most `concurrency`
+    LLM calls in flight; cached prompts skip the call. A failed call is
+    recorded in its row and does not stop the others.
+    """
+
+    def generate(question, context):
+        key = cache.key(question, context)
+        start = time.perf_counter()
+        if key in cache.entries:
+            return cache.entries[key], (time.perf_counter() - start) * 1000, True, None
+
+        try:
+            answer = generate_answer(question, context)
+        except Exception as e:
+            print(f"❌ LLM failed on {question!r}: {type(e).__name__}: {e}")
+            return "", (time.perf_counter() - start) * 1000, False, f"{type(e).__name__}: {e}"
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        cache.entries[key] = answer
+        return answer, elapsed_ms, False, None
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(generate, questions, contexts))
+
+
+def retrieve_all(retriever, questions, per_query_timing: bool = False):
+    """
+    Top-K hits per question, all queries in one batch. With per_query_timing,
+    one search per query (like /ask) instead, returning each one's time in ms.
+    """
+    if not per_query_timing:
+        return retriever.search_batch(questions, top_k=TOP_K), None
+
+    all_retrieved, retrieval_ms = [], []
+    for question in questions:
+        start = time.perf_counter()
+        all_retrieved.append(retriever.search(question, top_k=TOP_K))
+        retrieval_ms.append((time.perf_counter() - start) * 1000)
+    return all_retrieved, retrieval_ms
+
+
+def similarities_of(answers, references, per_query_timing: bool = False):
+    """
+    Answer / reference similarity (None for empty answers), one encode pass.
+    With per_query_timing, one encode call per pair, returning each one's time in ms.
+    """
+    answered = [i for i, answer in enumerate(answers) if answer.strip()]
+    similarities = [None] * len(answers)
+
+    if not per_query_timing:
+        if answered:
+            batch = semantic_similarities([answers[i] for i in answered], [references[i] for i in answered])
+            for i, sim in zip(answered, batch):
+                similarities[i] = float(sim)
+        return similarities, None
+
+    similarity_ms = []
+    for i, (answer, reference) in enumerate(zip(answers, references)):
+        start = time.perf_counter()
+        if answer.strip():
+            similarities[i] = float(semantic_similarities([answer], [reference])[0])
+        similarity_ms.append((time.perf_counter() - start) * 1000)
+    return similarities, similarity_ms
+
+
+def run_evaluation(use_cache: bool = True, concurrency: int = LLM_CONCURRENCY,
+                   per_query_timing: bool = False):
     if not os.path.exists(EVAL_FILE):
         raise FileNotFoundError(f"Evaluation file not found: {EVAL_FILE}")
 
     with open(EVAL_FILE, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    recall_hits = 0
-    mrr_total = 0.0
-    similarities = []
-    grounded_count = 0
-    latencies = []
-
     print(f"🔹 Running evaluation on {len(data)} queries...\n")
+    questions = [item["question"] for item in data]
+    stage_seconds = {}
+
+    # ---------- RETRIEVAL (all queries in one batch) ----------
+    start = time.perf_counter()
+    retriever = Retriever()
+    load_tokenizer()
+    stage_seconds["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    all_retrieved, retrieval_ms = retrieve_all(retriever, questions, per_query_timing)
+    stage_seconds["retrieval"] = time.perf_counter() - start
+
+    # Same context as /ask: merged, de-duplicated, token-budgeted
+    contexts = [build_context(docs)[0] for docs in all_retrieved]
+
+    # ---------- GENERATION (bounded concurrency, cached) ----------
+    cache = AnswerCache(ANSWER_CACHE_PATH if use_cache else None)
+    start = time.perf_counter()
+    try:
+        generated = generate_all(questions, contexts, cache, concurrency)
+    finally:
+        # Answers of the calls that worked are kept for the next run
+        cache.save()
+    stage_seconds["llm"] = time.perf_counter() - start
+
+    # ---------- ANSWER METRICS (one encode pass) ----------
+    start = time.perf_counter()
+    similarities, similarity_ms = similarities_of(
+        [answer for answer, _, _, _ in generated], [item["answer"] for item in data], per_query_timing
+    )
+    stage_seconds["similarity"] = time.perf_counter() - start
+
+    # ---------- PER QUESTION ----------
+    # Batched stages have no per-question time: only their stage total
+    if not per_query_timing:
+        retrieval_ms = similarity_ms = [None] * len(data)
+
+    rows = []
+    for item, docs, context, (answer, llm_ms, cached, error), sim, r_ms, s_ms in zip(
+        data, all_retrieved, contexts, generated, similarities, retrieval_ms, similarity_ms
+    ):
+        rank = next(
+            (r for r, doc in enumerate(docs, start=1) if item["source_doc"].lower() in doc["source"].lower()),
+            None,
+        )
+        rows.append({
+            "question": item["question"],
+            "source_doc": item["source_doc"],
+            "found_rank": rank,
+            "similarity": None if sim is None else round(sim, 4),
+            "grounded": bool(answer.strip()) and is_grounded(answer, context),
+            "llm_cached": cached,
+            "retrieval_ms": None if r_ms is None else round(r_ms, 2),
+            "llm_ms": round(llm_ms, 2),
+            "similarity_ms": None if s_ms is None else round(s_ms, 2),
+            "total_ms": None if r_ms is None else round(r_ms + llm_ms + s_ms, 2),
+            "answer": answer,
+            "error": error,
+        })
+
+    valid_sims = [r["similarity"] for r in rows if r["similarity"] is not None]
+    metrics = {
+        "Recall@K": sum(r["found_rank"] is not None for r in rows) / len(rows),
+        "MRR": sum(1 / r["found_rank"] for r in rows if r["found_rank"]) / len(rows),
+        "Avg Semantic Similarity": float(np.mean(valid_sims)) if valid_sims else 0.0,
+        "Groundedness Rate": sum(r["grounded"] for r in rows) / len(rows),
+    }
 
-    for item in data:
-        question = item["question"]
-        expected_doc = item["source_doc"]
-        reference_answer = item["answer"]
+    latency = {
+        "stages_total_s": {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()},
+        "llm": {
+            **percentiles([r["llm_ms"] for r in rows]),
+            "cache_hits": sum(r["llm_cached"] for r in rows),
+            "errors": sum(r["error"] is not None for r in rows),
+        },
+    }
+    if per_query_timing:
+        latency["retrieval"] = percentiles([r["retrieval_ms"] for r in rows])
+        latency["similarity"] = percentiles([r["similarity_ms"] for r in rows])
+        latency["end_to_end"] = percentiles([r["total_ms"] for r in rows])
 
-        start_time = time.time()
+    return metrics, latency, rows
 
-        # ---------- RETRIEVAL ----------
-        retrieved_docs = retriever.search(question, top_k=TOP_K)
 
-        context = "\n".join([doc["text"] for doc in retrieved_docs])
+# ==================================================
+# REPORTS
+# ==================================================
+def write_reports(metrics, latency, rows, report_dir: str = REPORT_DIR):
+    os.makedirs(report_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    json_path = os.path.join(report_dir, f"rag_eval_{stamp}.json")
+    csv_path = os.path.join(report_dir, f"rag_eval_{stamp}.csv")
 
-        # ---------- GENERATION ----------
-        answer = generate_answer(question, context)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"metrics": metrics, "latency": latency, "questions": rows}, f, indent=2, ensure_ascii=False)
 
-        end_time = time.time()
-        latencies.append(end_time - start_time)
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
 
-        # ---------- RETRIEVAL METRICS ----------
-        found = False
-        for rank, doc in enumerate(retrieved_docs, start=1):
-            if expected_doc.lower() in doc["source"].lower():
-                recall_hits += 1
-                mrr_total += 1 / rank
-                found = True
-                break
+    return json_path, csv_path
 
-        if not found:
-            mrr_total += 0
 
-        # ---------- ANSWER METRICS ----------
-        if answer.strip():
-            sim = semantic_similarity(answer, reference_answer)
-            similarities.append(sim)
-
-            if is_grounded(answer, context):
-                grounded_count += 1
-
-    results = {
-        "Recall@K": recall_hits / len(data),
-        "MRR": mrr_total / len(data),
-        "Avg Semantic Similarity": float(np.mean(similarities)),
-        "Groundedness Rate": grounded_count / len(data),
-        "Avg Latency (s)": float(np.mean(latencies)),
-    }
+def plot_results(rows, path: str):
+    """Histograms saved to a PNG (headless: never opens a window)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-    return results, similarities, latencies
+    fig, (ax_sim, ax_lat) = plt.subplots(1, 2, figsize=(10, 4))
+    ax_sim.hist([r["similarity"] for r in rows if r["similarity"] is not None], bins=10)
+    ax_sim.set_title("Semantic Similarity Distribution")
+    ax_sim.set_xlabel("Cosine Similarity")
+    ax_sim.set_ylabel("Frequency")
+    ax_sim.grid(True)
 
+    # End-to-end time per question only exists with --per-query-timing
+    timed = [r["total_ms"] for r in rows if r["total_ms"] is not None]
+    ax_lat.hist([ms / 1000 for ms in timed or [r["llm_ms"] for r in rows]], bins=10)
+    ax_lat.set_title("Response Latency Distribution" if timed else "LLM Latency Distribution")
+    ax_lat.set_xlabel("Seconds")
+    ax_lat.set_ylabel("Frequency")
+    ax_lat.grid(True)
 
-# ==================================================
-# VISUALIZATION
-# ==================================================
-def plot_results(similarities, latencies):
-    plt.figure()
-    plt.hist(similarities, bins=10)
-    plt.title("Semantic Similarity Distribution")
-    plt.xlabel("Cosine Similarity")
-    plt.ylabel("Frequency")
-    plt.grid(True)
-    plt.show()
-
-    plt.figure()
-    plt.hist(latencies, bins=10)
-    plt.title("Response Latency Distribution")
-    plt.xlabel("Seconds")
-    plt.ylabel("Frequency")
-    plt.grid(True)
-    plt.show()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
 
 
 # ==================================================
 # MAIN
 # ==================================================
 if __name__ == "__main__":
-    metrics, sims, lats = run_evaluation()
+    parser = argparse.ArgumentParser(description="End-to-end RAG evaluation on rag_eval.json")
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--no-cache", action="store_true", help="call the LLM even for known prompts")
+    parser.add_argument("--plot", action="store_true", help="also save histograms as a PNG")
+    parser.add_argument("--per-query-timing", action="store_true",
+                        help="search and score one query at a time to report per-query percentiles (slower)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    metrics, latency, rows = run_evaluation(
+        use_cache=not args.no_cache, concurrency=args.concurrency, per_query_timing=args.per_query_timing
+    )
 
     print("\n===== RAG EVALUATION RESULTS =====")
     for metric, value in metrics.items():
         print(f"{metric}: {value:.3f}")
 
-    plot_results(sims, lats)
+    print("\n===== LATENCY =====")
+    print(json.dumps(latency, indent=2))
+
+    json_path, csv_path = write_reports(metrics, latency, rows)
+    print(f"\n📊 Report → {json_path}\n📊 Report → {csv_path}")
+
+    if args.plot:
+        plot_path = json_path[:-len(".json")] + ".png"
+        plot_results(rows, plot_path)
+        print(f"📊 Plots → {plot_path}")
+
+    print(f"⏱️ Evaluation finished in {time.perf_counter() - start:.2f}s")
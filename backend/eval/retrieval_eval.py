@@ -0,0 +1,90 @@
+# ================= STANDARD LIBS =================
+import os
+import json
+import time
+
+# ================= SCIENTIFIC LIBS =================
+import numpy as np
+
+# ================= PROJECT IMPORTS =================
+from backend.vectordb.retriever import Retriever, RETRIEVAL_MODES
+from backend.vectordb.embedder import query_embedder
+
+
+# ==================================================
+# PATH CONFIGURATION
+# ==================================================
+BASE_DIR = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))
+    )
+)
+
+EVAL_FILE = os.path.join(BASE_DIR, "backend", "eval", "rag_eval.json")
+
+TOP_K = 3
+REPEATS = 5  # latency is measured over several passes
+
+
+# ==================================================
+# EVALUATION
+# ==================================================
+def evaluate_mode(retriever, data, mode):
+    """Recall@K / MRR on the eval set and search latency (no LLM involved)."""
+    recall_hits = 0
+    mrr_total = 0.0
+    latencies = []
+
+    # Warm-up: the first query pays model / page-cache loading
+    retriever.search(data[0]["question"], top_k=TOP_K, mode=mode)
+
+    for repeat in range(REPEATS):
+        for item in data:
+            start = time.perf_counter()
+            retrieved = retriever.search(item["question"], top_k=TOP_K, mode=mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            if repeat:
+                continue
+
+            for rank, doc in enumerate(retrieved, start=1):
+                if item["source_doc"].lower() in doc["source"].lower():
+                    recall_hits += 1
+                    mrr_total += 1 / rank
+                    break
+
+    return {
+        "Recall@K": recall_hits / len(data),
+        "MRR": mrr_total / len(data),
+        "p50 latency (ms)": float(np.percentile(latencies, 50)),
+        "p95 latency (ms)": float(np.percentile(latencies, 95)),
+    }
+
+
+def run_evaluation():
+    if not os.path.exists(EVAL_FILE):
+        raise FileNotFoundError(f"Evaluation file not found: {EVAL_FILE}")
+
+    with open(EVAL_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    retriever = Retriever()
+    if retriever.bm25 is None:
+        raise RuntimeError("No BM25 index found: rebuild with build_faiss first")
+
+    # The query-embedding LRU cache would hide the embedding cost
+    query_embedder.cache_size = 0
+
+    return {mode: evaluate_mode(retriever, data, mode) for mode in RETRIEVAL_MODES}
+
+
+# ==================================================
+# MAIN
+# ==================================================
+if __name__ == "__main__":
+    results = run_evaluation()
+
+    print(f"\n===== RETRIEVAL MODES (top {TOP_K}) =====")
+    print(f"{'mode':<10}" + "".join(f"{metric:>20}" for metric in next(iter(results.values()))))
+    for mode, metrics in results.items():
+        print(f"{mode:<10}" + "".join(f"{value:>20.3f}" for value in metrics.values()))
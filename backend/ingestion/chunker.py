@@ -1,37 +1,258 @@
 import os
+import json
+import fcntl
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 
 TEXT_INPUT_PATH = "data/text"
 CHUNKS_OUTPUT_PATH = "data/chunks"
+# Hash + settings each text file was chunked with (not a _chunks.txt file)
+CHUNK_MANIFEST_PATH = os.path.join(CHUNKS_OUTPUT_PATH, ".chunk_manifest.json")
+CHUNK_MANIFEST_LOCK = CHUNK_MANIFEST_PATH + ".lock"
 
-os.makedirs(CHUNKS_OUTPUT_PATH, exist_ok=True)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", str(os.cpu_count() or 1)))
 
-def chunk_documents():
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50
+# Text is split window by window; windows end on a paragraph break and the
+# (possibly cut) chunks ending a window are split again with the next one
+READ_BLOCK_SIZE = 1 << 16
+CHUNK_SEPARATOR = "\n---\n"
+
+
+def make_splitter(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
     )
 
-    for filename in os.listdir(TEXT_INPUT_PATH):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(TEXT_INPUT_PATH, filename)
 
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
+def source_name_of(filename: str) -> str:
+    """data/text/report.pdf.txt -> report.pdf"""
+    return filename[:-len(".txt")]
+
+
+def chunks_path(filename: str) -> str:
+    # Suffix only: "notes.txt.txt" must become "notes.txt_chunks.txt"
+    return os.path.join(CHUNKS_OUTPUT_PATH, source_name_of(filename) + "_chunks.txt")
+
+
+def remove_misnamed_chunk_files():
+    """
+    Older builds named chunk files with filename.replace(".txt", "_chunks.txt"):
+    notes.txt.txt became notes_chunks.txt_chunks.txt, a bogus source of its own.
+    """
+    if not os.path.isdir(CHUNKS_OUTPUT_PATH):
+        return
+    for name in os.listdir(CHUNKS_OUTPUT_PATH):
+        if name.count("_chunks.txt") > 1:
+            os.remove(os.path.join(CHUNKS_OUTPUT_PATH, name))
+            print(f"🧹 Removed misnamed chunk file: {name}")
+
+
+def iter_text_windows(file_path: str, block_size: int = READ_BLOCK_SIZE):
+    """
+    Read a text file block by block and yield windows cut on the last
+    paragraph break (or line break) of each block, so a large file is
+    never loaded at once.
+    """
+    carry = ""
+    with open(file_path, "r", encoding="utf-8") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            text = carry + block
+            cut = text.rfind("\n\n")
+            if cut == -1:
+                cut = text.rfind("\n")
+            if cut == -1:
+                carry = text
+                continue
+            yield text[:cut + 1]
+            carry = text[cut + 1:]
+    if carry:
+        yield carry
+
+
+def iter_chunk_file(path: str):
+    """Yield the raw pieces of a _chunks.txt file, one at a time."""
+    buffer = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line == CHUNK_SEPARATOR[1:]:
+                yield "".join(buffer)[:-1]
+                buffer = []
+            else:
+                buffer.append(line)
+    if buffer:
+        yield "".join(buffer)
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def split_windows(windows, splitter, chunk_overlap: int = CHUNK_OVERLAP):
+    """
+    Chunks of consecutive text windows. The chunks a window ends in may be
+    cut by its end: their text is carried into the next window and split
+    again there, so chunks and their CHUNK_OVERLAP run across window
+    boundaries as if the file had been split at once.
+    """
+    carry = ""
+    for window in windows:
+        text = carry + window
+        chunks = splitter.split_text(text)
+        if not chunks:
+            carry = text
+            continue
+        # Chunks reaching the window's end may be cut by it (several can,
+        # with overlap): carry the text from the first of them on
+        starts, position = [], 0
+        for chunk in chunks:
+            start = text.find(chunk, position)
+            starts.append(start)
+            if start != -1:
+                # The next chunk overlaps this one by chunk_overlap at most
+                position = start + max(1, len(chunk) - chunk_overlap)
+        end = len(text.rstrip())
+        cut = next((i for i, (chunk, start) in enumerate(zip(chunks, starts))
+                    if start != -1 and start + len(chunk) >= end), len(chunks) - 1)
+        yield from chunks[:cut]
+        carry = text[starts[cut]:] if starts[cut] != -1 else chunks[cut]
+    if carry.strip():
+        yield from splitter.split_text(carry)
+
+
+def _write_chunks(filename: str, chunk_size: int, chunk_overlap: int) -> str:
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    file_path = os.path.join(TEXT_INPUT_PATH, filename)
+    output_file = chunks_path(filename)
+
+    os.makedirs(CHUNKS_OUTPUT_PATH, exist_ok=True)
+    with open(output_file + ".tmp", "w", encoding="utf-8") as f:
+        for chunk in split_windows(iter_text_windows(file_path), splitter, chunk_overlap):
+            f.write(chunk + CHUNK_SEPARATOR)
+    os.replace(output_file + ".tmp", output_file)
+
+    print(f"Chunked: {filename}")
+    return output_file
 
-            chunks = splitter.split_text(text)
 
-            output_file = os.path.join(
-                CHUNKS_OUTPUT_PATH,
-                filename.replace(".txt", "_chunks.txt")
-            )
+def chunk_file(filename: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> str:
+    """
+    Chunk ONE text file of data/text into data/chunks, writing chunks as
+    they are produced, and record it in the chunk manifest (the next
+    change-aware run skips it). Returns the path of the written chunks file.
+    """
+    entry = {"hash": file_hash(os.path.join(TEXT_INPUT_PATH, filename)),
+             "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    output_file = _write_chunks(filename, chunk_size, chunk_overlap)
+    update_chunk_manifest({filename: entry})
+    return output_file
 
-            with open(output_file, "w", encoding="utf-8") as f:
-                for chunk in chunks:
-                    f.write(chunk + "\n---\n")
 
-            print(f"Chunked: {filename}")
+# ---------- MANIFEST ----------
+def load_chunk_manifest() -> dict:
+    if not os.path.exists(CHUNK_MANIFEST_PATH):
+        return {}
+    with open(CHUNK_MANIFEST_PATH, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+
+def save_chunk_manifest(manifest: dict):
+    os.makedirs(CHUNKS_OUTPUT_PATH, exist_ok=True)
+    with open(CHUNK_MANIFEST_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(CHUNK_MANIFEST_PATH + ".tmp", CHUNK_MANIFEST_PATH)
+
+
+def update_chunk_manifest(entries: dict):
+    """
+    Merge `entries` into the manifest under a file lock: uploads and batch
+    runs record files concurrently. Entries of deleted text files are dropped.
+    """
+    os.makedirs(CHUNKS_OUTPUT_PATH, exist_ok=True)
+    with open(CHUNK_MANIFEST_LOCK, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            manifest = {**load_chunk_manifest(), **entries}
+            save_chunk_manifest({
+                name: entry for name, entry in manifest.items()
+                if os.path.exists(os.path.join(TEXT_INPUT_PATH, name))
+            })
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _chunk_if_changed(filename: str, settings: dict, previous) -> dict:
+    """Process-pool task: chunk a text file unless hash and settings match."""
+    entry = {"hash": file_hash(os.path.join(TEXT_INPUT_PATH, filename)), **settings}
+
+    if entry == previous and os.path.exists(chunks_path(filename)):
+        return {"file": filename, "entry": entry, "skipped": True}
+
+    # The batch run records its files itself, once, at the end
+    _write_chunks(filename, settings["chunk_size"], settings["chunk_overlap"])
+    return {"file": filename, "entry": entry, "skipped": False}
+
+
+# ---------- BATCH ----------
+def iter_chunks(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                workers: int = CHUNK_WORKERS, force: bool = False):
+    """
+    Chunk new or changed files of data/text across a process pool and
+    yield (source_name, position, chunk) as soon as each file is done,
+    so embedding can start before the whole corpus is chunked.
+    Unchanged files are skipped (and yield nothing) unless `force`.
+    """
+    remove_misnamed_chunk_files()
+    settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    previous = {} if force else load_chunk_manifest()
+    manifest = {}
+    filenames = sorted(f for f in os.listdir(TEXT_INPUT_PATH) if f.endswith(".txt"))
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(_chunk_if_changed, f, settings, previous.get(f)) for f in filenames]
+
+            for future in as_completed(futures):
+                result = future.result()
+                manifest[result["file"]] = result["entry"]
+                if result["skipped"]:
+                    continue
+
+                source_name = source_name_of(result["file"])
+                for position, chunk in enumerate(iter_chunk_file(chunks_path(result["file"]))):
+                    yield source_name, position, chunk
+    finally:
+        update_chunk_manifest(manifest)
+
+
+def chunk_documents(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                    workers: int = CHUNK_WORKERS, force: bool = False) -> int:
+    """Chunk everything that changed; returns the number of chunks written."""
+    count = 0
+    for _ in iter_chunks(chunk_size, chunk_overlap, workers, force):
+        count += 1
+    print(f"✅ {count} chunks written")
+    return count
 
 if __name__ == "__main__":
-    chunk_documents()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chunk data/text into data/chunks")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--workers", type=int, default=CHUNK_WORKERS)
+    parser.add_argument("--force", action="store_true", help="re-chunk unchanged files too")
+    args = parser.parse_args()
+
+    chunk_documents(args.chunk_size, args.chunk_overlap, args.workers, args.force)
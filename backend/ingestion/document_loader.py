@@ -1,100 +1,214 @@
 import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pypdf import PdfReader
 from docx import Document
 from pptx import Presentation
 
 RAW_DATA_PATH = "data/raw"
 TEXT_OUTPUT_PATH = "data/text"
+# Raw file hashes of the last extraction (not a .txt, so the chunker ignores it)
+EXTRACT_MANIFEST_PATH = os.path.join(TEXT_OUTPUT_PATH, ".extract_manifest.json")
 
-os.makedirs(TEXT_OUTPUT_PATH, exist_ok=True)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
 
 
-def extract_from_pdf(file_path: str) -> str:
+# ---------- EXTRACTORS (yield one page / slide / block at a time) ----------
+def iter_pdf_pages(file_path: str):
     reader = PdfReader(file_path)
-    text = ""
     for page in reader.pages:
         page_text = page.extract_text()
         if page_text:
-            text += page_text + "\n"
-    return text
+            yield page_text + "\n"
 
 
-def extract_from_docx(file_path: str) -> str:
+def iter_docx_paragraphs(file_path: str):
     doc = Document(file_path)
-    return "\n".join([p.text for p in doc.paragraphs])
+    for i, p in enumerate(doc.paragraphs):
+        yield p.text if i == 0 else "\n" + p.text
 
 
-def extract_from_pptx(file_path: str) -> str:
+def iter_pptx_slides(file_path: str):
     ppt = Presentation(file_path)
-    text = ""
     for slide in ppt.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text:
-                text += shape.text + "\n"
-    return text
+        parts = [shape.text + "\n" for shape in slide.shapes if hasattr(shape, "text") and shape.text]
+        if parts:
+            yield "".join(parts)
 
 
-def extract_from_txt(file_path: str) -> str:
+def iter_txt_blocks(file_path: str, block_size: int = 1 << 20):
     with open(file_path, "r", encoding="utf-8") as f:
-        return f.read()
+        for block in iter(lambda: f.read(block_size), ""):
+            yield block
 
 
-def extract_single_file(file_path: str, original_name: str) -> str:
-    """
-    NEW (upload support): Extract ONE file and write its text into data/text
-    WITHOUT changing the existing batch ingestion behavior.
-    """
-    name = original_name.lower()
+EXTRACTORS = {
+    ".pdf": iter_pdf_pages,
+    ".docx": iter_docx_paragraphs,
+    ".pptx": iter_pptx_slides,
+    ".txt": iter_txt_blocks,
+}
 
-    if name.endswith(".pdf"):
-        text = extract_from_pdf(file_path)
 
-    elif name.endswith(".docx"):
-        text = extract_from_docx(file_path)
+def extract_from_pdf(file_path: str) -> str:
+    return "".join(iter_pdf_pages(file_path))
+
+
+def extract_from_docx(file_path: str) -> str:
+    return "".join(iter_docx_paragraphs(file_path))
+
+
+def extract_from_pptx(file_path: str) -> str:
+    return "".join(iter_pptx_slides(file_path))
+
+
+def extract_from_txt(file_path: str) -> str:
+    return "".join(iter_txt_blocks(file_path))
 
-    elif name.endswith(".pptx"):
-        text = extract_from_pptx(file_path)
 
-    elif name.endswith(".txt"):
-        text = extract_from_txt(file_path)
+def _extractor_for(name: str):
+    ext = os.path.splitext(name.lower())[1]
+    return EXTRACTORS.get(ext)
 
-    else:
+
+def raw_file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_to_file(file_path: str, original_name: str) -> dict:
+    """
+    Stream the pages of ONE file into data/text/<name>.txt as they are
+    extracted: the document is never held as one big string. The output
+    appears atomically once extraction is complete.
+    """
+    extractor = _extractor_for(original_name)
+    if extractor is None:
         raise ValueError(f"Unsupported file type: {original_name}")
 
+    start = time.perf_counter()
     output_file = os.path.join(TEXT_OUTPUT_PATH, original_name + ".txt")
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(text)
+    os.makedirs(TEXT_OUTPUT_PATH, exist_ok=True)
+    parts = 0
+    chars = 0
+
+    with open(output_file + ".tmp", "w", encoding="utf-8") as f:
+        for part in extractor(file_path):
+            f.write(part)
+            parts += 1
+            chars += len(part)
+    os.replace(output_file + ".tmp", output_file)
+
+    return {
+        "file": original_name,
+        "output": output_file,
+        "parts": parts,
+        "chars": chars,
+        "bytes": os.path.getsize(file_path),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def extract_single_file(file_path: str, original_name: str) -> str:
+    """
+    NEW (upload support): Extract ONE file and write its text into data/text
+    WITHOUT changing the existing batch ingestion behavior.
+    """
+    return extract_to_file(file_path, original_name)["output"]
 
-    return output_file
 
+# ---------- BATCH EXTRACTION ----------
+def load_extract_manifest() -> dict:
+    if not os.path.exists(EXTRACT_MANIFEST_PATH):
+        return {}
+    with open(EXTRACT_MANIFEST_PATH, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {}
 
-def extract_documents():
-    for filename in os.listdir(RAW_DATA_PATH):
-        file_path = os.path.join(RAW_DATA_PATH, filename)
 
-        if filename.endswith(".pdf"):
-            text = extract_from_pdf(file_path)
+def save_extract_manifest(manifest: dict):
+    os.makedirs(TEXT_OUTPUT_PATH, exist_ok=True)
+    with open(EXTRACT_MANIFEST_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(EXTRACT_MANIFEST_PATH + ".tmp", EXTRACT_MANIFEST_PATH)
 
-        elif filename.endswith(".docx"):
-            text = extract_from_docx(file_path)
 
-        elif filename.endswith(".pptx"):
-            text = extract_from_pptx(file_path)
+def _extract_if_changed(file_path: str, filename: str, previous_hash) -> dict:
+    """Process-pool task: hash the raw file, extract it only if it changed."""
+    content_hash = raw_file_hash(file_path)
+    output_file = os.path.join(TEXT_OUTPUT_PATH, filename + ".txt")
 
-        elif filename.endswith(".txt"):
-            text = extract_from_txt(file_path)
+    if content_hash == previous_hash and os.path.exists(output_file):
+        return {"file": filename, "hash": content_hash, "skipped": True}
 
-        else:
-            print(f"Skipped unsupported file: {filename}")
-            continue
+    stats = extract_to_file(file_path, filename)
+    stats["hash"] = content_hash
+    stats["skipped"] = False
+    return stats
 
-        output_file = os.path.join(TEXT_OUTPUT_PATH, filename + ".txt")
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(text)
+def extract_documents(workers: int = EXTRACT_WORKERS):
+    manifest = load_extract_manifest()
+    start = time.perf_counter()
 
-        print(f"Extracted: {filename}")
+    tasks = []
+    for filename in sorted(os.listdir(RAW_DATA_PATH)):
+        if _extractor_for(filename) is None:
+            print(f"Skipped unsupported file: {filename}")
+            continue
+        tasks.append((os.path.join(RAW_DATA_PATH, filename), filename, manifest.get(filename)))
+
+    extracted = []
+    skipped = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_extract_if_changed, *task): task[1] for task in tasks}
+
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"❌ Failed: {filename} ({type(e).__name__}: {e})")
+                failed += 1
+                continue
+
+            manifest[filename] = stats["hash"]
+            if stats["skipped"]:
+                print(f"Unchanged: {filename}")
+                skipped += 1
+                continue
+
+            extracted.append(stats)
+            mb = stats["bytes"] / 1e6
+            print(
+                f"Extracted: {filename} — {stats['parts']} parts, {mb:.1f} MB "
+                f"in {stats['seconds']:.2f}s ({mb / max(stats['seconds'], 1e-6):.1f} MB/s)"
+            )
+
+    save_extract_manifest(manifest)
+
+    elapsed = time.perf_counter() - start
+    total_mb = sum(s["bytes"] for s in extracted) / 1e6
+    print(
+        f"\n{len(extracted)} extracted, {skipped} unchanged, {failed} failed "
+        f"in {elapsed:.2f}s ({total_mb / max(elapsed, 1e-6):.1f} MB/s, {workers} workers)"
+    )
+    return extracted
 
 
 if __name__ == "__main__":
-    extract_documents()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract data/raw into data/text")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS)
+    args = parser.parse_args()
+
+    extract_documents(workers=args.workers)
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from backend.ingestion.document_loader import extract_single_file
+from backend.vectordb.build_faiss import build_faiss, index_document
+from backend.metrics import Counter, record_stage
+
+# Bounded pool: at most INGESTION_WORKERS uploads are processed at once,
+# the others wait in the executor queue.
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+MAX_PENDING_JOBS = int(os.getenv("INGESTION_MAX_PENDING", "50"))
+MAX_KEPT_JOBS = 200
+
+# Job status is shared by every worker process: any of them answers
+# GET /upload/jobs/{id}, whichever accepted the upload.
+JOBS_DB_PATH = "data/jobs.db"
+LOCK_DIR = "data/locks"
+
+# upload: one document added / replaced; rebuild: the whole corpus re-chunked and re-embedded
+STAGES = {
+    "upload": ["queued", "extracting", "chunking", "embedding", "indexing", "done"],
+    "rebuild": ["queued", "rebuilding", "done"],
+}
+
+ingestion_jobs = Counter("rag_ingestion_jobs_total", "Finished ingestion jobs, by status")
+
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingest")
+_local = threading.local()
+_jobs_lock = threading.Lock()
+# Jobs of this process waiting for or holding an executor thread
+_pending = 0
+
+# Two jobs for the same file run one after the other (they share data/raw,
+# data/text and data/chunks files); jobs for different files run in parallel.
+_file_locks = {}
+
+
+# ---------- JOB STORE ----------
+def _init_db(conn: sqlite3.Connection):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id TEXT PRIMARY KEY,"
+        " filename TEXT NOT NULL,"
+        " status TEXT NOT NULL,"
+        " stage TEXT NOT NULL,"
+        " timings TEXT NOT NULL,"
+        " error TEXT,"
+        " created_at REAL NOT NULL,"
+        " finished_at REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at)")
+    # Databases created before rebuild jobs only hold uploads
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "kind" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'upload'")
+    conn.commit()
+
+
+def get_connection() -> sqlite3.Connection:
+    """One connection per thread, as in chat_history."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _init_db(conn)
+        _local.conn = conn
+    return conn
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class IngestionJob:
+    def __init__(self, file_path: Optional[str], filename: str, upload_path: Optional[str] = None,
+                 kind: str = "upload"):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.file_path = file_path
+        self.filename = filename
+        # Where the upload was written; moved to file_path once the job holds the file lock
+        self.upload_path = upload_path
+        self.status = "queued"  # queued | running | success | unchanged | failed
+        self.stage = "queued"
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.timings = {}
+        self._stage_started = time.perf_counter()
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "IngestionJob":
+        job = cls.__new__(cls)
+        job.id = row["id"]
+        job.kind = row["kind"]
+        job.file_path = job.upload_path = None
+        job.filename = row["filename"]
+        job.status = row["status"]
+        job.stage = row["stage"]
+        job.error = row["error"]
+        job.created_at = row["created_at"]
+        job.finished_at = row["finished_at"]
+        job.timings = json.loads(row["timings"])
+        return job
+
+    def save(self):
+        conn = get_connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, kind, filename, status, stage, timings, error, created_at, finished_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.id, self.kind, self.filename, self.status, self.stage, json.dumps(self.timings),
+             self.error, self.created_at, self.finished_at),
+        )
+        conn.commit()
+
+    def set_stage(self, stage: str):
+        now = time.perf_counter()
+        self.timings[self.stage] = round(now - self._stage_started, 3)
+        record_stage(f"ingest_{self.stage}", now - self._stage_started)
+        self.stage = stage
+        self._stage_started = now
+        self.save()
+
+    @property
+    def progress(self) -> float:
+        stages = STAGES[self.kind]
+        return round(stages.index(self.stage) / (len(stages) - 1), 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "filename": self.filename or None,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "timings": self.timings,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+@contextmanager
+def _file_lock(filename: str):
+    """Per-file lock, between ingestion threads and between worker processes."""
+    with _jobs_lock:
+        thread_lock = _file_locks.setdefault(filename, threading.Lock())
+
+    with thread_lock:
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        lock_name = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:16] + ".lock"
+        with open(os.path.join(LOCK_DIR, lock_name), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _ingest(job: IngestionJob) -> bool:
+    if job.upload_path:
+        os.replace(job.upload_path, job.file_path)
+
+    job.set_stage("extracting")
+    text_file = extract_single_file(job.file_path, job.filename)
+
+    return index_document(os.path.basename(text_file), on_stage=job.set_stage)
+
+
+def _rebuild(job: IngestionJob) -> bool:
+    job.set_stage("rebuilding")
+    # Chunking and embedding overlap: each file is embedded as soon as it is chunked
+    build_faiss(chunking={"force": True})
+    return True
+
+
+def _run(job: IngestionJob):
+    global _pending
+    # Rebuilds are serialized with uploads by the index lock
+    with _file_lock(job.filename) if job.kind == "upload" else nullcontext():
+        job.status = "running"
+        try:
+            changed = _ingest(job) if job.kind == "upload" else _rebuild(job)
+
+            job.set_stage("done")
+            job.status = "success" if changed else "unchanged"
+        except Exception as e:
+            job.timings[job.stage] = round(time.perf_counter() - job._stage_started, 3)
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            print(f"❌ Ingestion job {job.id} failed at {job.stage}: {job.error}")
+        finally:
+            job.finished_at = time.time()
+            job.save()
+            ingestion_jobs.inc(status=job.status)
+            with _jobs_lock:
+                _pending -= 1
+
+
+def submit_job(file_path: str, filename: str, upload_path: Optional[str] = None) -> IngestionJob:
+    return _submit(IngestionJob(file_path, filename, upload_path))
+
+
+def submit_rebuild() -> IngestionJob:
+    """Queue a full re-chunk / re-embed of data/text."""
+    return _submit(IngestionJob(None, "", kind="rebuild"))
+
+
+def _submit(job: IngestionJob) -> IngestionJob:
+    global _pending
+    with _jobs_lock:
+        if _pending >= MAX_PENDING_JOBS:
+            raise QueueFullError("Too many ingestion jobs pending")
+        _pending += 1
+
+    try:
+        job.save()
+
+        # Forget the oldest finished jobs
+        conn = get_connection()
+        conn.execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND id NOT IN"
+            " (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+            (MAX_KEPT_JOBS,),
+        )
+        conn.commit()
+
+        _executor.submit(_run, job)
+    except Exception:
+        with _jobs_lock:
+            _pending -= 1
+        raise
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestionJob]:
+    row = get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return IngestionJob.from_row(row) if row else None
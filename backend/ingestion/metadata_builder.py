@@ -1,12 +1,11 @@
 import os
 import json
+from backend.ingestion.chunker import chunks_path
 
 TEXT_INPUT_PATH = "data/text"
 CHUNKS_INPUT_PATH = "data/chunks"
 METADATA_OUTPUT_PATH = "data/metadata"
 
-os.makedirs(METADATA_OUTPUT_PATH, exist_ok=True)
-
 def build_metadata():
     metadata_list = []
 
@@ -17,10 +16,7 @@ def build_metadata():
             text_file = os.path.join(TEXT_INPUT_PATH, filename)
 
             # CHUNKED version path
-            chunk_file = os.path.join(
-                CHUNKS_INPUT_PATH,
-                filename.replace(".txt", "_chunks.txt")
-            )
+            chunk_file = chunks_path(filename)
 
             if not os.path.exists(chunk_file):
                 print(f"No chunks found for {filename}")
@@ -42,6 +38,7 @@ def build_metadata():
                 metadata_list.append(entry)
 
     # Save metadata JSON
+    os.makedirs(METADATA_OUTPUT_PATH, exist_ok=True)
     output_file = os.path.join(METADATA_OUTPUT_PATH, "metadata.json")
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(metadata_list, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,149 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Optional: reuse an answer for a near-identical phrasing (same context)
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+def context_fingerprint(results) -> str:
+    """Hash of the retrieved chunk ids, in rank order."""
+    ids = ",".join(str(r["id"]) for r in results)
+    return hashlib.sha1(ids.encode("utf-8")).hexdigest()
+
+
+class CachedAnswer:
+    def __init__(self, answer: str, latency: float, query_vec=None):
+        self.answer = answer
+        self.latency = latency
+        self.query_vec = query_vec
+        self.created = time.monotonic()
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of LLM answers. The LLM runs at temperature 0, so
+    the same question over the same context gives the same answer.
+
+    Key = (normalized question, context fingerprint). The whole cache is
+    dropped when the index version changes.
+    """
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 semantic=ANSWER_CACHE_SEMANTIC, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity = similarity
+
+        self._entries = OrderedDict()
+        self._by_context = {}  # fingerprint -> keys, for the semantic lookup
+        self._version = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_context.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[key[1]]
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+            self._version = version
+
+    def _fresh(self, entry: CachedAnswer) -> bool:
+        return time.monotonic() - entry.created < self.ttl
+
+    def _semantic_lookup(self, fingerprint, query_vec):
+        best, best_sim = None, self.similarity
+        for key in self._by_context.get(fingerprint, ()):
+            entry = self._entries[key]
+            if entry.query_vec is None or not self._fresh(entry):
+                continue
+            sim = float(np.dot(entry.query_vec, query_vec) /
+                        (np.linalg.norm(entry.query_vec) * np.linalg.norm(query_vec) + 1e-12))
+            if sim >= best_sim:
+                best, best_sim = key, sim
+        return best
+
+    def get(self, question, fingerprint, version, query_vec=None) -> Optional[str]:
+        key = (normalize_question(question), fingerprint)
+
+        with self._lock:
+            self._check_version(version)
+
+            entry = self._entries.get(key)
+            if entry is not None and not self._fresh(entry):
+                self._remove(key)
+                entry = None
+
+            if entry is None and self.semantic and query_vec is not None:
+                similar = self._semantic_lookup(fingerprint, query_vec)
+                if similar is not None:
+                    key, entry = similar, self._entries[similar]
+                    self.semantic_hits += 1
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry.latency
+            return entry.answer
+
+    def put(self, question, fingerprint, version, answer, latency, query_vec=None):
+        key = (normalize_question(question), fingerprint)
+
+        with self._lock:
+            self._check_version(version)
+
+            self._remove(key)
+            self._entries[key] = CachedAnswer(answer, latency, query_vec if self.semantic else None)
+            self._by_context.setdefault(fingerprint, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache()
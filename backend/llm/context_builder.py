@@ -0,0 +1,201 @@
+"""
+Turns retrieved chunks into the CONTEXT of the prompt, within a token budget:
+
+    1. hits from the same source on neighbouring positions are merged into
+       one passage, dropping the text the chunker repeats (CHUNK_OVERLAP)
+    2. near-duplicate passages (same text from another upload, another
+       source) are removed, the better-ranked one is kept
+    3. passages are packed best-ranked first until CONTEXT_TOKEN_BUDGET
+
+Token counts come from a fast (Rust) HF tokenizer, by default the
+embedding model's one: it is not the LLM's tokenizer, so the budget is
+approximate (leave headroom below the LLM's context window). The
+tokenizer is loaded at warmup (load_tokenizer), never on a request; until
+then, or without one, a characters / 4 estimate is used.
+"""
+
+import os
+import re
+import threading
+
+from backend.metrics import Counter
+from backend.vectordb.embedder import MODEL_NAME
+from backend.vectordb.embedding_backends import model_dir
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Share of a passage's word 3-grams found in a better-ranked one to drop it
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Any HF tokenizer; the embedding model's one is already on disk (the LLM's
+# own tokenizer makes the budget exact)
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", MODEL_NAME)
+
+CONTEXT_SEPARATOR = "\n\n"
+# Shorter common edges between neighbouring chunks are a coincidence, not the overlap
+MIN_OVERLAP_CHARS = 8
+MAX_OVERLAP_CHARS = 2000
+SHINGLE_SIZE = 3
+
+context_tokens = Counter("rag_context_tokens_total", "Prompt context tokens, sent and saved by packing")
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+# ---------- TOKEN COUNTS ----------
+def load_tokenizer():
+    """
+    Load the tokenizer once (may download it: warmup and scripts only).
+    Returns it, or None when unavailable (then count_tokens estimates).
+    """
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        with _tokenizer_lock:
+            if not _tokenizer_loaded:
+                _tokenizer = _load_tokenizer()
+                _tokenizer_loaded = True
+    return _tokenizer
+
+
+def get_tokenizer():
+    """The tokenizer load_tokenizer() loaded, or None: requests never load it."""
+    return _tokenizer
+
+
+def _load_tokenizer():
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        print("⚠️ tokenizers not installed, estimating context tokens from length")
+        return None
+
+    # The ONNX export saves the tokenizer next to the model
+    local = os.path.join(model_dir(CONTEXT_TOKENIZER), "tokenizer.json")
+    try:
+        tokenizer = Tokenizer.from_file(local) if os.path.exists(local) else Tokenizer.from_pretrained(CONTEXT_TOKENIZER)
+    except Exception as e:
+        print(f"⚠️ Tokenizer {CONTEXT_TOKENIZER} unavailable ({e}), estimating context tokens from length")
+        return None
+
+    # Embedding tokenizers truncate at the model's max length: count everything
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+def count_tokens(texts):
+    """Token count of each text."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return [max(1, len(text) // 4) for text in texts]
+    return [len(encoding.ids) for encoding in tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * 4]
+    offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+    if len(offsets) <= max_tokens:
+        return text
+    return text[:offsets[max_tokens - 1][1]]
+
+
+# ---------- MERGE / DE-DUPLICATE ----------
+def overlap_length(left: str, right: str) -> int:
+    """Length of the longest end of `left` that `right` starts with."""
+    longest = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_neighbours(results):
+    """
+    Passages [{"text", "source", "pages", "rank"}]: consecutive chunks
+    (page = position in the document) of one source become one passage.
+    """
+    by_source = {}
+    for rank, hit in enumerate(results):
+        by_source.setdefault(hit["source"], []).append((hit["page"], rank, hit["text"]))
+
+    passages = []
+    for source, hits in by_source.items():
+        hits.sort()
+        current = None
+        for page, rank, text in hits:
+            if current is not None and page == current["pages"][-1]:
+                continue  # same chunk twice
+            if current is not None and page == current["pages"][-1] + 1:
+                cut = overlap_length(current["text"], text)
+                current["text"] += text[cut:] if cut else "\n" + text
+                current["pages"].append(page)
+                current["rank"] = min(current["rank"], rank)
+                continue
+            current = {"text": text, "source": source, "pages": [page], "rank": rank}
+            passages.append(current)
+
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def drop_near_duplicates(passages, threshold: float = CONTEXT_DEDUP_THRESHOLD):
+    """Passages (best-ranked first) whose text is mostly already in a kept one are dropped."""
+    kept, kept_shingles = [], []
+    for passage in passages:
+        grams = shingles(passage["text"])
+        if any(len(grams & other) >= threshold * len(grams) for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(grams)
+    return kept
+
+
+# ---------- PACKING ----------
+def build_context(results, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    (context, stats) for the retrieved `results`. stats compares the
+    packed context with the plain join of every chunk it replaces.
+    """
+    if not results:
+        return "", {"chunks": 0, "passages": 0, "merged": 0, "duplicates": 0, "tokens": 0, "tokens_saved": 0}
+
+    passages = merge_neighbours(results)
+    merged = len(passages)
+    passages = drop_near_duplicates(passages)
+
+    separator_tokens = count_tokens([CONTEXT_SEPARATOR])[0]
+    chunk_tokens = count_tokens([r["text"] for r in results])
+    naive_tokens = sum(chunk_tokens) + separator_tokens * (len(results) - 1)
+
+    packed, used = [], 0
+    for passage, tokens in zip(passages, count_tokens([p["text"] for p in passages])):
+        cost = tokens + (separator_tokens if packed else 0)
+        if used + cost <= budget:
+            packed.append(passage["text"])
+            used += cost
+        elif not packed:
+            # Even the best passage alone is over budget: keep its beginning
+            packed.append(truncate_to_tokens(passage["text"], budget))
+            used = count_tokens(packed)[0]
+        # else: a smaller, lower-ranked passage may still fit
+
+    stats = {
+        "chunks": len(results),
+        "passages": len(packed),
+        "merged": len(results) - merged,
+        "duplicates": merged - len(passages),
+        "tokens": used,
+        "tokens_saved": max(0, naive_tokens - used),
+    }
+    context_tokens.inc(used, kind="sent")
+    context_tokens.inc(stats["tokens_saved"], kind="saved")
+    return CONTEXT_SEPARATOR.join(packed), stats
@@ -1,44 +1,175 @@
-from groq import Groq
 import os
+import time
+import asyncio
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+from backend.metrics import Counter, CallbackMetric, span, record_stage
+from backend.llm.providers import NOT_FOUND, get_provider
+from backend.llm.resilience import LLMUnavailable, CircuitBreaker, ConcurrencyLimiter, backoff_delay
 
+# Seconds per attempt, and for the whole call (attempts + backoff)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# Retries on timeouts, connection errors, 429 and 5xx
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Calls in flight per worker; the others queue up to LLM_QUEUE_TIMEOUT seconds
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+# Failed calls in a row that open the circuit, seconds before probing again
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET)
+limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT)
+
+# ---------- METRICS ----------
+CIRCUIT_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+llm_calls = Counter("rag_llm_calls_total", "LLM calls, by provider and mode")
+llm_retries = Counter("rag_llm_retries_total", "LLM call retries, by provider")
+llm_failures = Counter("rag_llm_failures_total", "Failed LLM calls, by provider and reason")
+CallbackMetric("rag_llm_in_flight", "LLM calls in flight", lambda: limiter.in_flight)
+CallbackMetric("rag_llm_waiting", "LLM calls queued for a slot", lambda: limiter.waiting)
+CallbackMetric("rag_llm_circuit_state", "0 closed, 1 half-open, 2 open", lambda: CIRCUIT_STATES[breaker.state])
+
+
+def warmup():
+    """Build the provider clients ahead of the first question."""
+    get_provider().warmup()
+
+
+# ---------- RESILIENCE ----------
+def _admit(provider):
+    if not breaker.allow():
+        llm_failures.inc(provider=provider.name, reason="circuit_open")
+        raise LLMUnavailable(
+            f"LLM provider {provider.name} unavailable (circuit open)", retry_after=breaker.retry_after()
+        )
+
+
+def _attempt_timeout(deadline: float) -> float:
+    return max(0.001, min(LLM_TIMEOUT, deadline - time.monotonic()))
+
+
+def _retry_delay(provider, exc, attempt: int, deadline: float):
+    """Seconds to wait before the next attempt, None to give up."""
+    if attempt >= LLM_MAX_RETRIES or not provider.is_retryable(exc):
+        return None
+    delay = backoff_delay(attempt, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, provider.retry_after(exc))
+    if time.monotonic() + delay >= deadline:
+        return None
+
+    llm_retries.inc(provider=provider.name)
+    print(f"🔁 LLM retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.2f}s ({type(exc).__name__})")
+    return delay
+
+
+def _failed(provider, exc):
+    """
+    Record a call that gave up. Provider-side failures count against the
+    circuit and become LLMUnavailable; other errors (e.g. a 400: the
+    provider is up, the request is wrong) are returned as None: re-raise.
+    """
+    if not provider.is_retryable(exc):
+        breaker.record_success()
+        llm_failures.inc(provider=provider.name, reason="error")
+        return None
+
+    breaker.record_failure()
+    llm_failures.inc(provider=provider.name, reason="unavailable")
+    return LLMUnavailable(
+        f"LLM provider {provider.name} failed: {type(exc).__name__}: {exc}",
+        retry_after=breaker.retry_after() or None,
+    )
+
+
+# ---------- PUBLIC API ----------
 def generate_answer(question, context):
     if not context.strip():
-        return "Information not found in the knowledge base."
-
-    prompt = f"""
-You are a STRICT enterprise RAG system.
-
-CRITICAL RULES (MUST FOLLOW):
-- Use ONLY the information explicitly present in CONTEXT.
-- Do NOT rephrase using your own knowledge.
-- Do NOT invent steps, phases, names, or structure.
-- If the answer is not explicitly stated word-for-word in CONTEXT,
-  respond EXACTLY with:
-  "Information not found in the knowledge base."
-
-TASK:
-Extract and summarize ONLY what is written.
-
-CONTEXT:
-----------------
-{context}
-----------------
-
-QUESTION:
-{question}
-
-ANSWER (only from context):
-"""
-
-    response = client.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {"role": "system", "content": "You are a strict extractive RAG assistant."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.0
-    )
+        return NOT_FOUND
+
+    provider = get_provider()
+    llm_calls.inc(provider=provider.name, mode="sync")
+
+    with limiter.slot() as waited:
+        record_stage("llm_queue", waited)
+        _admit(provider)
+
+        deadline = time.monotonic() + LLM_DEADLINE
+        attempt = 0
+        while True:
+            try:
+                with span("llm"):
+                    answer = provider.complete(question, context, _attempt_timeout(deadline))
+                break
+            except Exception as e:
+                delay = _retry_delay(provider, e, attempt, deadline)
+                if delay is None:
+                    error = _failed(provider, e)
+                    if error is None:
+                        raise
+                    raise error from e
+                time.sleep(delay)
+                attempt += 1
+
+        breaker.record_success()
+
+    return answer.strip()
+
+
+async def _open_stream(provider, question, context):
+    """
+    (first token, rest of the stream). Attempts are retried until a first
+    token arrives; after that the answer is already on its way to the client.
+    """
+    deadline = time.monotonic() + LLM_DEADLINE
+    attempt = 0
+    while True:
+        tokens = provider.stream(question, context, _attempt_timeout(deadline))
+        try:
+            first = await asyncio.wait_for(tokens.__anext__(), _attempt_timeout(deadline))
+            return first, tokens
+        except StopAsyncIteration:
+            return None, tokens
+        except Exception as e:
+            await tokens.aclose()
+            delay = _retry_delay(provider, e, attempt, deadline)
+            if delay is None:
+                error = _failed(provider, e)
+                if error is None:
+                    raise
+                raise error from e
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def stream_answer(question, context):
+    """Async generator of answer tokens, as the provider produces them."""
+    if not context.strip():
+        yield NOT_FOUND
+        return
+
+    provider = get_provider()
+    llm_calls.inc(provider=provider.name, mode="stream")
+
+    async with limiter.async_slot() as waited:
+        record_stage("llm_queue", waited)
+        _admit(provider)
+
+        start = time.perf_counter()
+        first, tokens = await _open_stream(provider, question, context)
+        record_stage("llm_first_token", time.perf_counter() - start)
+
+        if first is not None:
+            yield first
+        try:
+            async for token in tokens:
+                yield token
+        except Exception as e:
+            # Mid-answer: no retry, the client already has part of it
+            _failed(provider, e)
+            raise
+        breaker.record_success()
 
-    return response.choices[0].message.content.strip()
+    record_stage("llm_stream", time.perf_counter() - start)
@@ -0,0 +1,315 @@
+"""
+LLM providers, selected with LLM_PROVIDER:
+
+    groq    Groq cloud API (default)
+    local   any OpenAI-compatible server (llama.cpp, vLLM, Ollama...) at LOCAL_LLM_URL
+    fake    deterministic, offline: the first sentence of the context, with a
+            simulated latency. Load tests and CI run the full path with it.
+
+Providers only talk to the backend: one attempt, within `timeout` seconds.
+Retries, the concurrency cap and the circuit breaker live in llm.py.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from backend.metrics import Counter
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+GROQ_MODEL = "llama-3.1-8b-instant"
+
+# Pooled HTTP connections per client (kept alive between calls)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+
+LOCAL_LLM_URL = os.getenv("LOCAL_LLM_URL", "http://localhost:8080/v1")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local")
+
+FAKE_FIRST_TOKEN_MS = float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "200"))
+FAKE_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "10"))
+# Share of fake calls failing with a retryable error (to exercise retries / the breaker)
+FAKE_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+NOT_FOUND = "Information not found in the knowledge base."
+
+# 408/409/429 and 5xx are worth another attempt, other 4xx are our bug
+RETRY_STATUS = {408, 409, 429}
+
+llm_tokens = Counter("rag_llm_tokens_total", "LLM tokens reported by the provider, by kind")
+
+
+def record_usage(usage):
+    if usage is not None:
+        llm_tokens.inc(usage.prompt_tokens, kind="prompt")
+        llm_tokens.inc(usage.completion_tokens, kind="completion")
+
+
+def retryable_status(status: int) -> bool:
+    return status in RETRY_STATUS or status >= 500
+
+
+def build_prompt(question, context):
+    return f"""
+You are a STRICT enterprise RAG system.
+
+CRITICAL RULES (MUST FOLLOW):
+- Use ONLY the information explicitly present in CONTEXT.
+- Do NOT rephrase using your own knowledge.
+- Do NOT invent steps, phases, names, or structure.
+- If the answer is not explicitly stated word-for-word in CONTEXT,
+  respond EXACTLY with:
+  "{NOT_FOUND}"
+
+TASK:
+Extract and summarize ONLY what is written.
+
+CONTEXT:
+----------------
+{context}
+----------------
+
+QUESTION:
+{question}
+
+ANSWER (only from context):
+"""
+
+
+def build_messages(question, context):
+    return [
+        {"role": "system", "content": "You are a strict extractive RAG assistant."},
+        {"role": "user", "content": build_prompt(question, context)},
+    ]
+
+
+class LLMProvider:
+    name = "base"
+    model = None
+
+    def warmup(self):
+        """Build clients / open connections ahead of the first question."""
+
+    def complete(self, question, context, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, question, context, timeout: float):
+        """Async generator of answer tokens."""
+        raise NotImplementedError
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError))
+
+    def retry_after(self, exc: Exception):
+        """Seconds the server asked us to wait (Retry-After), if any."""
+        response = getattr(exc, "response", None)
+        value = response.headers.get("retry-after") if response is not None else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+
+# ---------- GROQ ----------
+class GroqProvider(LLMProvider):
+    name = "groq"
+    model = GROQ_MODEL
+
+    def __init__(self):
+        # Clients are built on first use, not at import
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE)
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from groq import Groq
+                    # Retries are ours (jittered, breaker-aware): the SDK's are off
+                    self._client = Groq(
+                        api_key=os.getenv("GROQ_API_KEY"), max_retries=0,
+                        http_client=httpx.Client(limits=self._limits()),
+                    )
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    from groq import AsyncGroq
+                    self._async_client = AsyncGroq(
+                        api_key=os.getenv("GROQ_API_KEY"), max_retries=0,
+                        http_client=httpx.AsyncClient(limits=self._limits()),
+                    )
+        return self._async_client
+
+    def warmup(self):
+        self.client()
+        self.async_client()
+
+    def complete(self, question, context, timeout):
+        response = self.client().chat.completions.create(
+            model=self.model,
+            messages=build_messages(question, context),
+            temperature=0.0,
+            timeout=timeout,
+        )
+        record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def stream(self, question, context, timeout):
+        stream = await self.async_client().chat.completions.create(
+            model=self.model,
+            messages=build_messages(question, context),
+            temperature=0.0,
+            stream=True,
+            timeout=timeout,
+        )
+
+        async for chunk in stream:
+            # Groq reports usage on the last chunk
+            record_usage(getattr(getattr(chunk, "x_groq", None), "usage", None))
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+    def is_retryable(self, exc):
+        import groq
+        if isinstance(exc, groq.APIConnectionError):  # includes timeouts
+            return True
+        if isinstance(exc, groq.APIStatusError):
+            return retryable_status(exc.status_code)
+        return super().is_retryable(exc)
+
+
+# ---------- LOCAL (OpenAI-compatible) ----------
+class LocalProvider(LLMProvider):
+    name = "local"
+    model = LOCAL_LLM_MODEL
+
+    def __init__(self, base_url: str = LOCAL_LLM_URL):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _clients(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    limits = httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE)
+                    self._async_client = httpx.AsyncClient(limits=limits)
+                    self._client = httpx.Client(limits=limits)
+        return self._client, self._async_client
+
+    def _body(self, question, context, stream):
+        return {
+            "model": self.model,
+            "messages": build_messages(question, context),
+            "temperature": 0.0,
+            "stream": stream,
+        }
+
+    def warmup(self):
+        self._clients()
+
+    def complete(self, question, context, timeout):
+        client, _ = self._clients()
+        response = client.post(self.url, json=self._body(question, context, False), timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("usage"):
+            record_usage(SimpleNamespace(**data["usage"]))
+        return data["choices"][0]["message"]["content"]
+
+    async def stream(self, question, context, timeout):
+        _, client = self._clients()
+        async with client.stream("POST", self.url, json=self._body(question, context, True), timeout=timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    record_usage(SimpleNamespace(**chunk["usage"]))
+                if not chunk.get("choices"):
+                    continue
+                token = chunk["choices"][0].get("delta", {}).get("content")
+                if token:
+                    yield token
+
+    def is_retryable(self, exc):
+        import httpx
+        if isinstance(exc, httpx.TransportError):  # connect / read timeouts, refused connections
+            return True
+        if isinstance(exc, httpx.HTTPStatusError):
+            return retryable_status(exc.response.status_code)
+        return super().is_retryable(exc)
+
+
+# ---------- FAKE ----------
+def fake_answer(question, context):
+    """Deterministic 'answer': the first sentence of the context."""
+    first = context.strip().split("\n")[0]
+    return first.split(". ")[0].strip()[:300] or NOT_FOUND
+
+
+class FakeProvider(LLMProvider):
+    name = "fake"
+    model = "fake"
+
+    def _maybe_fail(self):
+        if FAKE_ERROR_RATE and random.random() < FAKE_ERROR_RATE:
+            raise ConnectionError("fake provider error")
+
+    def complete(self, question, context, timeout):
+        self._maybe_fail()
+        answer = fake_answer(question, context)
+        # Same simulated latency as the streamed fake answer
+        latency = (FAKE_FIRST_TOKEN_MS + FAKE_TOKEN_MS * answer.count(" ")) / 1000
+        if latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake provider: {latency:.2f}s > timeout {timeout:.2f}s")
+        time.sleep(latency)
+        return answer
+
+    async def stream(self, question, context, timeout):
+        self._maybe_fail()
+        await asyncio.sleep(FAKE_FIRST_TOKEN_MS / 1000)
+        for i, word in enumerate(fake_answer(question, context).split(" ")):
+            if i:
+                await asyncio.sleep(FAKE_TOKEN_MS / 1000)
+            yield word if i == 0 else " " + word
+
+
+PROVIDERS = {"groq": GroqProvider, "local": LocalProvider, "fake": FakeProvider}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> LLMProvider:
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if LLM_PROVIDER not in PROVIDERS:
+                    raise ValueError(f"Unknown LLM provider {LLM_PROVIDER!r}, expected one of {tuple(PROVIDERS)}")
+                _provider = PROVIDERS[LLM_PROVIDER]()
+    return _provider
@@ -0,0 +1,218 @@
+"""
+Guards around LLM provider calls:
+
+    CircuitBreaker      stop calling a provider that keeps failing, probe it again later
+    ConcurrencyLimiter  cap the calls in flight; extra callers queue (with a timeout)
+    backoff_delay       jittered exponential backoff between retries
+
+All of them raise LLMUnavailable, which the API turns into a 503.
+"""
+
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+
+class LLMUnavailable(RuntimeError):
+    """The LLM cannot answer right now (circuit open, queue full, retries exhausted)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Full jitter: uniform in [0, min(cap, base * 2^attempt)], never below the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    return max(delay, retry_after or 0.0)
+
+
+# ---------- CIRCUIT BREAKER ----------
+class CircuitBreaker:
+    """
+    closed     calls go through; `failure_threshold` failures in a row open it
+    open       calls are rejected for `reset_timeout` seconds
+    half_open  one probe call goes through: success closes, failure re-opens
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            # One probe at a time; a probe that never reported back (cancelled
+            # request) does not keep the circuit half-open forever
+            now = time.monotonic()
+            if state == self.HALF_OPEN and (
+                self._probe_started is None or now - self._probe_started >= self.reset_timeout
+            ):
+                self._probe_started = now
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            probing = self._probe_started is not None
+            if probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or probing:
+                    print(f"⚠️ LLM circuit open after {self._failures} failures")
+                self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+# ---------- CONCURRENCY ----------
+class ConcurrencyLimiter:
+    """
+    At most `limit` calls in flight across threads (sync /ask) and the
+    event loop (streams). Callers wait up to `queue_timeout` seconds.
+
+    Threads wait on a Condition; coroutines wait on a future that release()
+    resolves from whichever thread frees the slot. Each release wakes one
+    waiter of each kind, and a woken waiter that loses the race (or gives
+    up) passes the wakeup on, so a free slot is never left unclaimed.
+    """
+
+    def __init__(self, limit: int, queue_timeout: float):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._freed = threading.Condition(self._lock)
+        self._free = limit
+        # (loop, future) of the coroutines waiting, oldest first
+        self._async_waiters = deque()
+        self.waiting = 0
+        self.in_flight = 0
+
+    def _busy(self):
+        return LLMUnavailable(
+            f"LLM busy: {self.limit} calls in flight, waited {self.queue_timeout}s", retry_after=1.0
+        )
+
+    def _wake_locked(self):
+        self._freed.notify()
+        while self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            if not future.done():
+                loop.call_soon_threadsafe(_resolve, future)
+                return
+
+    def _release(self):
+        with self._lock:
+            self._free += 1
+            self.in_flight -= 1
+            self._wake_locked()
+
+    @contextmanager
+    def slot(self):
+        """Blocks the calling thread until a slot is free; yields the seconds waited."""
+        start = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+            try:
+                acquired = self._freed.wait_for(lambda: self._free > 0, timeout=self.queue_timeout)
+                if acquired:
+                    self._free -= 1
+                    self.in_flight += 1
+            finally:
+                self.waiting -= 1
+        if not acquired:
+            raise self._busy()
+
+        try:
+            yield time.perf_counter() - start
+        finally:
+            self._release()
+
+    async def _acquire_async(self, deadline: float) -> bool:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._free > 0:
+                    self._free -= 1
+                    self.in_flight += 1
+                    return True
+                future = loop.create_future()
+                waiter = (loop, future)
+                self._async_waiters.append(waiter)
+
+            remaining = deadline - time.perf_counter()
+            woken = False
+            try:
+                if remaining > 0:
+                    await asyncio.wait_for(future, remaining)
+                    woken = True
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if not woken:
+                    # Timed out or cancelled: a wakeup meant for us goes to the next waiter
+                    with self._lock:
+                        if waiter in self._async_waiters:
+                            self._async_waiters.remove(waiter)
+                        if self._free > 0:
+                            self._wake_locked()
+            if not woken:
+                return False
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """Same as slot() without blocking the event loop; cancelling a waiting caller is safe."""
+        start = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        try:
+            acquired = await self._acquire_async(start + self.queue_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            raise self._busy()
+
+        try:
+            yield time.perf_counter() - start
+        finally:
+            self._release()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
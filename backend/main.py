@@ -1,15 +1,117 @@
-from fastapi import FastAPI, Depends
-from pydantic import BaseModel
+import os
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, List, Union
+
+from fastapi import FastAPI, Depends, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, ConfigDict, Field
 from fastapi.middleware.cors import CORSMiddleware
 
-from backend.vectordb.retriever import Retriever
-from backend.llm.llm import generate_answer
-from backend.auth import router as auth_router, get_current_user, UserOut
+from backend.vectordb.retriever import get_shared_retriever, loaded_shared_retriever, RELEVANCE_THRESHOLD
+from backend.vectordb.embedder import query_embedder, embed_query, embed_text
+from backend.llm.llm import generate_answer, stream_answer, warmup as llm_warmup
+from backend.llm.providers import NOT_FOUND
+from backend.llm.resilience import LLMUnavailable
+from backend.llm.context_builder import build_context, load_tokenizer
+from backend.llm.answer_cache import answer_cache, context_fingerprint
+from backend.auth import router as auth_router, get_current_user, UserOut, user_store
 from backend.upload import router as upload_router
 from backend.chat_history import add_message, get_history
+from backend.metrics import MetricsMiddleware, CallbackMetric, Counter, span, render_metrics
+
+# ---------------- STARTUP / READINESS ----------------
+# Nothing heavy is loaded at import: the lifespan warms every stage in
+# parallel, in the background, and /ready reports when the worker is warm.
+startup_state = {"ready": False, "total_ms": None, "stages": {}}
+
+
+def warm_embedding_model():
+    # One encode also warms the kernels, not just the weights
+    embed_text(["warmup"])
+
+
+def warm_index():
+    try:
+        get_shared_retriever()
+    except (FileNotFoundError, RuntimeError) as e:
+        # No index yet (fresh install): it is loaded on first /ask
+        return f"not loaded: {e}"
+
+
+def warm_tokenizer():
+    if load_tokenizer() is None:
+        return "not available: context tokens are estimated"
+
+
+def check_relevance_gate():
+    if RELEVANCE_THRESHOLD is None:
+        print("⚠️ RELEVANCE_THRESHOLD is unset: the relevance gate is off and every hit reaches the LLM. "
+              "Pick one with backend/eval/calibrate_relevance.py")
+        return "off: RELEVANCE_THRESHOLD unset, see backend/eval/calibrate_relevance.py"
+    return f"min score {RELEVANCE_THRESHOLD}"
+
+
+WARMUP_STAGES = {
+    "embedding_model": warm_embedding_model,
+    "index": warm_index,
+    "llm_client": llm_warmup,
+    "tokenizer": warm_tokenizer,
+    "relevance_gate": check_relevance_gate,
+    "users": lambda: user_store.get(""),
+}
+
+
+def run_stage(name, fn):
+    start = time.perf_counter()
+    try:
+        note = fn()
+        stage = {"status": "ready", **({"note": note} if note else {})}
+    except Exception as e:
+        stage = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    stage["ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # Replaced whole: /ready may be serializing the state meanwhile
+    startup_state["stages"][name] = stage
+    print(f"⏱️ warmup {name}: {stage['status']} in {stage['ms']}ms")
+
+
+async def warmup():
+    start = time.perf_counter()
+    for name in WARMUP_STAGES:
+        startup_state["stages"][name] = {"status": "loading"}
+
+    await asyncio.gather(*[
+        run_in_threadpool(run_stage, name, fn) for name, fn in WARMUP_STAGES.items()
+    ])
+
+    startup_state["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    startup_state["ready"] = all(s["status"] == "ready" for s in startup_state["stages"].values())
+    print(f"{'✅' if startup_state['ready'] else '❌'} Worker warm in {startup_state['total_ms']}ms")
+
+
+# ---------------- LIFESPAN ----------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve right away; requests arriving before warmup load lazily
+    task = asyncio.create_task(warmup())
+    yield
+    task.cancel()
+
 
 # ---------------- APP ----------------
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# ---------------- ERRORS ----------------
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    # Provider down, circuit open or too many calls queued: retry later
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers=headers)
+
 
 # ---------------- CORS ----------------
 app.add_middleware(
@@ -20,9 +122,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------------- METRICS ----------------
+# Stage timings per request (Server-Timing header when STAGE_TIMINGS_HEADER=1)
+app.add_middleware(MetricsMiddleware)
+
+
+def index_stats():
+    retriever = loaded_shared_retriever()
+    if retriever is None:
+        return None
+    return {"vectors": retriever.index.ntotal, "chunks": len(retriever.store), "sources": len(retriever.store.sources)}
+
+
+CallbackMetric("rag_index_size", "Loaded index size", index_stats, label="kind")
+CallbackMetric("rag_ready", "1 once the worker is warm", lambda: int(startup_state["ready"]))
+CallbackMetric("rag_query_embedder_total", "Query embedder counters", kind="counter", label="kind",
+               fn=lambda: {k: v for k, v in query_embedder.stats().items() if k in ("requests", "cache_hits", "batches", "encoded")})
+CallbackMetric("rag_answer_cache_total", "Answer cache counters", kind="counter", label="kind",
+               fn=lambda: {k: v for k, v in answer_cache.stats().items() if k in ("hits", "semantic_hits", "misses", "invalidations")})
+CallbackMetric("rag_answer_cache_size", "Answers currently cached", lambda: answer_cache.stats()["size"])
+not_relevant = Counter("rag_not_relevant_total", "Questions answered not-found without an LLM call")
+
+
 # ---------------- CORE OBJECTS ----------------
 def get_retriever():
-    return Retriever()
+    return get_shared_retriever()
 
 
 # ---------------- ROUTERS ----------------
@@ -30,8 +154,62 @@ app.include_router(auth_router)
 app.include_router(upload_router)
 
 # ---------------- MODELS ----------------
+class SearchFilters(BaseModel):
+    # A misspelled filter must fail, not silently search everything
+    model_config = ConfigDict(extra="forbid")
+
+    source: Optional[Union[str, List[str]]] = None
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+
 class Question(BaseModel):
     question: str
+    # Restrict retrieval, e.g. {"source": ["report.pdf"]}
+    filters: Optional[SearchFilters] = None
+
+
+def retrieve(payload: Question, top_k: int = 3):
+    filters = payload.filters.model_dump(exclude_none=True) if payload.filters else None
+    try:
+        return get_retriever().search(payload.question, top_k=top_k, filters=filters, min_score=RELEVANCE_THRESHOLD)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# /ask/batch: questions per request, LLM calls in flight per request
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "100"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "4"))
+
+
+class BatchQuestions(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=ASK_BATCH_MAX)
+    filters: Optional[SearchFilters] = None
+
+
+# ---------------- ANSWER CACHE ----------------
+def cache_key_parts(question, results):
+    """(context fingerprint, index version, query vector for semantic lookup)"""
+    query_vec = embed_query(question) if answer_cache.semantic else None
+    return context_fingerprint(results), get_retriever().version, query_vec
+
+
+def answer_with_cache(question, results, context):
+    if not results:
+        # No hit passed RELEVANCE_THRESHOLD: the LLM could only say so
+        not_relevant.inc()
+        return NOT_FOUND
+
+    with span("answer_cache"):
+        fingerprint, version, query_vec = cache_key_parts(question, results)
+        answer = answer_cache.get(question, fingerprint, version, query_vec)
+
+    if answer is None:
+        start = time.perf_counter()
+        answer = generate_answer(question, context)
+        answer_cache.put(question, fingerprint, version, answer, time.perf_counter() - start, query_vec)
+
+    return answer
+
 
 # ---------------- ENDPOINTS ----------------
 @app.post("/ask")
@@ -42,24 +220,164 @@ def ask_api(
     question = payload.question
 
     # Save user question
-    add_message(current_user.email, "user", question)
+    with span("history_write"):
+        add_message(current_user.email, "user", question)
 
     # Retrieve context
-    results = get_retriever().search(question, top_k=3)
-    context = "\n\n".join([r["text"] for r in results])
+    with span("retrieve"):
+        results = retrieve(payload)
+    with span("context"):
+        context, context_stats = build_context(results)
 
-    # Generate answer
-    answer = generate_answer(question, context)
+    # Generate answer (or reuse it for a repeated question)
+    answer = answer_with_cache(question, results, context)
 
     # Save assistant answer
-    add_message(current_user.email, "assistant", answer)
+    with span("history_write"):
+        add_message(current_user.email, "assistant", answer)
 
     return {
         "answer": answer,
-        "sources": results
+        "sources": results,
+        "context": context_stats
     }
 
 
+@app.post("/ask/batch")
+async def ask_batch_api(
+    payload: BatchQuestions,
+    current_user: UserOut = Depends(get_current_user)
+):
+    """
+    Answers N questions: one batched retrieval (one embedding call, one
+    matrix search), then at most ASK_BATCH_CONCURRENCY LLM calls at a time.
+    Meant for offline jobs: nothing is written to the chat history.
+    """
+    filters = payload.filters.model_dump(exclude_none=True) if payload.filters else None
+    try:
+        all_results = await run_in_threadpool(
+            get_retriever().search_batch, payload.questions, 3, None, filters, RELEVANCE_THRESHOLD
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+
+    async def answer_one(question, results):
+        context, _ = build_context(results)
+        async with semaphore:
+            try:
+                answer = await run_in_threadpool(answer_with_cache, question, results, context)
+            except Exception as e:
+                # One failed LLM call does not fail the whole batch
+                return {"question": question, "answer": None, "sources": results,
+                        "error": f"{type(e).__name__}: {e}"}
+        return {"question": question, "answer": answer, "sources": results}
+
+    answers = await asyncio.gather(*[
+        answer_one(question, results)
+        for question, results in zip(payload.questions, all_results)
+    ])
+    return {"answers": answers}
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream_api(
+    payload: Question,
+    current_user: UserOut = Depends(get_current_user)
+):
+    """
+    Same as /ask, as Server-Sent Events:
+    `sources` first, then one `token` event per LLM token, then `done`.
+    """
+    question = payload.question
+    start = time.perf_counter()
+
+    # Blocking work (file writes, embedding, FAISS) stays off the event loop
+    await run_in_threadpool(add_message, current_user.email, "user", question)
+
+    results = await run_in_threadpool(retrieve, payload)
+    context, context_stats = build_context(results)
+
+    cached = None
+    if results:
+        fingerprint, version, query_vec = await run_in_threadpool(cache_key_parts, question, results)
+        cached = answer_cache.get(question, fingerprint, version, query_vec)
+    else:
+        # No hit passed RELEVANCE_THRESHOLD: stream_answer says not-found, no LLM call
+        not_relevant.inc()
+
+    async def cached_tokens():
+        yield cached
+
+    async def events():
+        yield sse_event("sources", results)
+
+        parts = []
+        ttft_ms = None
+        tokens = cached_tokens() if cached is not None else stream_answer(question, context)
+        try:
+            async for token in tokens:
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"{type(e).__name__}: {e}"})
+            return
+
+        answer = "".join(parts).strip()
+        if cached is None and results:
+            answer_cache.put(question, fingerprint, version, answer, time.perf_counter() - start, query_vec)
+
+        # Save assistant answer
+        await run_in_threadpool(add_message, current_user.email, "assistant", answer)
+
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"⏱️ /ask/stream ttft={ttft_ms}ms total={total_ms}ms")
+        yield sse_event("done", {
+            "answer": answer,
+            "cached": cached is not None,
+            "context": context_stats,
+            "ttft_ms": ttft_ms,
+            "total_ms": total_ms,
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/history")
-def read_history(current_user: UserOut = Depends(get_current_user)):
-    return get_history(current_user.email)
+def read_history(
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserOut = Depends(get_current_user)
+):
+    return get_history(current_user.email, cursor=cursor, limit=limit)
+
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus text format (this worker only)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+def read_ready():
+    """200 once every warmup stage succeeded, 503 (with the stages) before."""
+    return JSONResponse(startup_state, status_code=200 if startup_state["ready"] else 503)
+
+
+@app.get("/stats")
+def read_stats(current_user: UserOut = Depends(get_current_user)):
+    return {
+        "query_embedder": query_embedder.stats(),
+        "answer_cache": answer_cache.stats(),
+    }
@@ -0,0 +1,223 @@
+"""
+In-process metrics, exposed in Prometheus text format by GET /metrics.
+
+    with span("faiss_search"):
+        ...
+
+A span feeds the `rag_stage_seconds{stage=...}` histogram and, inside an
+HTTP request, the request's own stage timings (Server-Timing header).
+Each uvicorn worker has its own registry: scrape every worker.
+"""
+
+import os
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Return per-request stage timings in a Server-Timing header
+STAGE_TIMINGS_HEADER = os.getenv("STAGE_TIMINGS_HEADER", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+# Stage -> seconds of the request being served (None outside requests)
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def samples(self):
+        """Yield (suffix, label key, extra labels, value)."""
+        return []
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self._values = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(entry) for key, entry in self._values.items()}
+
+        out = []
+        for key, entry in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                out.append(("_bucket", key, (("le", _format_value(bound)),), cumulative))
+            out.append(("_bucket", key, (("le", "+Inf"),), entry[-1]))
+            out.append(("_sum", key, (), entry[-2]))
+            out.append(("_count", key, (), entry[-1]))
+        return out
+
+
+class CallbackMetric(Metric):
+    """
+    Value(s) read at scrape time from `fn`: a number, or a dict of
+    {label value: number} for `label`. `fn` returning None skips it.
+    """
+
+    def __init__(self, name, help, fn, kind="gauge", label=None):
+        super().__init__(name, help)
+        self.kind = kind
+        self.fn = fn
+        self.label = label
+
+    def samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [("", ((self.label, k),), (), v) for k, v in value.items() if v is not None]
+        return [("", (), (), value)]
+
+
+def render_metrics() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- SPANS ----------
+stage_seconds = Histogram("rag_stage_seconds", "Time spent per pipeline stage")
+
+
+def record_stage(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+# ---------- HTTP ----------
+http_seconds = Histogram("rag_http_request_seconds", "HTTP request latency (until the response starts)")
+http_requests = Counter("rag_http_requests_total", "HTTP requests")
+
+_TOKEN_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def server_timing(timings: dict) -> str:
+    """{"embed": 0.0012} -> 'embed;dur=1.2' (milliseconds)"""
+    return ", ".join(f"{_TOKEN_RE.sub('_', stage)};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (streams untouched): times every request, counts
+    it by route and status, and adds Server-Timing when enabled.
+    """
+
+    def __init__(self, app, timings_header: bool = STAGE_TIMINGS_HEADER):
+        self.app = app
+        self.timings_header = timings_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = {}
+        token = _request_timings.set(timings)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                path = getattr(route, "path", "unmatched")
+                status = str(message["status"])
+                http_seconds.observe(time.perf_counter() - start, path=path, method=scope["method"])
+                http_requests.inc(path=path, method=scope["method"], status=status)
+
+                if self.timings_header and timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
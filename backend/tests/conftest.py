@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Add project root to sys.path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+# Scripts run by hand against a built index, not pytest tests
+collect_ignore = ["test_retriever.py", "inspect_metadata.py"]
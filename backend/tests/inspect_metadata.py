@@ -1,9 +1,9 @@
-import pickle
+from backend.vectordb.chunk_store import ChunkStore
 
-with open("data/faiss/metadata.pkl", "rb") as f:
-    metadata = pickle.load(f)
+store = ChunkStore("data/faiss")
 
-print("Total entries:", len(metadata))
-print("\nFirst entry keys:", metadata[0].keys())
+print("Total entries:", len(store))
+print("Sources:", len(store.sources))
+print("\nFirst entry keys:", store.row(0).keys())
 print("\nPreview:")
-print({k: str(v)[:200] for k, v in metadata[0].items()})
+print({k: str(v)[:200] for k, v in store.row(0).items()})
@@ -0,0 +1,83 @@
+import time
+
+import numpy as np
+
+from backend.llm.answer_cache import AnswerCache, context_fingerprint, normalize_question
+
+FINGERPRINT = context_fingerprint([{"id": 3}, {"id": 7}])
+
+
+def test_question_normalization():
+    assert normalize_question("  When are   invoices SENT? ") == "when are invoices sent"
+    assert normalize_question("When are invoices sent") == normalize_question("when are invoices sent ?!")
+
+
+def test_fingerprint_depends_on_ids_and_their_order():
+    assert context_fingerprint([{"id": 3}, {"id": 7}]) == FINGERPRINT
+    assert context_fingerprint([{"id": 7}, {"id": 3}]) != FINGERPRINT
+    assert context_fingerprint([{"id": 3}]) != FINGERPRINT
+
+
+def test_hit_for_the_same_question_and_context():
+    cache = AnswerCache()
+    cache.put("When are invoices sent?", FINGERPRINT, "v1", "Monthly.", latency=1.5)
+
+    assert cache.get("when are invoices sent", FINGERPRINT, "v1") == "Monthly."
+    assert cache.get("When are invoices sent?", context_fingerprint([{"id": 3}]), "v1") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_seconds"]) == (1, 1, 1.5)
+
+
+def test_new_index_version_drops_everything():
+    cache = AnswerCache()
+    cache.put("q", FINGERPRINT, "v1", "a", latency=1)
+
+    assert cache.get("q", FINGERPRINT, "v2") is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_entries_expire_after_the_ttl():
+    cache = AnswerCache(ttl=0.05)
+    cache.put("q", FINGERPRINT, "v1", "a", latency=1)
+    time.sleep(0.06)
+
+    assert cache.get("q", FINGERPRINT, "v1") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_size=2)
+    cache.put("first", FINGERPRINT, "v1", "1", latency=1)
+    cache.put("second", FINGERPRINT, "v1", "2", latency=1)
+    cache.get("first", FINGERPRINT, "v1")
+    cache.put("third", FINGERPRINT, "v1", "3", latency=1)
+
+    assert cache.get("second", FINGERPRINT, "v1") is None
+    assert cache.get("first", FINGERPRINT, "v1") == "1"
+    assert cache.get("third", FINGERPRINT, "v1") == "3"
+
+
+def test_semantic_lookup_reuses_a_close_phrasing_of_the_same_context():
+    cache = AnswerCache(semantic=True, similarity=0.95)
+    cache.put("When are invoices sent?", FINGERPRINT, "v1", "Monthly.", latency=1,
+              query_vec=np.array([1.0, 0.0]))
+
+    close = np.array([0.99, 0.05])
+    assert cache.get("At what time are bills sent?", FINGERPRINT, "v1", query_vec=close) == "Monthly."
+    assert cache.stats()["semantic_hits"] == 1
+
+    far = np.array([0.0, 1.0])
+    assert cache.get("Who signs contracts?", FINGERPRINT, "v1", query_vec=far) is None
+    # Only answers over the same context are candidates
+    other = context_fingerprint([{"id": 9}])
+    assert cache.get("At what time are bills sent?", other, "v1", query_vec=close) is None
+
+
+def test_semantic_lookup_is_off_by_default():
+    cache = AnswerCache(semantic=False)
+    cache.put("When are invoices sent?", FINGERPRINT, "v1", "Monthly.", latency=1,
+              query_vec=np.array([1.0, 0.0]))
+
+    assert cache.get("At what time are bills sent?", FINGERPRINT, "v1", query_vec=np.array([1.0, 0.0])) is None
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+# backend.main imports the whole app, ingestion included
+pytest.importorskip("langchain_text_splitters")
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.auth import UserOut, get_current_user
+from backend.llm.answer_cache import AnswerCache
+from backend.llm.providers import NOT_FOUND
+from backend.llm.resilience import LLMUnavailable
+
+HITS = [{"id": 1, "text": "Invoices are sent monthly.", "source": "billing.pdf", "page": 1, "score": 0.82}]
+
+
+class FakeRetriever:
+    version = "v1"
+
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, query, top_k=5, mode=None, filters=None, min_score=None):
+        return self.results
+
+
+@pytest.fixture
+def app_with(monkeypatch):
+    """Configure the app around a fake retriever / LLM stream; returns (client, history, llm_calls)."""
+    history, llm_calls = [], []
+
+    def configure(results=HITS, tokens=("Invoices", " are sent", " monthly."), error=None):
+        async def fake_stream(question, context):
+            llm_calls.append(question)
+            for token in tokens:
+                yield token
+            if error is not None:
+                raise error
+
+        monkeypatch.setattr(main, "get_retriever", lambda: FakeRetriever(results))
+        monkeypatch.setattr(main, "add_message", lambda email, role, text: history.append((role, text)))
+        monkeypatch.setattr(main, "answer_cache", AnswerCache())
+        if results:
+            monkeypatch.setattr(main, "stream_answer", fake_stream)
+        app = main.app
+        app.dependency_overrides[get_current_user] = lambda: UserOut(email="user@example.com", role="user")
+        return TestClient(app), history, llm_calls
+
+    yield configure
+    main.app.dependency_overrides.clear()
+
+
+def read_events(response):
+    """[(event, data)] of an SSE body."""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def ask(client, question="When are invoices sent?"):
+    response = client.post("/ask/stream", json={"question": question})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return read_events(response)
+
+
+def test_sources_then_tokens_then_done(app_with):
+    client, history, _ = app_with()
+
+    events = ask(client)
+
+    assert [name for name, _ in events] == ["sources", "token", "token", "token", "done"]
+    assert events[0][1] == HITS
+    assert "".join(data["text"] for name, data in events if name == "token") == "Invoices are sent monthly."
+
+    done = events[-1][1]
+    assert done["answer"] == "Invoices are sent monthly."
+    assert done["cached"] is False
+    assert done["context"]["chunks"] == 1
+    assert done["ttft_ms"] is not None
+    assert history == [("user", "When are invoices sent?"), ("assistant", "Invoices are sent monthly.")]
+
+
+def test_repeated_question_is_served_from_the_cache(app_with):
+    client, history, llm_calls = app_with()
+    ask(client)
+
+    events = ask(client, "when are invoices sent")
+
+    assert [name for name, _ in events] == ["sources", "token", "done"]
+    assert events[1][1] == {"text": "Invoices are sent monthly."}
+    assert events[-1][1]["cached"] is True
+    assert len(llm_calls) == 1
+    assert history[-1] == ("assistant", "Invoices are sent monthly.")
+
+
+def test_llm_failure_ends_the_stream_with_an_error_event(app_with):
+    client, history, _ = app_with(tokens=("Invoices",), error=LLMUnavailable("LLM provider fake failed"))
+
+    events = ask(client)
+
+    assert [name for name, _ in events] == ["sources", "token", "error"]
+    assert events[-1][1] == {"detail": "LLMUnavailable: LLM provider fake failed"}
+    # Neither a partial answer in the history nor in the cache
+    assert history == [("user", "When are invoices sent?")]
+    assert ask(client)[-1][0] == "error"
+
+
+def test_no_relevant_hit_answers_not_found_without_the_llm(app_with):
+    client, _, llm_calls = app_with(results=[])
+
+    events = ask(client)
+
+    assert [name for name, _ in events] == ["sources", "token", "done"]
+    assert events[0][1] == []
+    assert events[-1][1]["answer"] == NOT_FOUND
+    assert llm_calls == []
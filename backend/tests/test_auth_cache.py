@@ -0,0 +1,56 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from backend import auth
+
+
+@pytest.fixture
+def users_file(tmp_path, monkeypatch):
+    path = tmp_path / "users.json"
+    monkeypatch.setattr(auth, "USERS_PATH", str(path))
+    monkeypatch.setattr(auth, "USERS_RELOAD_INTERVAL", 0.0)
+    monkeypatch.setattr(auth, "user_store", auth.UserStore())
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache())
+
+    def write(users):
+        path.write_text(json.dumps(users))
+        # Make the change visible even within the filesystem's mtime resolution
+        stamp = time.time_ns() + 10 ** 9
+        os.utime(path, ns=(stamp, stamp))
+
+    return write
+
+
+def current_user(token):
+    return asyncio.run(auth._current_user(token))
+
+
+def test_deleted_user_token_stops_working(users_file):
+    users_file({"a@b.com": {"email": "a@b.com", "name": "a", "password_hash": "x", "role": "admin"}})
+    token = auth.create_access_token({"sub": "a@b.com", "role": "admin"})
+
+    assert current_user(token).email == "a@b.com"
+    assert auth.token_cache.get(token) is not None
+
+    users_file({})
+
+    with pytest.raises(HTTPException) as rejected:
+        current_user(token)
+    assert rejected.value.status_code == 401
+
+
+def test_cache_hits_skip_users_json_between_checks(users_file, monkeypatch):
+    users_file({"a@b.com": {"email": "a@b.com", "name": "a", "password_hash": "x", "role": "user"}})
+    token = auth.create_access_token({"sub": "a@b.com", "role": "user"})
+    current_user(token)
+
+    monkeypatch.setattr(auth, "USERS_RELOAD_INTERVAL", 3600.0)
+    monkeypatch.setattr(auth, "load_users", lambda: pytest.fail("users.json read on a cache hit"))
+    users_file({})
+
+    assert current_user(token).email == "a@b.com"
@@ -0,0 +1,106 @@
+import random
+
+import numpy as np
+import pytest
+
+from backend.vectordb import bm25
+from backend.vectordb.bm25 import BM25Index, BM25Writer, bm25_supports_delta, tokenize
+
+WORDS = [f"w{i}" for i in range(40)]
+QUERIES = ["w1 w2", "w5", "w10 w11 w12 w13", " ".join(WORDS)]
+
+
+def random_docs(rng, source, n):
+    # Same ids for the same (source, position), like build_faiss.chunk_id
+    return [(source * 1000 + i, " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12)))) for i in range(n)]
+
+
+def build(directory, docs):
+    directory.mkdir(exist_ok=True)
+    writer = BM25Writer(str(directory))
+    for chunks in docs.values():
+        for cid, text in chunks:
+            writer.add(cid, text)
+    writer.commit()
+    return BM25Index(str(directory))
+
+
+def assert_same_results(index, reference):
+    assert index.n_docs == reference.n_docs
+    assert index.meta["total_len"] == reference.meta["total_len"]
+    for query in QUERIES:
+        ids, scores = index.search(query, top_k=1000)
+        ref_ids, ref_scores = reference.search(query, top_k=1000)
+        got = dict(zip(ids.tolist(), scores.tolist()))
+        expected = dict(zip(ref_ids.tolist(), ref_scores.tolist()))
+        assert got.keys() == expected.keys()
+        for cid in got:
+            assert got[cid] == pytest.approx(expected[cid], rel=1e-5)
+
+
+def test_tokenize_strips_accents_and_short_words():
+    assert tokenize("Données à l'École") == ["donnees", "ecole"]
+
+
+def test_search_ranks_matching_chunks(tmp_path):
+    index = build(tmp_path, {0: [(1, "facture client"), (2, "client projet projet"), (3, "diagramme")]})
+
+    ids, scores = index.search("projet", top_k=5)
+    assert ids.tolist() == [2]
+    assert scores[0] > 0
+
+    ids, _ = index.search("client", top_k=5, allowed=np.array([2]))
+    assert ids.tolist() == [2]
+    assert index.search("inconnu", top_k=5)[0].size == 0
+
+
+def test_spilled_runs_merge_like_in_memory(tmp_path, monkeypatch):
+    rng = random.Random(0)
+    docs = {s: random_docs(rng, s, 20) for s in range(5)}
+    reference = build(tmp_path / "memory", docs)
+
+    monkeypatch.setattr(bm25, "SPILL_POSTINGS", 17)
+    monkeypatch.setattr(bm25, "MERGE_PIECE", 13)
+    spilled = build(tmp_path / "spilled", docs)
+
+    assert_same_results(spilled, reference)
+    assert not [p for p in (tmp_path / "spilled").iterdir() if p.suffix == ".tmp"]
+
+
+def test_uploads_add_segments_equivalent_to_a_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(bm25, "MAX_SEGMENTS", 3)
+    rng = random.Random(1)
+    docs = {s: random_docs(rng, s, rng.randint(1, 8)) for s in range(4)}
+    directory = tmp_path / "incremental"
+    build(directory, docs)
+
+    for step in range(8):
+        source = rng.randrange(6)
+        old_ids = [cid for cid, _ in docs.get(source, [])]
+        docs[source] = random_docs(rng, source, rng.randint(0, 8))
+
+        writer = BM25Writer(str(directory), base=BM25Index(str(directory)), remove_ids=np.array(old_ids, dtype="int64"))
+        for cid, text in docs[source]:
+            writer.add(cid, text)
+        writer.commit()
+
+        index = BM25Index(str(directory))
+        assert len(index.segments) <= 3
+        assert_same_results(index, build(tmp_path / f"rebuild{step}", docs))
+
+
+def test_old_single_segment_layout_is_read_but_not_extended(tmp_path):
+    build(tmp_path, {0: [(1, "hello world"), (2, "hello there")]})
+    (name,) = BM25Index(str(tmp_path)).meta["segments"]
+
+    # Rename to the layout of indexes built before segments
+    for column in bm25.COLUMNS:
+        (tmp_path / f"bm25_{name}_{column}.npy").rename(tmp_path / f"bm25_{column}.npy")
+    meta_path = tmp_path / "bm25_meta.json"
+    meta_path.write_text(meta_path.read_text().replace(f', "segments": ["{name}"]', ""))
+
+    index = BM25Index(str(tmp_path))
+    assert sorted(index.search("hello", top_k=5)[0].tolist()) == [1, 2]
+    assert not bm25_supports_delta(str(tmp_path))
+    with pytest.raises(ValueError):
+        BM25Writer(str(tmp_path), base=index)
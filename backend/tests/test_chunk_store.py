@@ -0,0 +1,48 @@
+import numpy as np
+
+from backend.vectordb.chunk_store import ChunkStore, ChunkStoreWriter, chunk_store_exists
+
+
+def write_store(directory, rows):
+    directory.mkdir(exist_ok=True)
+    writer = ChunkStoreWriter(str(directory))
+    for cid, source, page, text in rows:
+        writer.add(cid, source, page, text)
+    writer.commit()
+    return ChunkStore(str(directory))
+
+
+def test_rows_round_trip(tmp_path):
+    store = write_store(tmp_path, [(30, "a.pdf", 1, "premier"), (10, "b.pdf", 2, "deuxième é"), (20, "a.pdf", 3, "")])
+
+    assert chunk_store_exists(str(tmp_path))
+    assert len(store) == 3
+    assert store.get(10) == {"id": 10, "text": "deuxième é", "source": "b.pdf", "page": 2}
+    assert store.get(20)["text"] == ""
+    assert store.get(99) is None
+
+
+def test_copy_from_keeps_selected_rows(tmp_path):
+    store = write_store(tmp_path / "old", [(i, f"doc{i % 2}", i, f"text {i}") for i in range(6)])
+
+    writer = ChunkStoreWriter(str(tmp_path / "old"))
+    writer.copy_from(store, np.array([True, True, False, True, False, True]))
+    writer.add(100, "new.pdf", 1, "nouveau")
+    writer.commit()
+
+    copied = ChunkStore(str(tmp_path / "old"))
+    assert sorted(copied.ids.tolist()) == [0, 1, 3, 5, 100]
+    assert copied.get(3) == {"id": 3, "text": "text 3", "source": "doc1", "page": 3}
+    assert copied.get(100)["source"] == "new.pdf"
+
+
+def test_abort_leaves_the_published_store(tmp_path):
+    write_store(tmp_path, [(1, "a", 1, "kept")])
+
+    writer = ChunkStoreWriter(str(tmp_path))
+    writer.add(2, "b", 1, "dropped")
+    writer.abort()
+
+    store = ChunkStore(str(tmp_path))
+    assert store.ids.tolist() == [1]
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
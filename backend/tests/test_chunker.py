@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+
+from backend.ingestion import chunker
+from backend.ingestion.chunker import iter_text_windows, split_windows
+
+
+class StrideSplitter:
+    """Fixed-size chunks every size - overlap characters: easy to predict."""
+
+    def __init__(self, size, overlap):
+        self.size, self.overlap = size, overlap
+
+    def split_text(self, text):
+        chunks = [text[i:i + self.size] for i in range(0, len(text), self.size - self.overlap)]
+        return [c for c in chunks if c.strip()]
+
+
+TEXT = "".join(f"Sentence number {i} says something about invoices.\n" for i in range(200))
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    text_dir, chunks_dir = tmp_path / "text", tmp_path / "chunks"
+    text_dir.mkdir()
+    monkeypatch.setattr(chunker, "TEXT_INPUT_PATH", str(text_dir))
+    monkeypatch.setattr(chunker, "CHUNKS_OUTPUT_PATH", str(chunks_dir))
+    monkeypatch.setattr(chunker, "CHUNK_MANIFEST_PATH", str(chunks_dir / ".chunk_manifest.json"))
+    monkeypatch.setattr(chunker, "CHUNK_MANIFEST_LOCK", str(chunks_dir / ".chunk_manifest.json.lock"))
+    return text_dir
+
+
+def test_chunks_run_across_window_boundaries(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text(TEXT, encoding="utf-8")
+    splitter = StrideSplitter(size=120, overlap=30)
+
+    windowed = list(split_windows(iter_text_windows(str(path), block_size=256), splitter, 30))
+
+    # Same chunks, with their overlap, as splitting the whole file at once
+    assert windowed == splitter.split_text(TEXT)
+
+
+def test_text_without_line_breaks_is_still_chunked(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("word " * 300, encoding="utf-8")
+    splitter = StrideSplitter(size=100, overlap=20)
+
+    assert list(split_windows(iter_text_windows(str(path), block_size=64), splitter, 20)) == splitter.split_text("word " * 300)
+
+
+def test_uploaded_file_is_recorded_in_the_manifest(dirs):
+    (dirs / "upload.pdf.txt").write_text(TEXT, encoding="utf-8")
+    (dirs / "other.pdf.txt").write_text(TEXT[:500], encoding="utf-8")
+
+    chunker.chunk_file("upload.pdf.txt")
+
+    manifest = chunker.load_chunk_manifest()
+    assert manifest["upload.pdf.txt"]["chunk_size"] == chunker.CHUNK_SIZE
+    # The next change-aware run only chunks the file nobody chunked yet
+    sources = {source for source, _, _ in chunker.iter_chunks(workers=1)}
+    assert sources == {"other.pdf"}
+    assert set(chunker.load_chunk_manifest()) == {"upload.pdf.txt", "other.pdf.txt"}
@@ -0,0 +1,135 @@
+import pytest
+
+from backend.llm import context_builder
+from backend.llm.context_builder import build_context, drop_near_duplicates, merge_neighbours, overlap_length
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """No tokenizer: counts are the characters / 4 estimate, whatever is installed."""
+    monkeypatch.setattr(context_builder, "_tokenizer", None)
+
+
+def hit(source, page, text):
+    return {"source": source, "page": page, "text": text}
+
+
+# ---------- MERGE ----------
+def test_overlap_length_finds_the_repeated_edge():
+    assert overlap_length("the invoice is sent monthly", "sent monthly by email") == len("sent monthly")
+    # Shorter common edges are a coincidence
+    assert overlap_length("an apple", "le tree") == 0
+
+
+def test_neighbours_are_merged_without_the_overlap():
+    results = [
+        hit("a.pdf", 2, "Payment is due in 30 days. Late fees apply."),
+        hit("a.pdf", 1, "Invoices are sent monthly. Payment is due in 30 days."),
+    ]
+
+    [passage] = merge_neighbours(results)
+
+    assert passage["text"] == "Invoices are sent monthly. Payment is due in 30 days. Late fees apply."
+    assert passage["pages"] == [1, 2]
+    assert passage["rank"] == 0
+
+
+def test_non_adjacent_chunks_and_other_sources_stay_apart():
+    results = [
+        hit("a.pdf", 1, "first chunk of a"),
+        hit("b.pdf", 2, "second chunk of b"),
+        hit("a.pdf", 3, "third chunk of a"),
+        hit("a.pdf", 1, "first chunk of a"),
+    ]
+
+    passages = merge_neighbours(results)
+
+    assert [(p["source"], p["pages"], p["rank"]) for p in passages] == [
+        ("a.pdf", [1], 0),
+        ("b.pdf", [2], 1),
+        ("a.pdf", [3], 2),
+    ]
+
+
+def test_neighbours_without_overlap_are_joined_on_a_new_line():
+    [passage] = merge_neighbours([hit("a.pdf", 4, "Section one ends here."), hit("a.pdf", 5, "Section two.")])
+
+    assert passage["text"] == "Section one ends here.\nSection two."
+
+
+# ---------- DE-DUPLICATE ----------
+def test_near_duplicates_keep_the_better_ranked_passage():
+    text = "the client portal lets customers download every invoice of the current year"
+    passages = [
+        {"text": text, "source": "a.pdf", "pages": [1], "rank": 0},
+        {"text": "unrelated passage about the project schedule and its milestones", "source": "b.pdf",
+         "pages": [1], "rank": 1},
+        {"text": text + " online", "source": "a (copy).pdf", "pages": [1], "rank": 2},
+    ]
+
+    kept = drop_near_duplicates(passages)
+
+    assert [p["source"] for p in kept] == ["a.pdf", "b.pdf"]
+
+
+def test_partial_overlap_below_threshold_is_kept():
+    passages = [
+        {"text": "one two three four five six", "rank": 0},
+        {"text": "four five six seven eight nine ten eleven", "rank": 1},
+    ]
+
+    assert len(drop_near_duplicates(passages, threshold=0.8)) == 2
+
+
+# ---------- PACKING ----------
+def test_passages_are_packed_best_ranked_first_within_the_budget():
+    results = [
+        hit("a.pdf", 1, "a" * 400),   # 100 tokens
+        hit("b.pdf", 1, "b" * 400),   # 100 tokens: over what is left
+        hit("c.pdf", 1, "c" * 40),    # 10 tokens: still fits
+    ]
+
+    context, stats = build_context(results, budget=120)
+
+    assert context == "a" * 400 + context_builder.CONTEXT_SEPARATOR + "c" * 40
+    assert stats["passages"] == 2
+    assert stats["tokens"] <= 120
+    assert stats["tokens_saved"] > 0
+
+
+def test_an_oversized_best_passage_is_truncated():
+    context, stats = build_context([hit("a.pdf", 1, "x" * 1000)], budget=50)
+
+    assert context == "x" * 200
+    assert stats["tokens"] == 50
+
+
+def test_merges_and_duplicates_are_counted():
+    text = "invoices are sent monthly to every client of the company by email"
+    results = [
+        hit("a.pdf", 1, "Invoices are sent monthly."),
+        hit("a.pdf", 2, "Payment is due in 30 days."),
+        hit("b.pdf", 7, text),
+        hit("c.pdf", 3, text),
+    ]
+
+    _, stats = build_context(results, budget=1000)
+
+    assert stats["chunks"] == 4
+    assert stats["merged"] == 1
+    assert stats["duplicates"] == 1
+    assert stats["passages"] == 2
+
+
+def test_no_results_is_an_empty_context():
+    assert build_context([]) == ("", {
+        "chunks": 0, "passages": 0, "merged": 0, "duplicates": 0, "tokens": 0, "tokens_saved": 0,
+    })
+
+
+def test_requests_never_load_the_tokenizer(monkeypatch):
+    monkeypatch.setattr(context_builder, "_load_tokenizer", lambda: pytest.fail("loaded on a request"))
+
+    build_context([hit("a.pdf", 1, "some text")])
+
+    assert context_builder.get_tokenizer() is None
@@ -0,0 +1,79 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+# build_faiss imports the chunker
+pytest.importorskip("langchain_text_splitters")
+
+from backend.vectordb import build_faiss
+from backend.vectordb.bm25 import BM25Index, BM25Writer
+from backend.vectordb.chunk_store import ChunkStore, ChunkStoreWriter
+from backend.vectordb.index_version import VERSION_BUILDING, read_index_version
+
+
+@pytest.fixture
+def faiss_dir(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    for name, filename in [("FAISS_DIR", ""), ("FAISS_PATH", "index.faiss"), ("VERSION_PATH", "index.version"),
+                           ("MANIFEST_PATH", "manifest.json"), ("INDEX_CONFIG_PATH", "index_config.json")]:
+        monkeypatch.setattr(build_faiss, name, os.path.join(directory, filename))
+    monkeypatch.setattr(build_faiss, "LEGACY_PATHS", [])
+    return directory
+
+
+def publish(directory, texts):
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(2))
+    store_writer, bm25_writer = ChunkStoreWriter(directory), BM25Writer(directory)
+    for cid, text in enumerate(texts):
+        index.add_with_ids(np.ones((1, 2), dtype="float32"), np.array([cid], dtype="int64"))
+        store_writer.add(cid, "a.pdf", cid + 1, text)
+        bm25_writer.add(cid, text)
+    return build_faiss.publish_index(index, store_writer, {"a.pdf": {}}, {"type": "flat"}, bm25_writer)
+
+
+def test_publish_bumps_the_version(faiss_dir):
+    version = publish(faiss_dir, ["first build"])
+
+    assert read_index_version(build_faiss.VERSION_PATH) == version
+    assert faiss.read_index(build_faiss.FAISS_PATH).ntotal == 1
+    assert ChunkStore(faiss_dir).get(0)["text"] == "first build"
+    assert not [name for name in os.listdir(faiss_dir) if name.endswith(".tmp")]
+
+
+def test_failure_while_staging_leaves_the_live_build_alone(faiss_dir, monkeypatch):
+    version = publish(faiss_dir, ["first build"])
+
+    def broken_stage(self):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(BM25Writer, "stage", broken_stage)
+    with pytest.raises(OSError):
+        publish(faiss_dir, ["second build", "with more chunks"])
+    build_faiss.remove_build_leftovers()
+
+    # Nothing was renamed: same version, index, chunks and BM25 as before
+    assert read_index_version(build_faiss.VERSION_PATH) == version
+    assert faiss.read_index(build_faiss.FAISS_PATH).ntotal == 1
+    assert ChunkStore(faiss_dir).get(0)["text"] == "first build"
+    assert BM25Index(faiss_dir).search("first", 5)[0].tolist() == [0]
+    assert not [name for name in os.listdir(faiss_dir) if name.endswith(".tmp")]
+
+
+def test_failed_rename_keeps_readers_off_the_mixed_build(faiss_dir, monkeypatch):
+    publish(faiss_dir, ["first build"])
+
+    real_replace = os.replace
+
+    def replace(src, dst):
+        if dst.endswith("chunks_text.bin"):
+            raise OSError("rename failed")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(build_faiss.os, "replace", replace)
+    with pytest.raises(OSError):
+        publish(faiss_dir, ["second build"])
+
+    # The index was already renamed, the chunks were not: never claim a version
+    assert read_index_version(build_faiss.VERSION_PATH) == VERSION_BUILDING
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+# backend.main imports the whole app, ingestion included
+pytest.importorskip("langchain_text_splitters")
+
+from fastapi.testclient import TestClient
+
+from backend.auth import UserOut, get_current_user
+from backend.ingestion import jobs
+from backend.main import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.db"))
+    # Connections are per thread: drop the ones opened on another database
+    monkeypatch.setattr(jobs, "_local", jobs.threading.local())
+    app.dependency_overrides[get_current_user] = lambda: UserOut(email="admin@example.com", role="admin")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def wait_for(client, job_id):
+    for _ in range(200):
+        job = client.get(f"/upload/jobs/{job_id}").json()
+        if job["status"] in ("success", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_rebuild_runs_as_a_background_job(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "build_faiss", lambda **kwargs: calls.append(kwargs))
+
+    response = client.post("/upload/rebuild")
+
+    assert response.status_code == 202
+    job = wait_for(client, response.json()["job_id"])
+    assert (job["kind"], job["status"], job["progress"]) == ("rebuild", "success", 1.0)
+    assert "rebuilding" in job["timings"]
+    assert calls == [{"chunking": {"force": True}}]
+
+
+def test_failed_rebuild_is_reported_on_the_job(client, monkeypatch):
+    def broken(**kwargs):
+        raise RuntimeError("No chunks to index")
+
+    monkeypatch.setattr(jobs, "build_faiss", broken)
+
+    job = wait_for(client, client.post("/upload/rebuild").json()["job_id"])
+
+    assert job["status"] == "failed"
+    assert job["stage"] == "rebuilding"
+    assert job["error"] == "RuntimeError: No chunks to index"
@@ -0,0 +1,95 @@
+import math
+
+import faiss
+import numpy as np
+import pytest
+
+from backend.vectordb import retriever as retriever_module
+from backend.vectordb.bm25 import BM25Index, BM25Writer
+from backend.vectordb.chunk_store import ChunkStore, ChunkStoreWriter
+from backend.vectordb.retriever import IndexSnapshot, Retriever
+
+DIM = 4
+E = np.eye(DIM, dtype="float32")
+
+CHUNKS = [
+    (1, "terms.pdf", 1, "invoice payment terms", E[0]),
+    (2, "template.pdf", 1, "invoice template", (E[0] + math.sqrt(3) * E[1]) / 2),  # cos 0.5 with E[0]
+    (3, "plan.pdf", 1, "project schedule", E[2]),
+]
+
+QUERY_VECTORS = {
+    "invoice": E[0],
+    # Shares the word, not the meaning: nothing in the corpus is close
+    "invoice of a sourdough bakery": E[3],
+}
+
+
+def make_index(kind):
+    if kind == "flat":
+        return faiss.IndexIDMap(faiss.IndexFlatIP(DIM))
+    if kind == "hnsw":
+        return faiss.IndexIDMap2(faiss.IndexHNSWFlat(DIM, 4, faiss.METRIC_INNER_PRODUCT))
+    # One list per chunk, one probed: a query only reaches its nearest chunk
+    index = faiss.IndexIVFFlat(faiss.IndexFlatIP(DIM), DIM, len(CHUNKS), faiss.METRIC_INNER_PRODUCT)
+    index.train(np.stack([vector for *_, vector in CHUNKS]))
+    index.nprobe = 1
+    return index
+
+
+@pytest.fixture(params=["flat", "hnsw", "ivf_flat"])
+def retriever(request, tmp_path, monkeypatch):
+    store_writer, bm25_writer = ChunkStoreWriter(str(tmp_path)), BM25Writer(str(tmp_path))
+    index = make_index(request.param)
+    for cid, source, page, text, vector in CHUNKS:
+        store_writer.add(cid, source, page, text)
+        bm25_writer.add(cid, text)
+        index.add_with_ids(vector.reshape(1, -1), np.array([cid], dtype="int64"))
+    store_writer.commit()
+    bm25_writer.commit()
+
+    monkeypatch.setattr(retriever_module, "embed_query", lambda query: QUERY_VECTORS[query])
+    monkeypatch.setattr(retriever_module, "embed_queries", lambda queries: np.stack([QUERY_VECTORS[q] for q in queries]))
+    monkeypatch.setattr(retriever_module, "RELOAD_CHECK_INTERVAL", math.inf)
+
+    snapshot = IndexSnapshot(index, ChunkStore(str(tmp_path)), "v1", {"type": request.param, "metric": "ip"}, BM25Index(str(tmp_path)))
+    instance = Retriever.__new__(Retriever)
+    instance._snapshot = snapshot
+    instance._reload_lock = None
+    instance._last_check = 0.0
+    return instance
+
+
+def scores(results):
+    return {hit["id"]: hit["score"] for hit in results}
+
+
+def test_keyword_hits_are_unscored_without_a_threshold(retriever):
+    assert scores(retriever.search("invoice", top_k=3, mode="keyword")) == {1: None, 2: None}
+
+
+def test_keyword_hits_are_scored_by_the_dense_model(retriever):
+    # Exact cosine similarity, even for chunks the ANN search does not reach
+    results = retriever.search("invoice", top_k=3, mode="keyword", min_score=0.0)
+
+    assert scores(results) == {1: pytest.approx(1.0), 2: pytest.approx(0.5)}
+    assert scores(retriever.search("invoice", top_k=3, mode="keyword", min_score=0.9)) == {1: pytest.approx(1.0)}
+
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid", "keyword", "auto"])
+def test_off_topic_query_is_gated_in_every_mode(retriever, mode):
+    assert retriever.search("invoice of a sourdough bakery", top_k=3, mode=mode) != []
+    assert retriever.search("invoice of a sourdough bakery", top_k=3, mode=mode, min_score=0.5) == []
+
+
+@pytest.mark.parametrize("mode", ["hybrid", "keyword", "auto"])
+def test_batch_gates_like_single_searches(retriever, mode):
+    queries = list(QUERY_VECTORS)
+
+    batch = retriever.search_batch(queries, top_k=3, mode=mode, min_score=0.4)
+
+    assert [scores(results) for results in batch] == [
+        scores(retriever.search(query, top_k=3, mode=mode, min_score=0.4)) for query in queries
+    ]
+    assert scores(batch[0]) == {1: pytest.approx(1.0), 2: pytest.approx(0.5)}
+    assert batch[1] == []
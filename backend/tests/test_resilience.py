@@ -0,0 +1,227 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.llm import llm, providers
+from backend.llm.resilience import CircuitBreaker, ConcurrencyLimiter, LLMUnavailable, backoff_delay
+
+CONTEXT = "Invoices are sent monthly. Payment is due in 30 days."
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """The fake provider with no simulated latency and a fresh breaker / limiter."""
+    monkeypatch.setattr(llm, "get_provider", lambda: providers.FakeProvider())
+    monkeypatch.setattr(providers, "FAKE_FIRST_TOKEN_MS", 0)
+    monkeypatch.setattr(providers, "FAKE_TOKEN_MS", 0)
+    monkeypatch.setattr(providers, "FAKE_ERROR_RATE", 0)
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker(failure_threshold=2, reset_timeout=0.05))
+    monkeypatch.setattr(llm, "limiter", ConcurrencyLimiter(limit=4, queue_timeout=1))
+    return monkeypatch
+
+
+# ---------- CIRCUIT BREAKER ----------
+def test_breaker_opens_probes_and_recovers(fake_llm):
+    breaker = llm.breaker
+    fake_llm.setattr(providers, "FAKE_ERROR_RATE", 1.0)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            llm.generate_answer("When are invoices sent?", CONTEXT)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: rejected without calling the provider
+    with pytest.raises(LLMUnavailable, match="circuit open") as rejected:
+        llm.generate_answer("When are invoices sent?", CONTEXT)
+    assert rejected.value.retry_after > 0
+
+    # Half-open: the failing probe re-opens the circuit
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(LLMUnavailable, match="failed"):
+        llm.generate_answer("When are invoices sent?", CONTEXT)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Half-open again: the provider is back, the probe closes the circuit
+    time.sleep(0.06)
+    fake_llm.setattr(providers, "FAKE_ERROR_RATE", 0)
+    assert llm.generate_answer("When are invoices sent?", CONTEXT) == "Invoices are sent monthly"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_stream_failures_open_the_circuit(fake_llm):
+    fake_llm.setattr(providers, "FAKE_ERROR_RATE", 1.0)
+
+    async def consume():
+        return [token async for token in llm.stream_answer("When are invoices sent?", CONTEXT)]
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            asyncio.run(consume())
+    assert llm.breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    fake_llm.setattr(providers, "FAKE_ERROR_RATE", 0)
+    assert "".join(asyncio.run(consume())) == "Invoices are sent monthly"
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+# ---------- RETRIES ----------
+def test_transient_errors_are_retried(fake_llm):
+    fake_llm.setattr(llm, "LLM_MAX_RETRIES", 2)
+    fake_llm.setattr(llm, "LLM_BACKOFF_BASE", 0.001)
+    fake_llm.setattr(llm, "LLM_BACKOFF_MAX", 0.001)
+
+    provider = providers.FakeProvider()
+    failures = iter([ConnectionError("down"), ConnectionError("down")])
+    calls = []
+
+    def flaky(question, context, timeout):
+        calls.append(timeout)
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return providers.fake_answer(question, context)
+
+    provider.complete = flaky
+    fake_llm.setattr(llm, "get_provider", lambda: provider)
+
+    assert llm.generate_answer("When are invoices sent?", CONTEXT) == "Invoices are sent monthly"
+    assert len(calls) == 3
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_give_up_after_max_retries(fake_llm):
+    fake_llm.setattr(providers, "FAKE_ERROR_RATE", 1.0)
+    fake_llm.setattr(llm, "LLM_MAX_RETRIES", 2)
+    fake_llm.setattr(llm, "LLM_BACKOFF_BASE", 0.001)
+    fake_llm.setattr(llm, "breaker", CircuitBreaker(failure_threshold=5, reset_timeout=1))
+
+    with pytest.raises(LLMUnavailable, match="ConnectionError"):
+        llm.generate_answer("When are invoices sent?", CONTEXT)
+    # One failed call (all its attempts) counts once against the circuit
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backoff_delay_is_capped_and_honours_retry_after():
+    delays = [backoff_delay(attempt, base=0.5, cap=2.0) for attempt in range(10) for _ in range(20)]
+
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert backoff_delay(0, base=0.5, cap=2.0, retry_after=5.0) == 5.0
+
+
+# ---------- CONCURRENCY ----------
+def test_limiter_rejects_after_queue_timeout():
+    limiter = ConcurrencyLimiter(limit=1, queue_timeout=0.05)
+
+    with limiter.slot():
+        with pytest.raises(LLMUnavailable, match="busy"):
+            with limiter.slot():
+                pass
+
+        async def wait_async():
+            async with limiter.async_slot():
+                pass
+
+        with pytest.raises(LLMUnavailable, match="busy"):
+            asyncio.run(wait_async())
+
+    assert limiter.in_flight == 0
+    assert limiter.waiting == 0
+
+
+def test_async_waiter_wakes_when_a_thread_releases():
+    limiter = ConcurrencyLimiter(limit=1, queue_timeout=5)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with limiter.slot():
+            held.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+
+    async def wait_for_slot():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, release.set)
+        async with limiter.async_slot() as waited:
+            assert limiter.in_flight == 1
+            return waited
+
+    waited = asyncio.run(wait_for_slot())
+    holder.join()
+
+    assert 0.04 <= waited < 1
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_async_waiter_passes_the_slot_on():
+    limiter = ConcurrencyLimiter(limit=1, queue_timeout=5)
+
+    async def scenario():
+        order = []
+
+        async def worker(name, hold=0.0):
+            async with limiter.async_slot():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.create_task(worker("first", hold=0.05))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(worker("cancelled"))
+        last = asyncio.create_task(worker("last"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+
+        await asyncio.wait_for(asyncio.gather(first, last), timeout=1)
+        return order
+
+    assert asyncio.run(scenario()) == ["first", "last"]
+    assert limiter.in_flight == 0
+    assert limiter.waiting == 0
+
+
+def test_limiter_caps_threads_and_coroutines_together():
+    limiter = ConcurrencyLimiter(limit=2, queue_timeout=5)
+    peak = []
+
+    def record():
+        peak.append(limiter.in_flight)
+        time.sleep(0.01)
+
+    def sync_worker():
+        with limiter.slot():
+            record()
+
+    async def async_workers():
+        async def one():
+            async with limiter.async_slot():
+                peak.append(limiter.in_flight)
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*(one() for _ in range(6)))
+
+    threads = [threading.Thread(target=sync_worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(async_workers())
+    for thread in threads:
+        thread.join()
+
+    assert len(peak) == 12
+    assert max(peak) <= 2
+    assert limiter.in_flight == 0
@@ -0,0 +1,28 @@
+import pytest
+
+# backend.main imports the whole app, ingestion included
+pytest.importorskip("langchain_text_splitters")
+
+from fastapi.testclient import TestClient
+
+from backend.auth import UserOut, get_current_user
+from backend.main import app
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_current_user] = lambda: UserOut(email="user@example.com", role="user")
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/ask", {"question": "q", "filters": {"bogus": 1}}),
+    ("/ask/stream", {"question": "q", "filters": {"source": "a.pdf", "pages_min": 2}}),
+    ("/ask/batch", {"questions": ["q"], "filters": {"bogus": 1}}),
+])
+def test_unknown_filter_is_rejected(client, path, payload):
+    response = client.post(path, json=payload)
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "extra_forbidden"
@@ -1,18 +1,16 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 import os
+import uuid
 import shutil
 
-from backend.ingestion.document_loader import extract_single_file
-from backend.ingestion.chunker import chunk_documents
-from backend.vectordb.build_faiss import build_faiss
+from backend.ingestion.jobs import submit_job, submit_rebuild, get_job, QueueFullError
 from backend.auth import get_current_user
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
 RAW_DIR = os.path.join("data", "raw")
-os.makedirs(RAW_DIR, exist_ok=True)
 
-@router.post("/")
+@router.post("/", status_code=202)
 def upload_document(
     file: UploadFile = File(...),
     user=Depends(get_current_user),
@@ -26,22 +24,56 @@ def upload_document(
 
     file_path = os.path.join(RAW_DIR, file.filename)
 
-    # 1️⃣ Save file
-    with open(file_path, "wb") as buffer:
+    # 1️⃣ Save file under a name of its own: the job moves it to file_path
+    # once it holds the file lock, so a running job of the same file keeps its input
+    os.makedirs(RAW_DIR, exist_ok=True)
+    upload_path = os.path.join(RAW_DIR, f".{uuid.uuid4().hex}.upload")
+    with open(upload_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
-    # 2️⃣ Extract text → data/text
-    extract_single_file(file_path, file.filename)
+    # 2️⃣ Extract → chunk → embed → index in the background
+    try:
+        job = submit_job(file_path, file.filename, upload_path)
+    except QueueFullError as e:
+        os.remove(upload_path)
+        raise HTTPException(status_code=429, detail=str(e))
 
-    # 3️⃣ Chunk documents (UNCHANGED chunker)
-    chunk_documents()
+    return {
+        "status": "queued",
+        "filename": file.filename,
+        "job_id": job.id,
+        "message": "Document queued for indexing",
+        "next_step": f"Poll /upload/jobs/{job.id} until status is success"
+    }
+
+
+@router.get("/jobs/{job_id}")
+def read_job(job_id: str, user=Depends(get_current_user)):
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
 
-    # 4️⃣ Rebuild FAISS index
-    build_faiss()
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    return job.to_dict()
+
+
+@router.post("/rebuild", status_code=202)
+def rebuild_index(user=Depends(get_current_user)):
+    # 🔐 Admin-only: re-chunk and re-embed the whole corpus
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+
+    # Runs in the background, like uploads
+    try:
+        job = submit_rebuild()
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
 
     return {
-        "status": "success",
-        "filename": file.filename,
-        "message": "Document indexed successfully",
-        "next_step": "Ask a question explicitly related to this document"
+        "status": "queued",
+        "job_id": job.id,
+        "message": "Index rebuild queued",
+        "next_step": f"Poll /upload/jobs/{job.id} until status is success"
     }
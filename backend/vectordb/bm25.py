@@ -0,0 +1,401 @@
+"""
+Compact BM25 inverted index, built next to the FAISS index.
+
+    bm25_vocab.json         term -> term id (shared by every segment)
+    bm25_meta.json          n_docs, total_len, k1, b, segments
+
+and for each segment (one per full build, plus one per upload):
+
+    bm25_<seg>_offsets.npy  int64 [V + 1]  postings of term t = [offsets[t]:offsets[t + 1]]
+    bm25_<seg>_ids.npy      int64 [P]      chunk id of each posting
+    bm25_<seg>_tf.npy       int32 [P]      term frequency in that chunk
+    bm25_<seg>_dl.npy       int32 [P]      length (tokens) of that chunk
+    bm25_<seg>_docs.npy     int64 [N]      chunk ids of the segment, sorted
+    bm25_<seg>_doclen.npy   int32 [N]      their lengths
+    bm25_<seg>_deleted.npy  int64          chunk ids removed by later uploads
+
+Postings are keyed by chunk id (like the FAISS IndexIDMap). An upload
+writes its document as a new segment and marks the ids of the previous
+version deleted in the older ones, without reading or rewriting their
+postings. Past MAX_SEGMENTS, segments are merged back into one.
+"""
+
+import os
+import re
+import json
+import time
+import unicodedata
+from array import array
+from collections import Counter
+
+import numpy as np
+
+PREFIX = "bm25"
+COLUMNS = ("offsets", "ids", "tf", "dl")
+SEGMENT_FILES = COLUMNS + ("docs", "doclen", "deleted")
+K1 = 1.2
+B = 0.75
+
+# Postings a writer keeps in memory before spilling them, sorted, to disk
+SPILL_POSTINGS = int(os.getenv("BM25_SPILL_POSTINGS", str(1 << 22)))
+# Postings read at a time while merging runs / segments
+MERGE_PIECE = 1 << 20
+# Uploads add one segment each; past this many they are merged into one
+MAX_SEGMENTS = int(os.getenv("BM25_MAX_SEGMENTS", "8"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str):
+    """Lowercase, strip accents (données == donnees), keep words of 2+ chars."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [w for w in _WORD_RE.findall(text) if len(w) > 1]
+
+
+def _path(directory: str, name: str, segment: str = None) -> str:
+    if name in ("vocab", "meta"):
+        return os.path.join(directory, f"{PREFIX}_{name}.json")
+    if segment is None:
+        # Single-segment layout of older builds
+        return os.path.join(directory, f"{PREFIX}_{name}.npy")
+    return os.path.join(directory, f"{PREFIX}_{segment}_{name}.npy")
+
+
+def _load_meta(directory: str) -> dict:
+    with open(_path(directory, "meta"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bm25_exists(directory: str) -> bool:
+    return os.path.exists(_path(directory, "meta"))
+
+
+def bm25_supports_delta(directory: str) -> bool:
+    """False for indexes built before segments: uploads cannot extend them."""
+    return bm25_exists(directory) and "segments" in _load_meta(directory)
+
+
+class BM25Segment:
+    """Postings of one build or upload (mmap-backed), minus the deleted chunks."""
+
+    def __init__(self, directory: str, name: str = None):
+        self.name = name
+        self.offsets = np.load(_path(directory, "offsets", name), mmap_mode="r")
+        self.ids = np.load(_path(directory, "ids", name), mmap_mode="r")
+        self.tf = np.load(_path(directory, "tf", name), mmap_mode="r")
+        self.dl = np.load(_path(directory, "dl", name), mmap_mode="r")
+
+        self.doc_ids = self.doc_len = None
+        if name is not None:
+            self.doc_ids = np.load(_path(directory, "docs", name), mmap_mode="r")
+            self.doc_len = np.load(_path(directory, "doclen", name), mmap_mode="r")
+
+        deleted_path = _path(directory, "deleted", name)
+        self.deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(0, dtype="int64")
+
+    def postings(self, term_id: int):
+        """(ids, tf, dl) of a term, None if it has no live posting here."""
+        # Terms added to the vocabulary after this segment was written
+        if term_id + 1 >= len(self.offsets):
+            return None
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+        if start == end:
+            return None
+
+        ids = np.asarray(self.ids[start:end])
+        tf = np.asarray(self.tf[start:end])
+        dl = np.asarray(self.dl[start:end])
+        if len(self.deleted):
+            keep = ~np.isin(ids, self.deleted)
+            ids, tf, dl = ids[keep], tf[keep], dl[keep]
+        return (ids, tf, dl) if len(ids) else None
+
+    def live_docs(self, ids):
+        """(ids, lengths) of the given chunk ids that are live in this segment."""
+        ids = np.setdiff1d(np.asarray(ids, dtype="int64"), self.deleted)
+        if not len(ids) or not len(self.doc_ids):
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="int32")
+        pos = np.minimum(np.searchsorted(self.doc_ids, ids), len(self.doc_ids) - 1)
+        found = np.asarray(self.doc_ids[pos]) == ids
+        return ids[found], np.asarray(self.doc_len[pos[found]])
+
+
+class BM25Index:
+    """Read-only BM25 index over every segment."""
+
+    def __init__(self, directory: str):
+        with open(_path(directory, "vocab"), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.meta = _load_meta(directory)
+
+        self.segments = [BM25Segment(directory, name) for name in self.meta.get("segments", [None])]
+
+        self.n_docs = self.meta["n_docs"]
+        self.avgdl = self.meta["total_len"] / max(self.n_docs, 1)
+        self.k1 = self.meta["k1"]
+        self.b = self.meta["b"]
+
+    def known_terms(self, query: str):
+        return [t for t in tokenize(query) if t in self.vocab]
+
+    def search(self, query: str, top_k: int = 5, allowed=None):
+        """Returns (chunk ids, scores), best first. `allowed`: sorted eligible ids."""
+        all_ids = []
+        all_scores = []
+
+        for term in set(self.known_terms(query)):
+            found = [p for p in (seg.postings(self.vocab[term]) for seg in self.segments) if p is not None]
+            if not found:
+                continue
+
+            ids = np.concatenate([p[0] for p in found])
+            tf = np.concatenate([p[1] for p in found]).astype("float32")
+            dl = np.concatenate([p[2] for p in found]).astype("float32")
+            df = len(ids)
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+            all_ids.append(ids)
+            all_scores.append(idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / self.avgdl)))
+
+        if not all_ids:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores)).astype("float32")
+
+        if allowed is not None:
+            keep = np.isin(ids, allowed, assume_unique=True)
+            ids, scores = ids[keep], scores[keep]
+
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        return ids[top], scores[top]
+
+
+# ---------- WRITING ----------
+class _SpilledRun:
+    """Postings a writer spilled to disk, sorted by term."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.columns = {name: np.load(f"{path}_{name}.tmp", mmap_mode="r") for name in ("terms", "ids", "tf", "dl")}
+
+    def pieces(self):
+        for start in range(0, len(self.columns["terms"]), MERGE_PIECE):
+            end = start + MERGE_PIECE
+            yield {name: np.asarray(values[start:end]) for name, values in self.columns.items()}
+
+    def remove(self):
+        for name in self.columns:
+            os.remove(f"{self.path}_{name}.tmp")
+
+
+class _SegmentRun:
+    """The live postings of an existing segment, sorted by term, for a merge."""
+
+    def __init__(self, segment: BM25Segment, deleted):
+        self.segment = segment
+        self.deleted = deleted
+
+    def pieces(self):
+        seg = self.segment
+        for start in range(0, len(seg.ids), MERGE_PIECE):
+            end = min(start + MERGE_PIECE, len(seg.ids))
+            piece = {
+                "terms": np.searchsorted(seg.offsets, np.arange(start, end), side="right") - 1,
+                "ids": np.asarray(seg.ids[start:end]),
+                "tf": np.asarray(seg.tf[start:end]),
+                "dl": np.asarray(seg.dl[start:end]),
+            }
+            if len(self.deleted):
+                keep = ~np.isin(piece["ids"], self.deleted)
+                piece = {name: values[keep] for name, values in piece.items()}
+            yield piece
+
+
+class BM25Writer:
+    """
+    Collect the postings of new chunks, then commit() them next to the
+    FAISS index: from scratch, as the only segment; on top of `base`, as
+    a new segment, `remove_ids` being marked deleted in the older ones.
+    Every SPILL_POSTINGS postings go to disk as a sorted run; commit()
+    merges the runs piece by piece, so memory stays bounded.
+    """
+
+    def __init__(self, directory: str, base: BM25Index = None, remove_ids=None):
+        self.directory = directory
+        self.base = base
+        self.vocab = dict(base.vocab) if base else {}
+        self.n_docs = base.meta["n_docs"] if base else 0
+        self.total_len = base.meta["total_len"] if base else 0
+
+        if base is not None and base.segments[0].name is None:
+            raise ValueError("BM25 index predates segments: rebuild it to extend it")
+
+        self._reset_buffer()
+        self._doc_ids = array("q")
+        self._doc_len = array("i")
+        self._runs = []
+        self._segments = None
+
+        # Deleted ids of the base segments after this commit
+        self._deleted = {}
+        if base is not None and remove_ids is not None and len(remove_ids):
+            for seg in base.segments:
+                ids, lengths = seg.live_docs(remove_ids)
+                if len(ids):
+                    # Forget the removed chunks in the collection statistics
+                    self.n_docs -= len(ids)
+                    self.total_len -= int(lengths.sum())
+                    self._deleted[seg.name] = np.union1d(seg.deleted, ids)
+
+    def _reset_buffer(self):
+        self._terms = array("q")
+        self._ids = array("q")
+        self._tf = array("i")
+        self._dl = array("i")
+
+    def add(self, chunk_id: int, text: str):
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        if not length:
+            return
+
+        self.n_docs += 1
+        self.total_len += length
+        self._doc_ids.append(chunk_id)
+        self._doc_len.append(length)
+        for term, tf in counts.items():
+            term_id = self.vocab.setdefault(term, len(self.vocab))
+            self._terms.append(term_id)
+            self._ids.append(chunk_id)
+            self._tf.append(tf)
+            self._dl.append(length)
+
+        if len(self._terms) >= SPILL_POSTINGS:
+            self._spill()
+
+    def _spill(self):
+        terms = np.frombuffer(self._terms, dtype="int64")
+        order = np.argsort(terms, kind="stable")
+        columns = {
+            "terms": terms,
+            "ids": np.frombuffer(self._ids, dtype="int64"),
+            "tf": np.frombuffer(self._tf, dtype="int32"),
+            "dl": np.frombuffer(self._dl, dtype="int32"),
+        }
+
+        path = os.path.join(self.directory, f"{PREFIX}_run{len(self._runs)}")
+        for name, values in columns.items():
+            with open(f"{path}_{name}.tmp", "wb") as f:
+                np.save(f, values[order])
+        self._runs.append(_SpilledRun(path))
+        self._reset_buffer()
+
+    def _write_segment(self, name: str, runs, doc_ids, doc_len):
+        """Merge term-sorted runs into the .tmp files of segment `name`."""
+        n_terms = len(self.vocab)
+        counts = np.zeros(n_terms, dtype="int64")
+        for run in runs:
+            for piece in run.pieces():
+                counts += np.bincount(piece["terms"], minlength=n_terms)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+
+        dtypes = {"ids": "int64", "tf": "int32", "dl": "int32"}
+        out = {
+            column: np.lib.format.open_memmap(
+                _path(self.directory, column, name) + ".tmp", mode="w+", dtype=dtype, shape=(int(offsets[-1]),)
+            )
+            for column, dtype in dtypes.items()
+        }
+
+        # Each posting goes after the ones of the same term from earlier runs / pieces
+        filled = np.zeros(n_terms, dtype="int64")
+        for run in runs:
+            for piece in run.pieces():
+                terms = piece["terms"]
+                rank = np.arange(len(terms)) - np.searchsorted(terms, terms)
+                dest = offsets[terms] + filled[terms] + rank
+                for column in out:
+                    out[column][dest] = piece[column]
+                filled += np.bincount(terms, minlength=n_terms)
+
+        for values in out.values():
+            values.flush()
+        del out
+
+        order = np.argsort(doc_ids, kind="stable")
+        for column, values in (("offsets", offsets), ("docs", doc_ids[order]), ("doclen", doc_len[order])):
+            with open(_path(self.directory, column, name) + ".tmp", "wb") as f:
+                np.save(f, values)
+
+    def stage(self) -> list:
+        """
+        Write the new segment, deletions, vocab and meta as .tmp files.
+        Returns the paths to os.replace (path + ".tmp" -> path), in that
+        order; finish() then drops the files no longer used.
+        """
+        if len(self._terms):
+            self._spill()
+
+        doc_ids = np.frombuffer(self._doc_ids, dtype="int64")
+        doc_len = np.frombuffer(self._doc_len, dtype="int32")
+        deleted = dict(self._deleted)
+        segments = [seg.name for seg in self.base.segments] if self.base else []
+
+        name = f"{time.time_ns():x}"
+        if len(segments) + 1 > MAX_SEGMENTS:
+            # Merge every segment (without its deleted postings) and the new chunks into one
+            runs, all_ids, all_len = [], [], []
+            for seg in self.base.segments:
+                seg_deleted = deleted.get(seg.name, seg.deleted)
+                runs.append(_SegmentRun(seg, seg_deleted))
+                live = ~np.isin(seg.doc_ids, seg_deleted)
+                all_ids.append(np.asarray(seg.doc_ids)[live])
+                all_len.append(np.asarray(seg.doc_len)[live])
+            self._write_segment(
+                name, runs + self._runs, np.concatenate(all_ids + [doc_ids]), np.concatenate(all_len + [doc_len])
+            )
+            segments, deleted = [name], {}
+        elif len(doc_ids) or not segments:
+            self._write_segment(name, self._runs, doc_ids, doc_len)
+            segments.append(name)
+
+        written = [
+            _path(self.directory, column, name) for column in COLUMNS + ("docs", "doclen")
+        ] if name in segments else []
+        for seg_name, ids in deleted.items():
+            with open(_path(self.directory, "deleted", seg_name) + ".tmp", "wb") as f:
+                np.save(f, ids)
+            written.append(_path(self.directory, "deleted", seg_name))
+
+        with open(_path(self.directory, "vocab") + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+
+        meta = {"n_docs": self.n_docs, "total_len": self.total_len, "k1": K1, "b": B, "segments": segments}
+        with open(_path(self.directory, "meta") + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        for run in self._runs:
+            run.remove()
+        self._runs = []
+        self._segments = segments
+
+        # meta goes last: bm25_exists() keys on it
+        return written + [_path(self.directory, "vocab"), _path(self.directory, "meta")]
+
+    def finish(self):
+        self._remove_unused(self._segments)
+
+    def commit(self):
+        for path in self.stage():
+            os.replace(path + ".tmp", path)
+        self.finish()
+
+    def _remove_unused(self, segments):
+        """Files of merged / replaced segments (readers still holding them keep their mmap)."""
+        keep = {_path(self.directory, column, seg) for seg in segments for column in SEGMENT_FILES}
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.startswith(PREFIX + "_") and filename.endswith(".npy") and path not in keep:
+                os.remove(path)
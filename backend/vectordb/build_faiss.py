@@ -1,71 +1,425 @@
 import os
-import pickle
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
 import numpy as np
 import faiss
-from backend.vectordb.embedder import embed_text
+from backend.vectordb.embedding_cache import embed_cached, report_cache_stats
+from backend.vectordb.chunk_store import ChunkStore, ChunkStoreWriter, chunk_store_exists
+from backend.vectordb.bm25 import BM25Index, BM25Writer, bm25_supports_delta
+from backend.vectordb.index_version import VERSION_BUILDING, write_index_version
+from backend.ingestion.chunker import chunk_file, iter_chunk_file, iter_chunks, remove_misnamed_chunk_files
+from backend.vectordb.index_factory import (
+    DEFAULT_INDEX_CONFIG,
+    INDEX_TYPES,
+    resolve_config,
+    make_index,
+    metric_of,
+    normalize_vectors,
+    train_index,
+    apply_search_params,
+    supports_remove,
+    load_index_config,
+    sample_queries,
+    recall_latency_report,
+)
 
+TEXT_PATH = "data/text"
 CHUNKS_PATH = "data/chunks"
-FAISS_DIR = "data/faiss"
+FAISS_DIR = os.getenv("FAISS_DIR", "data/faiss")
 FAISS_PATH = os.path.join(FAISS_DIR, "index.faiss")
-VECTORS_PATH = os.path.join(FAISS_DIR, "vectors.pkl")
-META_PATH = os.path.join(FAISS_DIR, "metadata.pkl")
+# Files of the pickle layout, removed on the next publish
+LEGACY_PATHS = [os.path.join(FAISS_DIR, "vectors.pkl"), os.path.join(FAISS_DIR, "metadata.pkl")]
+VERSION_PATH = os.path.join(FAISS_DIR, "index.version")
+MANIFEST_PATH = os.path.join(FAISS_DIR, "manifest.json")
+INDEX_CONFIG_PATH = os.path.join(FAISS_DIR, "index_config.json")
+REPORT_PATH = os.path.join(FAISS_DIR, "index_report.json")
+# Scratch raw float32 rows the streaming build appends to (then np.memmap)
+VECTORS_BUILD_PATH = os.path.join(FAISS_DIR, "vectors.build.f32")
+LOCK_PATH = os.path.join(FAISS_DIR, ".lock")
 
-os.makedirs(FAISS_DIR, exist_ok=True)
+# Chunks embedded / added to the index per step of a full build
+BUILD_BATCH_SIZE = int(os.getenv("BUILD_BATCH_SIZE", "4096"))
 
 
-def build_faiss():
-    all_chunks = []
-    metadata = []
+# ---------- INDEX LOCK ----------
+_thread_lock = threading.Lock()
 
-    print("📦 Collecting chunks...")
 
-    for filename in os.listdir(CHUNKS_PATH):
+@contextmanager
+def index_lock():
+    """
+    Serialize every read-modify-write of the index files, between threads
+    (ingestion workers) and between processes (uvicorn workers, CLI builds).
+    """
+    with _thread_lock:
+        # Every write to FAISS_DIR happens under this lock
+        os.makedirs(FAISS_DIR, exist_ok=True)
+        with open(LOCK_PATH, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# ---------- MANIFEST (one entry per document) ----------
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return {}
+
+
+def _stage_json(path: str, data) -> str:
+    """Write `data` to path + ".tmp"; returns `path` (os.replace it to publish)."""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def save_manifest(manifest: dict):
+    os.replace(_stage_json(MANIFEST_PATH, manifest) + ".tmp", MANIFEST_PATH)
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id(source_name: str, position: int) -> int:
+    """Stable 63-bit FAISS id for the N-th chunk of a document."""
+    digest = hashlib.sha1(f"{source_name}\x00{position}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def chunk_record(source_name: str, position: int, chunk: str):
+    """(id, metadata) of the chunk at `position` of a document, None if it is blank."""
+    cleaned = chunk.strip()
+    if not cleaned:
+        return None
+
+    cid = chunk_id(source_name, position)
+    return cid, {
+        "id": cid,
+        "text": cleaned,
+        "source": source_name,
+        "page": position + 1
+    }
+
+
+def read_chunk_file(source_name: str):
+    """Yield (id, metadata) for every non-empty chunk of a document."""
+    filepath = os.path.join(CHUNKS_PATH, source_name + "_chunks.txt")
+
+    for i, chunk in enumerate(iter_chunk_file(filepath)):
+        record = chunk_record(source_name, i, chunk)
+        if record is not None:
+            yield record
+
+
+def publish_index(index, store_writer, manifest=None, config=None, bm25_writer=None):
+    """
+    Replace index + chunk store (+ manifest, BM25 index) on disk and bump the version
+    marker. Every file is written as .tmp first, with the live files and the
+    marker untouched: a build failing there leaves readers on the previous
+    version (the caller drops the .tmp files). Only then is the marker set
+    to VERSION_BUILDING and the files renamed, so a Retriever never accepts
+    an index and chunks coming from two different builds. Should a rename
+    fail, the marker stays VERSION_BUILDING: readers keep the snapshot they
+    hold until the next build publishes.
+    """
+    faiss.write_index(index, FAISS_PATH + ".tmp")
+    staged = [FAISS_PATH] + store_writer.stage()
+    if bm25_writer is not None:
+        staged += bm25_writer.stage()
+    if manifest is not None:
+        staged.append(_stage_json(MANIFEST_PATH, manifest))
+    if config is not None:
+        staged.append(_stage_json(INDEX_CONFIG_PATH, config))
+
+    write_index_version(VERSION_BUILDING, VERSION_PATH)
+    for path in staged:
+        os.replace(path + ".tmp", path)
+
+    if bm25_writer is not None:
+        bm25_writer.finish()
+    for path in LEGACY_PATHS:
+        if os.path.exists(path):
+            os.remove(path)
+
+    version = f"{time.time_ns()}"
+    write_index_version(version, VERSION_PATH)
+    return version
+
+
+def remove_build_leftovers(store_writer=None):
+    """Drop the scratch files of a failed build or upload (caller holds the index lock)."""
+    if store_writer is not None:
+        store_writer.abort()
+
+    for name in os.listdir(FAISS_DIR):
+        if name.endswith(".tmp") or name == os.path.basename(VECTORS_BUILD_PATH):
+            os.remove(os.path.join(FAISS_DIR, name))
+
+
+# ---------- FULL REBUILD (admin) ----------
+def build_faiss(config=None, report=True, chunking=None):
+    """
+    Rebuild the whole index. `config` overrides DEFAULT_INDEX_CONFIG
+    (index type, nlist, nprobe, M, ef_search, pq_m...). For approximate
+    index types a recall/latency report against exact search is printed
+    and saved next to the index. `chunking` (iter_chunks arguments, e.g.
+    {"force": True}) chunks data/text in the same pipeline first.
+    """
+    with index_lock():
+        _build_faiss_locked(config, report, chunking)
+
+
+def iter_corpus(chunking=None):
+    """
+    Yield (source_name, id, metadata) for every chunk, file by file, lazily.
+    With `chunking`, the files of data/text that need it are chunked on a
+    process pool and their chunks come first, as each file is done, so
+    embedding starts while the rest is still being chunked. The other
+    _chunks.txt files are read back afterwards.
+    """
+    chunked = set()
+    if chunking is not None:
+        for source_name, position, chunk in iter_chunks(**chunking):
+            chunked.add(source_name)
+            record = chunk_record(source_name, position, chunk)
+            if record is not None:
+                yield (source_name, *record)
+
+    for filename in sorted(os.listdir(CHUNKS_PATH)):
         if not filename.endswith("_chunks.txt"):
             continue
 
-        filepath = os.path.join(CHUNKS_PATH, filename)
+        source_name = filename[:-len("_chunks.txt")]
+        if source_name in chunked:
+            continue
+        for cid, meta in read_chunk_file(source_name):
+            yield source_name, cid, meta
+
+
+def _embed_corpus(store_writer, bm25_writer, manifest: dict, chunking=None):
+    """
+    Stream the corpus into the chunk store (and the BM25 postings) and embed it BUILD_BATCH_SIZE
+    chunks at a time, appending the vectors to a scratch file. Only one batch of
+    texts and vectors is in memory at any time. Returns the vectors
+    memory-mapped, None for an empty corpus.
+    """
+    dim = None
+    row = 0
+    batch = []
+    cache_stats = {}
+    start = time.perf_counter()
+
+    def flush():
+        nonlocal dim, row
+        embedded = normalize_vectors(embed_cached(batch, cache_stats))
+        dim = embedded.shape[1]
+        vector_file.write(np.ascontiguousarray(embedded, dtype="float32").tobytes())
+        row += len(batch)
+        batch.clear()
+
+        elapsed = time.perf_counter() - start
+        print(f"🧠 {row} chunks embedded ({row / max(elapsed, 1e-6):.0f} chunks/s)")
+
+    with open(VECTORS_BUILD_PATH, "wb") as vector_file:
+        for source_name, cid, meta in iter_corpus(chunking):
+            if source_name not in manifest:
+                text_file = os.path.join(TEXT_PATH, source_name + ".txt")
+                manifest[source_name] = {
+                    "hash": file_hash(text_file) if os.path.exists(text_file) else None,
+                    "ids": [],
+                }
 
-        with open(filepath, "r", encoding="utf-8") as f:
-            text = f.read()
+            manifest[source_name]["ids"].append(cid)
+            store_writer.add(cid, meta["source"], meta["page"], meta["text"])
+            bm25_writer.add(cid, meta["text"])
+            batch.append(meta["text"])
 
-        chunks = text.split("\n---\n")
+            if len(batch) == BUILD_BATCH_SIZE:
+                flush()
 
-        source_name = filename.replace("_chunks.txt", "")
+        if batch:
+            flush()
 
-        for i, chunk in enumerate(chunks):
-            cleaned = chunk.strip()
-            if not cleaned:
-                continue
+    if not row:
+        return None
 
-            all_chunks.append(cleaned)
+    report_cache_stats(cache_stats)
+    return np.memmap(VECTORS_BUILD_PATH, dtype="float32", mode="r", shape=(row, dim))
 
-            metadata.append({
-                "text": cleaned,
-                "source": source_name,
-                "page": i + 1
-            })
 
-    print(f"✅ Total chunks: {len(all_chunks)}")
+def _build_faiss_locked(config=None, report=True, chunking=None):
+    remove_misnamed_chunk_files()
+    store_writer = ChunkStoreWriter(FAISS_DIR)
+    bm25_writer = BM25Writer(FAISS_DIR)
+    manifest = {}
 
-    if not all_chunks:
-        raise RuntimeError("❌ No chunks found. Check ingestion pipeline.")
+    try:
+        vectors = _embed_corpus(store_writer, bm25_writer, manifest, chunking)
+        if vectors is None:
+            raise RuntimeError("❌ No chunks found. Check ingestion pipeline.")
 
-    print("🧠 Embedding chunks...")
-    vectors = np.array(embed_text(all_chunks)).astype("float32")
+        total = len(vectors)
+        print(f"✅ Total chunks: {total}")
 
-    print("📐 Building FAISS index...")
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(vectors)
+        ids = store_writer.ids
+        dim = vectors.shape[1]
+        # Held-out queries for the report never take part in training
+        queries = sample_queries(total)
+        config = resolve_config(config, total - len(queries), dim)
 
-    faiss.write_index(index, FAISS_PATH)
-    pickle.dump(vectors, open(VECTORS_PATH, "wb"))
-    pickle.dump(metadata, open(META_PATH, "wb"))
+        print(f"📐 Building FAISS index ({config['type']})...")
+        index = make_index(dim, config)
+        train_index(index, vectors, config, exclude=queries)
+
+        start = time.perf_counter()
+        for begin in range(0, total, BUILD_BATCH_SIZE):
+            end = min(begin + BUILD_BATCH_SIZE, total)
+            index.add_with_ids(np.ascontiguousarray(vectors[begin:end]), ids[begin:end])
+            elapsed = time.perf_counter() - start
+            print(f"📐 {end}/{total} vectors added ({end / max(elapsed, 1e-6):.0f} vectors/s)")
+        apply_search_params(index, config)
+
+        if report and config["type"] != "flat":
+            with open(REPORT_PATH, "w", encoding="utf-8") as f:
+                json.dump(recall_latency_report(index, vectors, ids, queries, config, metric=metric_of(config)), f, indent=2)
+
+        version = publish_index(index, store_writer, manifest, config, bm25_writer)
+    except BaseException:
+        remove_build_leftovers(store_writer)
+        raise
+
+    del vectors
+    os.remove(VECTORS_BUILD_PATH)
 
     print("🚀 FAISS index rebuilt successfully")
     print(f"→ {FAISS_PATH}")
-    print(f"→ {META_PATH}")
+    print(f"→ {FAISS_DIR}/chunks_* ({len(store_writer)} chunks)")
+    print(f"→ version {version}")
+
+
+# ---------- INCREMENTAL (upload) ----------
+def index_document(text_filename: str, on_stage=None) -> bool:
+    """
+    Chunk, embed and add ONE document of data/text to the existing index.
+    Vectors of a previous version of the same document are removed first.
+    Returns False when the document content is unchanged.
+
+    Chunking and embedding run without the index lock, so several
+    documents can be prepared in parallel; only the commit is serialized.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    source_name = text_filename[:-len(".txt")]
+    content_hash = file_hash(os.path.join(TEXT_PATH, text_filename))
+
+    entry = load_manifest().get(source_name)
+    if entry and entry["hash"] == content_hash:
+        print(f"⏭️ Unchanged, skipping: {text_filename}")
+        return False
+
+    on_stage("chunking")
+    chunk_file(text_filename)
+    chunks = list(read_chunk_file(source_name))
+
+    on_stage("embedding")
+    vectors = None
+    if chunks:
+        print(f"🧠 Embedding {len(chunks)} chunks of {source_name}...")
+        vectors = normalize_vectors(embed_cached([meta["text"] for _, meta in chunks]))
+
+    on_stage("indexing")
+    with index_lock():
+        # Re-read under the lock: another job may have committed meanwhile
+        manifest = load_manifest()
+
+        # No index yet, or built before manifests / the chunk store / BM25 segments existed
+        if (not manifest or not os.path.exists(FAISS_PATH)
+                or not chunk_store_exists(FAISS_DIR) or not bm25_supports_delta(FAISS_DIR)):
+            # Keep the index type / metric chosen for the existing index
+            config = load_index_config(INDEX_CONFIG_PATH) if os.path.exists(INDEX_CONFIG_PATH) else None
+            _build_faiss_locked(config, report=False)
+            return True
+
+        entry = manifest.get(source_name)
+        if entry and not supports_remove(load_index_config(INDEX_CONFIG_PATH)):
+            print("⚠️ Index type cannot remove vectors, rebuilding to replace the document")
+            _build_faiss_locked(load_index_config(INDEX_CONFIG_PATH), report=False)
+            return True
+
+        index = faiss.read_index(FAISS_PATH)
+        store = ChunkStore(FAISS_DIR)
+        store_writer = ChunkStoreWriter(FAISS_DIR)
+
+        try:
+            # Keep every chunk except the previous version of this document
+            old_ids = np.array(entry["ids"] if entry else [], dtype="int64")
+            if len(old_ids):
+                index.remove_ids(old_ids)
+            store_writer.copy_from(store, ~np.isin(store.ids, old_ids))
+            bm25_writer = BM25Writer(FAISS_DIR, base=BM25Index(FAISS_DIR), remove_ids=old_ids)
+
+            new_ids = [cid for cid, _ in chunks]
+            for cid, meta in chunks:
+                store_writer.add(cid, meta["source"], meta["page"], meta["text"])
+                bm25_writer.add(cid, meta["text"])
+
+            if vectors is not None:
+                index.add_with_ids(vectors, np.array(new_ids, dtype="int64"))
+
+            manifest[source_name] = {"hash": content_hash, "ids": new_ids}
+            version = publish_index(index, store_writer, manifest, bm25_writer=bm25_writer)
+        except BaseException:
+            remove_build_leftovers(store_writer)
+            raise
+
+    print(f"🚀 Indexed {source_name}: {len(new_ids)} chunks (version {version})")
+    return True
 
 
 if __name__ == "__main__":
-    build_faiss()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS index")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=DEFAULT_INDEX_CONFIG["type"])
+    parser.add_argument("--metric", choices=("ip", "l2"), default=DEFAULT_INDEX_CONFIG["metric"])
+    parser.add_argument("--nlist", type=int, default=DEFAULT_INDEX_CONFIG["nlist"])
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_INDEX_CONFIG["nprobe"])
+    parser.add_argument("--M", type=int, default=DEFAULT_INDEX_CONFIG["M"])
+    parser.add_argument("--ef-construction", type=int, default=DEFAULT_INDEX_CONFIG["ef_construction"])
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_INDEX_CONFIG["ef_search"])
+    parser.add_argument("--pq-m", type=int, default=DEFAULT_INDEX_CONFIG["pq_m"])
+    parser.add_argument("--pq-nbits", type=int, default=DEFAULT_INDEX_CONFIG["pq_nbits"])
+    parser.add_argument("--train-sample", type=int, default=DEFAULT_INDEX_CONFIG["train_sample"])
+    parser.add_argument("--no-report", action="store_true")
+    parser.add_argument("--chunk", action="store_true", help="chunk new or changed files of data/text while embedding")
+    parser.add_argument("--force-chunk", action="store_true", help="re-chunk every file of data/text while embedding")
+    args = parser.parse_args()
+
+    build_faiss({
+        "type": args.index_type,
+        "metric": args.metric,
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "M": args.M,
+        "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+        "train_sample": args.train_sample,
+    }, report=not args.no_report,
+        chunking={"force": args.force_chunk} if args.chunk or args.force_chunk else None)
@@ -0,0 +1,191 @@
+"""
+Columnar on-disk chunk store (replaces metadata.pkl).
+
+    chunks_text.bin         all chunk texts, utf-8, concatenated
+    chunks_offsets.npy      int64 [n + 1]  text of row i = text[offsets[i]:offsets[i + 1]]
+    chunks_ids.npy          int64 [n]      FAISS chunk id of each row
+    chunks_source.npy       int32 [n]      index into chunks_sources.json
+    chunks_page.npy         int32 [n]
+    chunks_sorted_ids.npy   int64 [n]      ids sorted, for id -> row lookup
+    chunks_sorted_rows.npy  int64 [n]      row of each sorted id
+    chunks_sources.json     list of source names
+
+Every array is opened with mmap, so loading is instant, the pages are
+shared between worker processes, and only the top-k hits become dicts.
+"""
+
+import os
+import json
+import mmap
+from array import array
+from typing import Optional
+
+import numpy as np
+
+PREFIX = "chunks"
+COLUMNS = ("offsets", "ids", "source", "page", "sorted_ids", "sorted_rows")
+
+
+def _path(directory: str, name: str) -> str:
+    if name == "text":
+        return os.path.join(directory, f"{PREFIX}_text.bin")
+    if name == "sources":
+        return os.path.join(directory, f"{PREFIX}_sources.json")
+    return os.path.join(directory, f"{PREFIX}_{name}.npy")
+
+
+def chunk_store_exists(directory: str) -> bool:
+    return os.path.exists(_path(directory, "sources"))
+
+
+class ChunkStore:
+    """Read-only, mmap-backed view of a published chunk store."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+        self.offsets = np.load(_path(directory, "offsets"), mmap_mode="r")
+        self.ids = np.load(_path(directory, "ids"), mmap_mode="r")
+        self.source_ids = np.load(_path(directory, "source"), mmap_mode="r")
+        self.pages = np.load(_path(directory, "page"), mmap_mode="r")
+        self.sorted_ids = np.load(_path(directory, "sorted_ids"), mmap_mode="r")
+        self.sorted_rows = np.load(_path(directory, "sorted_rows"), mmap_mode="r")
+
+        with open(_path(directory, "sources"), "r", encoding="utf-8") as f:
+            self.sources = json.load(f)
+
+        with open(_path(directory, "text"), "rb") as f:
+            # mmap refuses empty files
+            if os.fstat(f.fileno()).st_size == 0:
+                self._text = b""
+            else:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, row: int) -> dict:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return {
+            "id": int(self.ids[row]),
+            "text": self._text[start:end].decode("utf-8"),
+            "source": self.sources[int(self.source_ids[row])],
+            "page": int(self.pages[row]),
+        }
+
+    def row_of(self, chunk_id: int) -> Optional[int]:
+        pos = int(np.searchsorted(self.sorted_ids, chunk_id))
+        if pos < len(self.sorted_ids) and self.sorted_ids[pos] == chunk_id:
+            return int(self.sorted_rows[pos])
+        return None
+
+    def get(self, chunk_id: int) -> Optional[dict]:
+        row = self.row_of(chunk_id)
+        return None if row is None else self.row(row)
+
+    def text_bytes(self, start: int, end: int) -> bytes:
+        return self._text[start:end]
+
+
+class ChunkStoreWriter:
+    """
+    Append rows, then commit() to atomically replace the store on disk.
+    Texts go straight to a temp file; columns are compact arrays.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._text_tmp = _path(directory, "text") + ".tmp"
+        self._text_file = open(self._text_tmp, "wb")
+        self._size = 0
+
+        self._offsets = array("q", [0])
+        self._ids = array("q")
+        self._source_ids = array("i")
+        self._pages = array("i")
+        self._sources = []
+        self._source_index = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Chunk ids of the rows added so far (a view, do not keep across adds)."""
+        return np.frombuffer(self._ids, dtype="int64")
+
+    def _source_id(self, source: str) -> int:
+        if source not in self._source_index:
+            self._source_index[source] = len(self._sources)
+            self._sources.append(source)
+        return self._source_index[source]
+
+    def add(self, chunk_id: int, source: str, page: int, text: str):
+        data = text.encode("utf-8")
+        self._text_file.write(data)
+        self._size += len(data)
+
+        self._offsets.append(self._size)
+        self._ids.append(chunk_id)
+        self._source_ids.append(self._source_id(source))
+        self._pages.append(page)
+
+    def copy_from(self, store: ChunkStore, keep: np.ndarray):
+        """Copy the rows of `store` where `keep` is True, run by run."""
+        keep = np.asarray(keep, dtype=bool)
+        if not keep.any():
+            return
+
+        # Boundaries of consecutive kept rows
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.view(np.int8), [0]))))
+        source_map = np.array([self._source_id(s) for s in store.sources], dtype="int32")
+
+        for start, end in zip(edges[0::2], edges[1::2]):
+            text_start, text_end = int(store.offsets[start]), int(store.offsets[end])
+            self._text_file.write(store.text_bytes(text_start, text_end))
+
+            shifted = np.asarray(store.offsets[start + 1:end + 1]) - text_start + self._size
+            self._offsets.extend(shifted.astype("int64").tolist())
+            self._size += text_end - text_start
+
+            self._ids.extend(np.asarray(store.ids[start:end]).tolist())
+            self._source_ids.extend(source_map[np.asarray(store.source_ids[start:end])].tolist())
+            self._pages.extend(np.asarray(store.pages[start:end]).tolist())
+
+    def stage(self) -> list:
+        """
+        Write every file as .tmp without touching the live store. Returns
+        the paths to os.replace (path + ".tmp" -> path), in that order.
+        """
+        self._text_file.close()
+
+        ids = np.frombuffer(self._ids, dtype="int64")
+        order = np.argsort(ids, kind="stable")
+
+        columns = {
+            "offsets": np.frombuffer(self._offsets, dtype="int64"),
+            "ids": ids,
+            "source": np.frombuffer(self._source_ids, dtype="int32"),
+            "page": np.frombuffer(self._pages, dtype="int32"),
+            "sorted_ids": ids[order],
+            "sorted_rows": order.astype("int64"),
+        }
+
+        for name, values in columns.items():
+            with open(_path(self.directory, name) + ".tmp", "wb") as f:
+                np.save(f, values)
+
+        with open(_path(self.directory, "sources") + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._sources, f, ensure_ascii=False)
+
+        # The sources file goes last: chunk_store_exists() keys on it
+        return [_path(self.directory, name) for name in ("text",) + COLUMNS + ("sources",)]
+
+    def commit(self):
+        for path in self.stage():
+            os.replace(path + ".tmp", path)
+
+    def abort(self):
+        self._text_file.close()
+        if os.path.exists(self._text_tmp):
+            os.remove(self._text_tmp)
@@ -1,11 +1,233 @@
-from sentence_transformers import SentenceTransformer
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from backend.vectordb.embedding_backends import EMBED_BACKEND, load_embedding_model, model_key
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# What the vectors depend on: model + backend (torch / onnx / onnx-int8)
+MODEL_KEY = model_key(MODEL_NAME, EMBED_BACKEND)
+
+# Query micro-batching
+QUERY_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+QUERY_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", "2048"))
+
+# Loaded once, on first use (not at import: CLI scripts that never embed skip it)
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_embedding_model(MODEL_NAME, EMBED_BACKEND)
+    return _model
 
-# Load only once
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
 def embed_text(text_list):
     """
     Takes a list of chunks -> returns list of embeddings
     """
-    embeddings = model.encode(text_list, convert_to_numpy=True)
+    embeddings = get_model().encode(text_list, convert_to_numpy=True)
     return embeddings
+
+
+class QueryEmbedder:
+    """
+    Embeds single queries coming from concurrent requests.
+
+    Callers block on a future while a background thread gathers up to
+    `max_batch` pending queries (waiting at most `max_wait_ms` for more
+    when several are already queued) and encodes them in ONE model call. Recent query
+    embeddings are kept in an LRU cache, since users repeat questions.
+    """
+
+    def __init__(self, encode_fn=embed_text, max_batch=QUERY_MAX_BATCH,
+                 max_wait_ms=QUERY_MAX_WAIT_MS, cache_size=QUERY_CACHE_SIZE):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        self._queue = queue.Queue()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        # Counters
+        self._started = time.monotonic()
+        self._requests = 0
+        self._cache_hits = 0
+        self._batches = 0
+        self._encoded = 0
+        self._encode_seconds = 0.0
+        self._latencies_ms = deque(maxlen=2000)
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                    self._thread.start()
+
+    def embed(self, text: str) -> np.ndarray:
+        start = time.perf_counter()
+
+        with self._lock:
+            self._requests += 1
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                self._cache_hits += 1
+                self._latencies_ms.append((time.perf_counter() - start) * 1000)
+                return cached
+
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        vector = future.result()
+
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._latencies_ms.append((time.perf_counter() - start) * 1000)
+
+        return vector
+
+    def embed_many(self, texts) -> np.ndarray:
+        """
+        Many queries at once (offline jobs, /ask/batch): cache misses go to
+        the model in ONE call, without going through the micro-batch queue.
+        """
+        texts = list(texts)
+        vectors = [None] * len(texts)
+
+        with self._lock:
+            self._requests += len(texts)
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is not None:
+                    self._cache.move_to_end(text)
+                    self._cache_hits += 1
+                    vectors[i] = cached
+
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            start = time.perf_counter()
+            encoded = np.asarray(self.encode_fn(missing), dtype="float32")
+            elapsed = time.perf_counter() - start
+
+            by_text = {}
+            for text, vector in zip(missing, encoded):
+                vector.setflags(write=False)
+                by_text[text] = vector
+
+            with self._lock:
+                self._batches += 1
+                self._encoded += len(missing)
+                self._encode_seconds += elapsed
+                for text, vector in by_text.items():
+                    self._cache[text] = vector
+                    self._cache.move_to_end(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+            vectors = [by_text[t] if v is None else v for t, v in zip(texts, vectors)]
+
+        if not vectors:
+            return np.zeros((0, 0), dtype="float32")
+        return np.stack(vectors)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+
+        # Take what is already queued; a lone query (idle server) is encoded
+        # right away instead of paying max_wait for company that never comes
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) == 1:
+            return batch
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+
+            # Identical questions in the same batch are encoded once
+            texts = list(dict.fromkeys(text for text, _ in batch))
+
+            try:
+                start = time.perf_counter()
+                vectors = np.asarray(self.encode_fn(texts), dtype="float32")
+                elapsed = time.perf_counter() - start
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            by_text = {}
+            for text, vector in zip(texts, vectors):
+                vector.setflags(write=False)
+                by_text[text] = vector
+
+            with self._lock:
+                self._batches += 1
+                self._encoded += len(texts)
+                self._encode_seconds += elapsed
+
+            for text, future in batch:
+                future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = list(self._latencies_ms)
+            uptime = time.monotonic() - self._started
+            return {
+                "requests": self._requests,
+                "cache_hits": self._cache_hits,
+                "cache_size": len(self._cache),
+                "batches": self._batches,
+                "encoded": self._encoded,
+                "avg_batch_size": round(self._encoded / self._batches, 2) if self._batches else 0.0,
+                "encode_seconds": round(self._encode_seconds, 3),
+                "throughput_qps": round(self._requests / uptime, 2) if uptime else 0.0,
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+                "latency_p99_ms": round(float(np.percentile(latencies, 99)), 2) if latencies else None,
+            }
+
+
+query_embedder = QueryEmbedder()
+
+
+def embed_query(text: str) -> np.ndarray:
+    """One query -> one float32 vector, batched with concurrent callers."""
+    return query_embedder.embed(text)
+
+
+def embed_queries(texts) -> np.ndarray:
+    """Many queries -> float32 matrix, one row per query, in one model call."""
+    return query_embedder.embed_many(texts)
@@ -0,0 +1,320 @@
+"""
+Embedding backends, selected with EMBED_BACKEND:
+
+    torch       SentenceTransformer on PyTorch, fp32 (reference)
+    onnx        the same encoder exported to ONNX Runtime, fp32
+    onnx-int8   the ONNX export with dynamically quantized int8 weights
+
+The ONNX files are exported once from the SentenceTransformer model
+(first use, or `--export`) under data/models/, by one process at a time.
+Pooling and normalization are re-done in numpy, so the ONNX backends do
+not need torch at runtime.
+
+    python -m backend.vectordb.embedding_backends --parity --benchmark
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = onnxruntime default
+ENCODE_BATCH_SIZE = 32
+
+MODELS_DIR = os.path.join("data", "models")
+ONNX_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+# Minimum cosine agreement with the fp32 reference, per backend
+PARITY_MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+
+
+def model_dir(model_name: str) -> str:
+    return os.path.join(MODELS_DIR, model_name.split("/")[-1])
+
+
+def onnx_path(model_name: str, backend: str) -> str:
+    filename = "model_int8.onnx" if backend == "onnx-int8" else "model.onnx"
+    return os.path.join(model_dir(model_name), filename)
+
+
+# ---------- EXPORT ----------
+@contextmanager
+def export_lock(model_name: str):
+    """One process exports / quantizes a model, the others (uvicorn workers) wait for it."""
+    directory = model_dir(model_name)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".export.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def export_onnx(model_name: str):
+    """
+    SentenceTransformer encoder -> model.onnx + tokenizer + pooling settings.
+    Everything is written to a staging directory first and moved in place
+    with model.onnx last, so a half-written export is never picked up.
+    Call it under export_lock().
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    directory = model_dir(model_name)
+    staging = os.path.join(directory, ".export")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    pooling = next(m for m in st_model if isinstance(m, Pooling))
+    if pooling.get_pooling_mode_str() != "mean":
+        raise ValueError(f"Only mean pooling is supported, {model_name} uses {pooling.get_pooling_mode_str()}")
+
+    encoder = transformer.auto_model.eval()
+    dummy = transformer.tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ONNX_INPUTS if name in dummy]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, *inputs):
+            return self.encoder(**dict(zip(input_names, inputs))).last_hidden_state
+
+    print(f"📦 Exporting {model_name} to ONNX...")
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(),
+            tuple(dummy[name] for name in input_names),
+            os.path.join(staging, "model.onnx"),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+            opset_version=14,
+        )
+
+    transformer.tokenizer.save_pretrained(staging)
+    settings = {
+        "model": model_name,
+        "inputs": input_names,
+        "max_seq_length": transformer.max_seq_length,
+        "normalize": any(isinstance(m, Normalize) for m in st_model),
+    }
+    with open(os.path.join(staging, "embedder.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f, indent=2)
+
+    # model.onnx goes last: ensure_onnx() keys on it
+    for name in sorted(os.listdir(staging), key=lambda name: name == "model.onnx"):
+        os.replace(os.path.join(staging, name), os.path.join(directory, name))
+    os.rmdir(staging)
+
+
+def quantize_onnx(model_name: str):
+    """model.onnx -> model_int8.onnx (dynamic quantization: int8 weights, fp32 activations)."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"📦 Quantizing {model_name} to int8...")
+    target = onnx_path(model_name, "onnx-int8")
+    quantize_dynamic(onnx_path(model_name, "onnx"), target + ".tmp", weight_type=QuantType.QInt8)
+    os.replace(target + ".tmp", target)
+
+
+def ensure_onnx(model_name: str, backend: str):
+    def missing(name: str) -> bool:
+        return not os.path.exists(onnx_path(model_name, name))
+
+    needs_int8 = backend == "onnx-int8"
+    if not missing("onnx") and not (needs_int8 and missing("onnx-int8")):
+        return
+
+    with export_lock(model_name):
+        # Another worker may have exported while we waited
+        if missing("onnx"):
+            export_onnx(model_name)
+        if needs_int8 and missing("onnx-int8"):
+            quantize_onnx(model_name)
+
+
+# ---------- ONNX RUNTIME ----------
+class OnnxEmbedder:
+    """Drop-in for SentenceTransformer.encode() on an exported ONNX model."""
+
+    def __init__(self, model_name: str, backend: str = "onnx"):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        ensure_onnx(model_name, backend)
+        directory = model_dir(model_name)
+
+        with open(os.path.join(directory, "embedder.json"), "r", encoding="utf-8") as f:
+            settings = json.load(f)
+        self.input_names = settings["inputs"]
+        self.max_seq_length = settings["max_seq_length"]
+        self.normalize = settings["normalize"]
+
+        options = ort.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(
+            onnx_path(model_name, backend), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+
+    def _encode_batch(self, texts):
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np"
+        )
+        feeds = {name: encoded[name].astype("int64") for name in self.input_names}
+        tokens = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = encoded["attention_mask"][..., None].astype("float32")
+        vectors = (tokens * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype("float32")
+
+    def encode(self, sentences, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+
+        # Longest first, like SentenceTransformer: batches need less padding
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        vectors = np.concatenate([
+            self._encode_batch([texts[i] for i in order[start:start + batch_size]])
+            for start in range(0, len(texts), batch_size)
+        ])
+        vectors = vectors[np.argsort(order)]
+
+        return vectors[0] if single else vectors
+
+
+def load_embedding_model(model_name: str, backend: str = EMBED_BACKEND):
+    """An object with SentenceTransformer's encode() for the chosen backend."""
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBED_BACKENDS}")
+
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    return OnnxEmbedder(model_name, backend)
+
+
+def model_key(model_name: str, backend: str = EMBED_BACKEND) -> str:
+    """Identifies the vectors a backend produces (embedding cache key)."""
+    # torch keeps the bare model name: existing caches stay valid
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+# ---------- PARITY / BENCHMARK ----------
+SAMPLE_TEXTS = [
+    "What is the global objective of the project?",
+    "Les étapes de la facturation client sont décrites dans le document.",
+    "The diagram shows the registration workflow between the client and the administration.",
+    "Analyse des besoins, conception du modèle de données et mise en production.",
+]
+
+
+def sample_texts(limit: int = 256):
+    """Chunk texts from data/chunks (what we really embed), else built-in sentences."""
+    from backend.ingestion.chunker import CHUNKS_OUTPUT_PATH, iter_chunk_file
+
+    texts = []
+    if os.path.isdir(CHUNKS_OUTPUT_PATH):
+        for filename in sorted(os.listdir(CHUNKS_OUTPUT_PATH)):
+            if not filename.endswith("_chunks.txt"):
+                continue
+            for text in iter_chunk_file(os.path.join(CHUNKS_OUTPUT_PATH, filename)):
+                texts.append(text)
+                if len(texts) >= limit:
+                    return texts
+    return texts or SAMPLE_TEXTS
+
+
+def parity_check(model_name: str, backend: str, texts, reference: np.ndarray = None) -> dict:
+    """Cosine agreement of `backend` with the fp32 torch vectors on `texts`."""
+    if reference is None:
+        reference = load_embedding_model(model_name, "torch").encode(texts, convert_to_numpy=True)
+    vectors = load_embedding_model(model_name, backend).encode(texts, convert_to_numpy=True)
+
+    cosines = (vectors * reference).sum(axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1) + 1e-12
+    )
+    report = {
+        "backend": backend,
+        "n_texts": len(texts),
+        "cosine_mean": round(float(cosines.mean()), 5),
+        "cosine_min": round(float(cosines.min()), 5),
+    }
+    report["ok"] = report["cosine_min"] >= PARITY_MIN_COSINE.get(backend, 1.0 - 1e-5)
+    return report
+
+
+def benchmark(model_name: str, backend: str, texts, queries=SAMPLE_TEXTS, repeats: int = 20) -> dict:
+    """Bulk docs/sec (rebuilds) and single-query latency (/ask) of one backend."""
+    model = load_embedding_model(model_name, backend)
+    model.encode(texts[:ENCODE_BATCH_SIZE], convert_to_numpy=True)  # warm-up
+
+    start = time.perf_counter()
+    model.encode(texts, convert_to_numpy=True)
+    bulk_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            model.encode([query], convert_to_numpy=True)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "backend": backend,
+        "docs_per_sec": round(len(texts) / bulk_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from backend.vectordb.embedder import MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export / check / benchmark the embedding backends")
+    parser.add_argument("--export", action="store_true", help="(re-)export the ONNX and int8 models")
+    parser.add_argument("--parity", action="store_true", help="cosine agreement with the fp32 torch model")
+    parser.add_argument("--benchmark", action="store_true", help="docs/sec and single-query latency")
+    parser.add_argument("--backends", nargs="+", default=list(EMBED_BACKENDS), choices=EMBED_BACKENDS)
+    parser.add_argument("--samples", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.export:
+        with export_lock(MODEL_NAME):
+            export_onnx(MODEL_NAME)
+            quantize_onnx(MODEL_NAME)
+
+    texts = sample_texts(args.samples)
+
+    if args.parity:
+        reference = load_embedding_model(MODEL_NAME, "torch").encode(texts, convert_to_numpy=True)
+        print("\n===== PARITY (vs torch fp32) =====")
+        for backend in args.backends:
+            if backend != "torch":
+                print(parity_check(MODEL_NAME, backend, texts, reference))
+
+    if args.benchmark:
+        print(f"\n===== BENCHMARK ({len(texts)} texts) =====")
+        for backend in args.backends:
+            print(benchmark(MODEL_NAME, backend, texts))
@@ -0,0 +1,190 @@
+import os
+import time
+import sqlite3
+import hashlib
+import numpy as np
+
+from backend.vectordb.embedder import MODEL_KEY, embed_text
+
+CACHE_PATH = os.path.join("data", "cache", "embeddings.sqlite")
+CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024")) * 1024 * 1024
+LOOKUP_BATCH = 500  # stays under SQLite's bound-parameter limit
+EVICT_BATCH = 1000
+
+
+def text_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of chunk embeddings.
+    Key = sha256(model key + chunk text), the model key naming both the
+    model and the embedding backend. Entries of another model are dropped
+    when the cache is opened, and the least recently used entries are
+    evicted once the vectors exceed `max_bytes`. Triggers keep the total
+    size in meta, so checking it does not scan the table.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, model_name: str = MODEL_KEY, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vector BLOB NOT NULL, dim INTEGER NOT NULL,"
+                " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_added AFTER INSERT ON embeddings BEGIN"
+                " UPDATE meta SET value = CAST(value AS INTEGER) + NEW.size WHERE name = 'total_bytes'; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_removed AFTER DELETE ON embeddings BEGIN"
+                " UPDATE meta SET value = CAST(value AS INTEGER) - OLD.size WHERE name = 'total_bytes'; END"
+            )
+            # Caches created before the running total: one last full sum
+            conn.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM embeddings"
+            )
+
+            row = conn.execute("SELECT value FROM meta WHERE name = 'model'").fetchone()
+            if row is None or row[0] != model_name:
+                if row is not None:
+                    print(f"♻️ Embedding model changed ({row[0]} → {model_name}), clearing cache")
+                conn.execute("DELETE FROM embeddings")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (model_name,))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _get_meta(self, conn, name, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return default if row is None else row[0]
+
+    def get_many(self, conn, keys):
+        found = {}
+        now = time.time()
+        for i in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[i:i + LOOKUP_BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype="float32")
+            conn.execute(f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *batch])
+        return found
+
+    def put_many(self, conn, items):
+        now = time.time()
+        conn.executemany(
+            # IGNORE, not REPLACE: a replaced row would be added to total_bytes twice
+            "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?, ?)",
+            [(key, vec.astype("float32").tobytes(), len(vec), vec.size * 4, now) for key, vec in items],
+        )
+
+    def evict(self, conn):
+        total = int(self._get_meta(conn, "total_bytes", 0))
+        if total <= self.max_bytes:
+            return 0
+
+        # Trim to 90% so we do not evict on every build
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while total > target:
+            rows = conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+
+            keys = []
+            for key, size in rows:
+                if total <= target:
+                    break
+                keys.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+            evicted += len(keys)
+        return evicted
+
+    def embed(self, texts, embed_fn=embed_text):
+        """
+        Embed `texts`, computing only the ones never seen before.
+        Returns (float32 matrix, stats dict).
+        """
+        keys = [text_key(self.model_name, t) for t in texts]
+
+        with self._connect() as conn:
+            found = self.get_many(conn, list(set(keys)))
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in found:
+                    missing.setdefault(key, text)
+
+            embed_seconds = 0.0
+            if missing:
+                start = time.perf_counter()
+                vectors = np.array(embed_fn(list(missing.values()))).astype("float32")
+                embed_seconds = time.perf_counter() - start
+                computed = dict(zip(missing.keys(), vectors))
+                self.put_many(conn, computed.items())
+                found.update(computed)
+
+                # Remember the cost of one embedding to estimate time saved
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('seconds_per_text', ?)",
+                    (str(embed_seconds / len(missing)),),
+                )
+
+            seconds_per_text = float(self._get_meta(conn, "seconds_per_text", 0.0))
+            evicted = self.evict(conn)
+
+        hits = len(texts) - len(missing)
+        stats = {
+            "hits": hits,
+            "misses": len(missing),
+            "evicted": evicted,
+            "embed_seconds": round(embed_seconds, 3),
+            "saved_seconds": round(hits * seconds_per_text, 3),
+        }
+
+        if not texts:
+            return np.zeros((0, 0), dtype="float32"), stats
+        return np.stack([found[key] for key in keys]), stats
+
+
+_default_cache = None
+
+
+def embed_cached(texts, totals: dict = None):
+    """
+    embed_text() through the shared on-disk cache. The stats are added to
+    `totals` when given (one report per build, see report_cache_stats),
+    else reported right away.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+
+    vectors, stats = _default_cache.embed(texts)
+    if totals is None:
+        report_cache_stats(stats)
+    else:
+        for name, value in stats.items():
+            totals[name] = totals.get(name, 0) + value
+    return vectors
+
+
+def report_cache_stats(stats: dict):
+    print(
+        f"💾 Embedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+        f"~{round(stats['saved_seconds'], 3)}s saved ({round(stats['embed_seconds'], 3)}s embedding)"
+    )
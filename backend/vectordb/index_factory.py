@@ -0,0 +1,306 @@
+import os
+import time
+import json
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# Vectors are L2-normalized: "ip" (inner product) scores are cosine similarities
+METRICS = {"ip": faiss.METRIC_INNER_PRODUCT, "l2": faiss.METRIC_L2}
+
+# Every knob can be overridden from the environment or the build_faiss CLI
+DEFAULT_INDEX_CONFIG = {
+    "type": os.getenv("FAISS_INDEX_TYPE", "flat"),
+    "metric": os.getenv("FAISS_METRIC", "ip"),
+    # IVF
+    "nlist": int(os.getenv("FAISS_NLIST", "1024")),
+    "nprobe": int(os.getenv("FAISS_NPROBE", "16")),
+    # HNSW
+    "M": int(os.getenv("FAISS_HNSW_M", "32")),
+    "ef_construction": int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200")),
+    "ef_search": int(os.getenv("FAISS_HNSW_EF_SEARCH", "64")),
+    # PQ: code size = pq_m * pq_nbits bits per vector
+    "pq_m": int(os.getenv("FAISS_PQ_M", "16")),
+    "pq_nbits": int(os.getenv("FAISS_PQ_NBITS", "8")),
+    # Training
+    "train_sample": int(os.getenv("FAISS_TRAIN_SAMPLE", "100000")),
+}
+
+# faiss recommends ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+# Held-out queries per exact (brute-force) pass of the recall / latency report
+EXACT_BATCH_SIZE = int(os.getenv("FAISS_EXACT_BATCH", "8"))
+
+
+def load_index_config(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index_config(config: dict, path: str):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def resolve_config(config: dict, n_vectors: int, dim: int) -> dict:
+    """
+    Adapt the requested config to the corpus: cap nlist to what the sample
+    can train, and fall back to flat when the corpus is too small for it.
+    """
+    config = {**DEFAULT_INDEX_CONFIG, **(config or {})}
+
+    if config["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {config['type']!r}, expected one of {INDEX_TYPES}")
+    if config["metric"] not in METRICS:
+        raise ValueError(f"Unknown metric {config['metric']!r}, expected one of {tuple(METRICS)}")
+
+    train_size = min(config["train_sample"], n_vectors)
+
+    if config["type"] in ("ivf_flat", "ivf_pq"):
+        config["nlist"] = max(1, min(config["nlist"], train_size // MIN_POINTS_PER_CENTROID))
+        config["nprobe"] = min(config["nprobe"], config["nlist"])
+
+    if config["type"] == "ivf_pq":
+        if dim % config["pq_m"] != 0:
+            raise ValueError(f"pq_m={config['pq_m']} must divide the embedding dim {dim}")
+        if train_size < (1 << config["pq_nbits"]):
+            print(f"⚠️ {n_vectors} vectors are too few to train PQ, using flat index")
+            config["type"] = "flat"
+
+    if config["type"].startswith("ivf") and config["nlist"] < 2:
+        print(f"⚠️ {n_vectors} vectors are too few for IVF, using flat index")
+        config["type"] = "flat"
+
+    return config
+
+
+def metric_of(config: dict):
+    # Indexes built before the metric was recorded are L2
+    return METRICS[config.get("metric", "l2")]
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalized float32 copy: inner product = cosine similarity."""
+    vectors = np.array(vectors, dtype="float32", order="C", ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def similarity_scores(distances: np.ndarray, config: dict) -> np.ndarray:
+    """FAISS distances of normalized vectors -> cosine similarities."""
+    if metric_of(config) == faiss.METRIC_INNER_PRODUCT:
+        scores = distances
+    else:
+        # Squared L2 distance between unit vectors = 2 - 2 cos
+        scores = 1.0 - distances / 2.0
+    return np.clip(scores, -1.0, 1.0)
+
+
+def vector_lookup(index):
+    """
+    ids -> (found ids, stored vectors) for an index built by make_index,
+    to score chunks a search did not return. IVF-PQ gives the approximation
+    of its codes, like its searches do.
+    """
+    if hasattr(index, "id_map"):
+        # IDMap / IDMap2: id -> row of the wrapped flat or HNSW index
+        base = faiss.downcast_index(index.index)
+        ids = faiss.vector_to_array(index.id_map)
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+
+        def lookup(wanted):
+            wanted = np.asarray(wanted, dtype="int64")
+            positions = np.minimum(np.searchsorted(sorted_ids, wanted), max(len(sorted_ids) - 1, 0))
+            found = wanted[sorted_ids[positions] == wanted] if len(sorted_ids) else wanted[:0]
+            rows = order[np.searchsorted(sorted_ids, found)]
+            return found, np.array([base.reconstruct(int(row)) for row in rows], dtype="float32").reshape(-1, index.d)
+
+        return lookup
+
+    # IVF indexes store ids natively: look them up in a hash table
+    faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    def lookup(wanted):
+        found, vectors = [], []
+        for cid in wanted:
+            try:
+                vectors.append(index.reconstruct(int(cid)))
+            except RuntimeError:
+                continue
+            found.append(int(cid))
+        return np.array(found, dtype="int64"), np.array(vectors, dtype="float32").reshape(-1, index.d)
+
+    return lookup
+
+
+def make_index(dim: int, config: dict, metric=None):
+    """Empty index accepting add_with_ids, built from a resolved config."""
+    kind = config["type"]
+    if metric is None:
+        metric = metric_of(config)
+
+    if kind == "flat":
+        base = faiss.IndexFlat(dim, metric)
+        return faiss.IndexIDMap(base)
+
+    if kind == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, config["M"], metric)
+        base.hnsw.efConstruction = config["ef_construction"]
+        return faiss.IndexIDMap2(base)
+
+    # IVF indexes store ids natively
+    quantizer = faiss.IndexFlat(dim, metric)
+    if kind == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dim, config["nlist"], metric)
+    return faiss.IndexIVFPQ(quantizer, dim, config["nlist"], config["pq_m"], config["pq_nbits"], metric)
+
+
+def supports_remove(config: dict) -> bool:
+    # HNSW graphs cannot drop vectors: changed documents need a rebuild
+    return config.get("type", "flat") != "hnsw"
+
+
+def train_index(index, vectors: np.ndarray, config: dict, exclude=None, seed: int = 0):
+    """Train on a random sample of the corpus (held-out rows excluded)."""
+    if index.is_trained:
+        return
+
+    rng = np.random.default_rng(seed)
+    candidates = np.arange(len(vectors))
+    if exclude is not None:
+        candidates = np.setdiff1d(candidates, exclude)
+
+    size = min(config["train_sample"], len(candidates))
+    sample = np.sort(rng.choice(candidates, size=size, replace=False))
+
+    print(f"🎯 Training {config['type']} index on {size} vectors...")
+    index.train(np.ascontiguousarray(vectors[sample]))
+
+
+def apply_search_params(index, config: dict):
+    """Set search-time knobs (nprobe / efSearch) on a loaded index."""
+    kind = config.get("type", "flat")
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = config["nprobe"]
+
+    elif kind == "hnsw":
+        base = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+        base.hnsw.efSearch = config["ef_search"]
+
+
+def filtered_search_params(config: dict, selector, fraction: float):
+    """
+    Search parameters restricting FAISS to the ids accepted by `selector`.
+    Only a `fraction` of the vectors visited pass the filter, so nprobe /
+    efSearch are widened accordingly to still find k eligible neighbours.
+    """
+    kind = config.get("type", "flat")
+    widen = 1.0 / max(fraction, 1e-6)
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        nprobe = min(config["nlist"], int(np.ceil(config["nprobe"] * widen)))
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+
+    if kind == "hnsw":
+        ef_search = min(int(np.ceil(config["ef_search"] * widen)), 16384)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+
+    return faiss.SearchParameters(sel=selector)
+
+
+def sample_queries(n_vectors: int, n_queries: int = 200, seed: int = 1) -> np.ndarray:
+    # Hold out at most 10% of the corpus so small corpora can still train
+    rng = np.random.default_rng(seed)
+    size = min(n_queries, max(1, n_vectors // 10))
+    return np.sort(rng.choice(n_vectors, size=size, replace=False))
+
+
+def _timed_single_searches(index, queries: np.ndarray, k: int):
+    latencies = []
+    ids = []
+    for q in queries:
+        start = time.perf_counter()
+        _, found = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    return np.array(ids), np.array(latencies)
+
+
+def exact_search(vectors: np.ndarray, query_vecs: np.ndarray, k: int,
+                 metric=faiss.METRIC_L2, block_size: int = 65536):
+    """
+    Brute-force top-k ids (row numbers) over `vectors`, block by block,
+    so a memmap'ed corpus larger than RAM can serve as ground truth.
+    """
+    heap = faiss.ResultHeap(len(query_vecs), k, keep_max=(metric == faiss.METRIC_INNER_PRODUCT))
+    for begin in range(0, len(vectors), block_size):
+        block = np.ascontiguousarray(vectors[begin:begin + block_size])
+        distances, rows = faiss.knn(query_vecs, block, min(k, len(block)), metric=metric)
+        if rows.shape[1] < k:
+            pad = k - rows.shape[1]
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.nan)
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+        # Keep padded slots from ever beating a real result
+        worst = -np.inf if metric == faiss.METRIC_INNER_PRODUCT else np.inf
+        distances = np.where(rows < 0, worst, distances).astype("float32")
+        heap.add_result(distances, np.where(rows < 0, -1, rows + begin).astype("int64"))
+    heap.finalize()
+    return heap.I
+
+
+def _timed_exact_searches(vectors: np.ndarray, queries: np.ndarray, k: int, metric, batch_size: int):
+    """Exact search in batches of `batch_size` queries: each query is charged its batch's time / size."""
+    rows, latencies = [], []
+    for begin in range(0, len(queries), batch_size):
+        batch = queries[begin:begin + batch_size]
+        start = time.perf_counter()
+        rows.append(exact_search(vectors, batch, k, metric))
+        latencies += [(time.perf_counter() - start) * 1000 / len(batch)] * len(batch)
+    return np.concatenate(rows), np.array(latencies)
+
+
+def recall_latency_report(index, vectors: np.ndarray, ids: np.ndarray, queries: np.ndarray,
+                          config: dict, k: int = 10, metric=faiss.METRIC_L2,
+                          exact_batch: int = EXACT_BATCH_SIZE) -> dict:
+    """
+    Compare the built index with exact search on held-out queries:
+    recall@k (overlap of the top-k id sets) and p50/p99 latency per query
+    for both. Exact search scans the whole corpus per pass, so it runs
+    `exact_batch` queries per pass (1: truly per query, slower to measure).
+    """
+    query_vecs = np.ascontiguousarray(vectors[queries])
+    k = min(k, len(vectors))
+
+    # Exact results are row numbers, the built index returns chunk ids
+    exact_rows, exact_lat = _timed_exact_searches(vectors, query_vecs, k, metric, exact_batch)
+    ann_ids, ann_lat = _timed_single_searches(index, query_vecs, k)
+
+    recalls = [
+        len(set(ids[truth[truth >= 0]].tolist()) & set(found.tolist())) / k
+        for truth, found in zip(exact_rows, ann_ids)
+    ]
+
+    report = {
+        "index_type": config["type"],
+        "params": {key: config[key] for key in ("nlist", "nprobe", "M", "ef_search", "pq_m", "pq_nbits")},
+        "n_vectors": int(len(vectors)),
+        "n_queries": int(len(queries)),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "exact_batch": exact_batch,
+        "exact_p50_ms": round(float(np.percentile(exact_lat, 50)), 3),
+        "exact_p99_ms": round(float(np.percentile(exact_lat, 99)), 3),
+        "ann_p50_ms": round(float(np.percentile(ann_lat, 50)), 3),
+        "ann_p99_ms": round(float(np.percentile(ann_lat, 99)), 3),
+    }
+
+    print("\n===== INDEX REPORT =====")
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+    return report
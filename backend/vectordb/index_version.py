@@ -0,0 +1,20 @@
+import os
+
+# Written to the version marker while index files are being replaced.
+# Readers that see it (or see the version change under them) retry.
+VERSION_BUILDING = "building"
+
+
+def write_index_version(version: str, path: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+
+def read_index_version(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
@@ -1,32 +1,410 @@
 import os
-import pickle
+import time
+import threading
+from collections import OrderedDict
 import faiss
 import numpy as np
-from backend.vectordb.embedder import embed_text
+from backend.vectordb.embedder import embed_query, embed_queries
+from backend.vectordb.index_version import VERSION_BUILDING, read_index_version
+from backend.vectordb.index_factory import (
+    load_index_config,
+    apply_search_params,
+    filtered_search_params,
+    normalize_vectors,
+    similarity_scores,
+    vector_lookup,
+)
+from backend.vectordb.chunk_store import ChunkStore
+from backend.vectordb.bm25 import BM25Index, bm25_exists, tokenize
+from backend.metrics import span
 
 # Resolve project root
 BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ROOT_DIR = os.path.dirname(BACKEND_DIR)
 
-FAISS_PATH = os.path.join(ROOT_DIR, "data", "faiss", "index.faiss")
-META_PATH  = os.path.join(ROOT_DIR, "data", "faiss", "metadata.pkl")
+# FAISS_DIR (env) points the API at another index, e.g. a benchmark corpus
+FAISS_DIR = os.getenv("FAISS_DIR", os.path.join(ROOT_DIR, "data", "faiss"))
+FAISS_PATH = os.path.join(FAISS_DIR, "index.faiss")
+VERSION_PATH = os.path.join(FAISS_DIR, "index.version")
+INDEX_CONFIG_PATH = os.path.join(FAISS_DIR, "index_config.json")
+
+# How often (seconds) a shared Retriever looks at the version marker
+RELOAD_CHECK_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "1.0"))
+LOAD_RETRIES = 20
+
+# vector (dense only) | hybrid (dense + BM25, fused with RRF)
+# | keyword (BM25 only) | auto (keyword for short keyword queries, else hybrid)
+RETRIEVAL_MODES = ("vector", "hybrid", "keyword", "auto")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RRF_K = 60
+# In hybrid mode each side fetches top_k * HYBRID_CANDIDATES hits
+HYBRID_CANDIDATES = 4
+# auto mode: queries of at most this many indexed terms skip embedding
+KEYWORD_MAX_TERMS = int(os.getenv("KEYWORD_MAX_TERMS", "2"))
+
+# Metadata filters accepted by search(): source name(s), page range
+FILTER_FIELDS = ("source", "page_min", "page_max")
+# Eligible id sets (and their FAISS selectors) kept per snapshot
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "64"))
+
+# Minimum cosine similarity of a hit for /ask (pick it with
+# backend/eval/calibrate_relevance.py). Unset: every hit is kept.
+RELEVANCE_THRESHOLD = float(os.environ["RELEVANCE_THRESHOLD"]) if os.getenv("RELEVANCE_THRESHOLD") else None
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    """Fuse ranked id lists: score(id) = sum of 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class IndexSnapshot:
+    """Index + chunk store (+ BM25) loaded from the same build. Never mutated."""
+
+    def __init__(self, index, store, version, config, bm25=None):
+        self.index = index
+        self.store = store
+        self.bm25 = bm25
+        self.version = version
+        self.config = config
+
+        self._source_rows = None
+        self._filters = OrderedDict()
+        self._filters_lock = threading.Lock()
+        self._vector_lookup = None
+        self._vector_lookup_lock = threading.Lock()
+
+    def rows_of_source(self, source: str) -> np.ndarray:
+        """Rows of one source, from a per-source row list built on first use."""
+        if self._source_rows is None:
+            codes = np.asarray(self.store.source_ids)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(self.store.sources) + 1))
+            self._source_rows = {
+                name: order[bounds[i]:bounds[i + 1]]
+                for i, name in enumerate(self.store.sources)
+            }
+        return self._source_rows.get(source, np.zeros(0, dtype="int64"))
+
+    def vectors_of(self, ids):
+        """(found ids, stored vectors) of chunk ids, from a lookup built on first use."""
+        with self._vector_lookup_lock:
+            if self._vector_lookup is None:
+                self._vector_lookup = vector_lookup(self.index)
+        return self._vector_lookup(ids)
+
+    def eligible(self, filters: dict):
+        """
+        (sorted chunk ids, FAISS selector) of the chunks matching `filters`.
+        Cached: the same document filter tends to come back query after query.
+        """
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown filter(s) {sorted(unknown)}, expected some of {FILTER_FIELDS}")
+
+        sources = filters.get("source")
+        if isinstance(sources, str):
+            sources = [sources]
+        key = (
+            tuple(sorted(set(sources))) if sources is not None else None,
+            filters.get("page_min"),
+            filters.get("page_max"),
+        )
+
+        with self._filters_lock:
+            if key in self._filters:
+                self._filters.move_to_end(key)
+                return self._filters[key]
+
+        sources, page_min, page_max = key
+        if sources is None:
+            rows = np.arange(len(self.store))
+        else:
+            rows = np.concatenate([self.rows_of_source(s) for s in sources] or [np.zeros(0, dtype="int64")])
+
+        pages = np.asarray(self.store.pages)[rows]
+        if page_min is not None:
+            rows = rows[pages >= page_min]
+            pages = pages[pages >= page_min]
+        if page_max is not None:
+            rows = rows[pages <= page_max]
+
+        ids = np.sort(np.asarray(self.store.ids)[rows])
+        entry = (ids, faiss.IDSelectorBatch(ids) if len(ids) else None)
+
+        with self._filters_lock:
+            self._filters[key] = entry
+            while len(self._filters) > FILTER_CACHE_SIZE:
+                self._filters.popitem(last=False)
+        return entry
+
+
+def load_snapshot() -> IndexSnapshot:
+    """
+    Load index and chunk store, retrying while a build is publishing
+    (version marker is VERSION_BUILDING or changes during the load).
+    """
+    for _ in range(LOAD_RETRIES):
+        version = read_index_version(VERSION_PATH)
+        if version == VERSION_BUILDING:
+            time.sleep(0.1)
+            continue
+
+        print("🔹 Loading FAISS index...")
+        index = faiss.read_index(FAISS_PATH)
+
+        # Whatever type build_faiss produced, with its nprobe / efSearch
+        config = load_index_config(INDEX_CONFIG_PATH)
+        apply_search_params(index, config)
+
+        print("🔹 Opening chunk store...")
+        store = ChunkStore(FAISS_DIR)
+        bm25 = BM25Index(FAISS_DIR) if bm25_exists(FAISS_DIR) else None
+
+        if read_index_version(VERSION_PATH) == version:
+            return IndexSnapshot(index, store, version, config, bm25)
+
+    raise RuntimeError("❌ Index kept changing while loading. Is a build stuck?")
+
 
 class Retriever:
     def __init__(self):
-        print("🔹 Loading FAISS index...")
-        self.index = faiss.read_index(FAISS_PATH)
+        self._snapshot = load_snapshot()
+        self._reload_lock = threading.Lock()
+        self._last_check = time.monotonic()
 
-        print("🔹 Loading metadata...")
-        with open(META_PATH, "rb") as f:
-            self.metadata = pickle.load(f)
+    # Kept as attributes for scripts that poke at the loaded index
+    @property
+    def index(self):
+        return self._snapshot.index
 
-    def search(self, query, top_k=5):
-        query_vec = np.array(embed_text([query])).astype("float32")
-        distances, indices = self.index.search(query_vec, top_k)
+    @property
+    def store(self):
+        return self._snapshot.store
 
-        results = []
-        for idx in indices[0]:
-            if idx < len(self.metadata):
-                results.append(self.metadata[idx])
+    @property
+    def bm25(self):
+        return self._snapshot.bm25
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """
+        Swap in a freshly built index when the version marker moved.
+        Searches already running keep the snapshot they started with.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return False
+        self._last_check = now
+
+        version = read_index_version(VERSION_PATH)
+        if version == VERSION_BUILDING or version == self._snapshot.version:
+            return False
+
+        # Only one thread reloads, the others keep serving the old snapshot
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            if read_index_version(VERSION_PATH) == self._snapshot.version:
+                return False
+            self._snapshot = load_snapshot()
+            print(f"🔄 Retriever reloaded index version {self._snapshot.version}")
+            return True
+        finally:
+            self._reload_lock.release()
 
+    def _dense_hits(self, snapshot, query_vecs, top_k, eligible=None):
+        """One FAISS search for a matrix of query vectors -> [(id, cosine score)] per query."""
+        # Filtered: FAISS only scores the eligible ids
+        params = None
+        if eligible is not None:
+            ids, selector = eligible
+            params = filtered_search_params(snapshot.config, selector, len(ids) / max(snapshot.index.ntotal, 1))
+
+        with span("faiss_search"):
+            distances, indices = snapshot.index.search(normalize_vectors(query_vecs), top_k, params=params)
+        scores = similarity_scores(distances, snapshot.config)
+        return [
+            [(int(idx), float(score)) for idx, score in zip(id_row, score_row) if idx >= 0]
+            for id_row, score_row in zip(indices, scores)
+        ]
+
+    def _scored(self, snapshot, query_vec, ids, dense_hits):
+        """
+        [(id, cosine score)] of the `ids` dense retrieval did not return
+        (keyword hits), from their stored vectors: a search restricted to
+        them may not reach them all (IVF lists not probed, HNSW graph).
+        """
+        known = {cid for cid, _ in dense_hits}
+        missing = np.unique(np.array([cid for cid in ids if cid not in known], dtype="int64"))
+        if not len(missing):
+            return []
+        found, vectors = snapshot.vectors_of(missing)
+        if not len(found):
+            return []
+        scores = np.clip(normalize_vectors(vectors) @ normalize_vectors(query_vec)[0], -1.0, 1.0)
+        return [(int(cid), float(score)) for cid, score in zip(found, scores)]
+
+    def _keyword_ids(self, snapshot, query, top_k, eligible=None):
+        with span("bm25_search"):
+            return snapshot.bm25.search(query, top_k, allowed=eligible[0] if eligible else None)[0].tolist()
+
+    def _is_keyword_query(self, snapshot, query) -> bool:
+        terms = tokenize(query)
+        return 0 < len(terms) <= KEYWORD_MAX_TERMS and all(t in snapshot.bm25.vocab for t in terms)
+
+    def _resolve_mode(self, snapshot, query, mode):
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        if snapshot.bm25 is None:
+            return "vector"
+        if mode == "auto":
+            return "keyword" if self._is_keyword_query(snapshot, query) else "hybrid"
+        return mode
+
+    @staticmethod
+    def _candidates(mode, top_k):
+        # In hybrid mode each side fetches more hits than it returns
+        return top_k * HYBRID_CANDIDATES if mode == "hybrid" else top_k
+
+    @staticmethod
+    def _combine(mode, top_k, dense_ids, keyword_ids):
+        if mode == "keyword":
+            # Nothing matched lexically: fall back to dense retrieval
+            return keyword_ids or dense_ids
+        if mode == "hybrid":
+            return reciprocal_rank_fusion([dense_ids, keyword_ids])[:top_k]
+        return dense_ids
+
+    @staticmethod
+    def _relevant(ids, scores, min_score):
+        """Hits scoring at least `min_score` (keyword hits were scored by _scored)."""
+        if min_score is None:
+            return ids
+        return [cid for cid in ids if scores.get(cid, -np.inf) >= min_score]
+
+    @staticmethod
+    def _materialize(snapshot, ids, scores):
+        # Only the top-k hits are materialized from the mmap'ed store
+        results = []
+        with span("fetch_chunks"):
+            for cid in ids:
+                meta = snapshot.store.get(int(cid))
+                if meta is not None:
+                    score = scores.get(cid)
+                    meta["score"] = None if score is None else round(score, 4)
+                    results.append(meta)
         return results
+
+    def _results(self, snapshot, mode, top_k, dense_hits, keyword_ids, min_score, keyword_scores=()):
+        scores = {**dict(keyword_scores), **dict(dense_hits)}
+        ids = self._combine(mode, top_k, [cid for cid, _ in dense_hits], keyword_ids)
+        return self._materialize(snapshot, self._relevant(ids, scores, min_score), scores)
+
+    def search(self, query, top_k=5, mode=None, filters=None, min_score=None):
+        """
+        Top-k chunks for `query`, each with its cosine similarity `score`
+        (None for keyword-only hits, unless `min_score` is set). `filters`
+        (e.g. {"source": ["report.pdf"], "page_min": 2}) restrict the search
+        itself, not its results. Hits under `min_score` are dropped: the
+        result may be empty. With a `min_score`, keyword hits are scored by
+        the dense model too, so the threshold holds in every mode (keyword
+        queries then pay for embedding the query).
+        """
+        self.reload_if_changed()
+        snapshot = self._snapshot
+
+        eligible = snapshot.eligible(filters) if filters else None
+        if eligible is not None and not len(eligible[0]):
+            return []
+
+        mode = self._resolve_mode(snapshot, query, mode)
+        candidates = self._candidates(mode, top_k)
+
+        keyword_ids = []
+        if mode in ("keyword", "hybrid"):
+            keyword_ids = self._keyword_ids(snapshot, query, candidates, eligible)
+
+        need_dense = mode != "keyword" or not keyword_ids
+        if not need_dense and min_score is None:
+            return self._results(snapshot, mode, top_k, [], keyword_ids, min_score)
+
+        with span("embed_query"):
+            query_vec = embed_query(query).reshape(1, -1)
+
+        dense_hits = self._dense_hits(snapshot, query_vec, candidates, eligible)[0] if need_dense else []
+        keyword_scores = self._scored(snapshot, query_vec, keyword_ids, dense_hits) if min_score is not None else []
+
+        return self._results(snapshot, mode, top_k, dense_hits, keyword_ids, min_score, keyword_scores)
+
+    def search_batch(self, queries, top_k=5, mode=None, filters=None, min_score=None):
+        """
+        Same as search() for many queries: all the queries that need dense
+        hits are embedded in one model call and searched as one matrix.
+        Returns one result list per query, in order.
+        """
+        queries = list(queries)
+        self.reload_if_changed()
+        snapshot = self._snapshot
+
+        eligible = snapshot.eligible(filters) if filters else None
+        if eligible is not None and not len(eligible[0]):
+            return [[] for _ in queries]
+
+        modes = [self._resolve_mode(snapshot, query, mode) for query in queries]
+
+        keyword_ids = [
+            self._keyword_ids(snapshot, query, self._candidates(m, top_k), eligible)
+            if m in ("keyword", "hybrid") else []
+            for query, m in zip(queries, modes)
+        ]
+
+        dense_hits = [[] for _ in queries]
+        keyword_scores = [[] for _ in queries]
+        need_dense = [i for i, m in enumerate(modes) if m != "keyword" or not keyword_ids[i]]
+        # Scoring keyword hits against min_score needs every query's vector
+        need_vec = range(len(queries)) if min_score is not None else need_dense
+        if need_vec:
+            with span("embed_query"):
+                query_vecs = dict(zip(need_vec, embed_queries([queries[i] for i in need_vec])))
+
+        if need_dense:
+            k = max(self._candidates(modes[i], top_k) for i in need_dense)
+            matrix = np.stack([query_vecs[i] for i in need_dense])
+            for i, hits in zip(need_dense, self._dense_hits(snapshot, matrix, k, eligible)):
+                dense_hits[i] = hits[:self._candidates(modes[i], top_k)]
+
+        if min_score is not None:
+            for i in range(len(queries)):
+                keyword_scores[i] = self._scored(snapshot, query_vecs[i], keyword_ids[i], dense_hits[i])
+
+        return [
+            self._results(snapshot, m, top_k, dense, keyword, min_score, scored)
+            for m, dense, keyword, scored in zip(modes, dense_hits, keyword_ids, keyword_scores)
+        ]
+
+
+# ---------- SHARED INSTANCE (one per worker process) ----------
+_shared_retriever = None
+_shared_lock = threading.Lock()
+
+
+def loaded_shared_retriever():
+    """The shared Retriever if it is already loaded, without loading it."""
+    return _shared_retriever
+
+
+def get_shared_retriever() -> Retriever:
+    global _shared_retriever
+    if _shared_retriever is None:
+        with _shared_lock:
+            if _shared_retriever is None:
+                _shared_retriever = Retriever()
+    return _shared_retriever
@@ -27,11 +27,22 @@ export default function Sidebar({
       const form = new FormData();
       form.append("file", file);
 
-      await api.post("/upload", form, {
+      const res = await api.post("/upload", form, {
         headers: { "Content-Type": "multipart/form-data" },
       });
 
-      setUploadMsg("✅ Document indexed successfully");
+      // Indexing runs in the background: poll the job until it finishes
+      let job = { status: "queued" };
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((r) => setTimeout(r, 1000));
+        job = (await api.get(`/upload/jobs/${res.data.job_id}`)).data;
+      }
+
+      if (job.status === "failed") {
+        setUploadMsg(`❌ Indexing failed: ${job.error}`);
+      } else {
+        setUploadMsg("✅ Document indexed successfully");
+      }
     } catch (e) {
       setUploadMsg(e.response?.data?.detail || "❌ Upload failed");
     } finally {